@@ -0,0 +1,101 @@
+"""Local stand-in for the Bol retailer API: token, invoice list and specification endpoints."""
+import os
+import re
+import json
+import base64
+import random
+from urllib.parse import urlparse, parse_qs
+from fake_server import FakeHandler, FakeServer
+
+
+class BolHandler(FakeHandler):
+    def route(self, method):
+        path = urlparse(self.path).path.rstrip("/")
+        if method == "POST" and path == "/token":
+            return self.token()
+
+        spec = re.fullmatch(r"/retailer/invoices/([^/]+)/specification", path)
+        if method == "GET" and spec:
+            return self.guarded("specification", lambda: self.specification(spec.group(1)))
+        if method == "GET" and path == "/retailer/invoices":
+            return self.guarded("invoice_list", self.invoices)
+        self.count("not_found")
+        self.send(404)
+
+    def guarded(self, endpoint, respond):
+        self.count(endpoint)
+        if not self.headers.get("Authorization", "").startswith("Bearer token-"):
+            self.count("unauthorized")
+            return self.send(401)
+        if random.random() < self.server.throttle_rate:
+            self.count("throttled")
+            return self.send(429, headers={"Retry-After": str(self.server.retry_after)})
+        respond()
+
+    def token(self):
+        self.count("token")
+        auth = self.headers.get("Authorization", "")
+        client_id = base64.b64decode(auth.removeprefix("Basic ")).decode().split(":")[0] if auth else ""
+        if client_id in self.server.rejected_clients:
+            self.count("token_rejected")
+            return self.send(401)
+        payload = {"access_token": f"token-{client_id}", "expires_in": 299, "token_type": "Bearer"}
+        self.send(200, json.dumps(payload), "application/json")
+
+    def invoices(self):
+        account = self.headers["Authorization"].removeprefix("Bearer token-")
+        query = parse_qs(urlparse(self.path).query)
+        start, _, end = query.get("period", ["/"])[0].partition("/")
+        page = int(query.get("page", ["1"])[0])
+        size = self.server.page_size
+        numbers = range((page - 1) * size + 1, min(page * size, self.server.invoices) + 1)
+        items = [
+            {"invoiceId": f"{account}-{start[:7]}-{n:03d}", "startDate": start, "endDate": end, "invoiceType": "SALES"}
+            for n in numbers
+        ]
+        self.send(200, json.dumps({"invoiceListItems": items}), "application/vnd.retailer.v10+json")
+
+    def specification(self, invoice_id):
+        payload = self.server.payload
+        headers = {"Accept-Ranges": "bytes"}
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match:
+            offset = int(match.group(1))
+            if offset >= len(payload):
+                return self.send(416, headers={"Content-Range": f"bytes */{len(payload)}"})
+            headers["Content-Range"] = f"bytes {offset}-{len(payload) - 1}/{len(payload)}"
+            self.count("specification_bytes", len(payload) - offset)
+            return self.send(206, payload[offset:], "application/vnd.ms-excel", headers)
+        self.count("specification_bytes", len(payload))
+        self.send(200, payload, "application/vnd.ms-excel", headers)
+
+
+class FakeBol(FakeServer):
+    """Every account gets `invoices` invoices of `spec_size` bytes each, listed
+    `page_size` per page; a `throttle_rate` share of API calls is answered
+    with 429 and Retry-After. Token requests of `rejected_clients` get a 401.
+    """
+
+    def __init__(
+        self, invoices=3, spec_size=200_000, latency=0.05, throttle_rate=0.0, retry_after=1, page_size=50,
+        rejected_clients=(),
+    ):
+        super().__init__(BolHandler, latency)
+        self.invoices = invoices
+        self.page_size = page_size
+        self.payload = os.urandom(spec_size)
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.rejected_clients = set(rejected_clients)
+
+    def env(self, accounts):
+        """Environment that points bol-automation.py at this server with `accounts` accounts"""
+        env = {
+            "BOL_API_BASE": f"{self.url}/retailer",
+            "BOL_TOKEN_URL": f"{self.url}/token",
+        }
+        for n in range(1, accounts + 1):
+            env[f"BOL_USERNAME_{n}"] = f"shop{n:02d}"
+            env[f"BOL_CLIENT_ID_{n}"] = f"client{n:02d}"
+            env[f"BOL_API_SECRET_{n}"] = "secret"
+        return env
@@ -0,0 +1,350 @@
+"""Local stand-in for the parts of Seller Central amazon-automation.py drives.
+
+Sign-in (email, password, OTP), the account switcher with a "TCF Trading"
+group of marketplaces, and the reports repository with `kat-select-container`
+filters and a `kat-table-row` table whose new rows only become downloadable
+after `report_delay` seconds.
+"""
+import os
+import json
+import time
+import uuid
+import html
+import hashlib
+import threading
+import pyotp
+from urllib.parse import urlparse, parse_qs, quote, unquote
+from fake_server import FakeHandler, FakeServer
+
+MERCHANT_ID = "amzn1.merchant.d.FAKETCFTRADING"
+
+MARKETPLACES = [
+    "Belgium", "Netherlands", "Germany", "France", "Italy", "Spain", "Sweden", "Poland",
+    "United Kingdom", "Ireland", "Turkey", "Egypt", "Saudi Arabia", "United Arab Emirates",
+    "India", "Japan", "Australia", "Singapore", "Canada", "Mexico", "Brazil", "United States",
+]
+
+PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+  @font-face {{ font-family: "Ember"; src: url("/fonts/ember.woff2") format("woff2"); }}
+  body {{ font-family: "Ember", sans-serif; }}
+  .options {{ display: none; }}
+  .kat-select-container {{ display: inline-block; margin: 4px; }}
+  kat-button {{ display: inline-block; padding: 2px 6px; border: 1px solid #888; cursor: pointer; }}
+  kat-table, kat-table-row {{ display: block; }}
+  kat-table-cell {{ display: inline-block; min-width: 120px; }}
+</style></head>
+<body>{assets}{body}</body></html>"""
+
+# What the real pages load besides the document: product images, a web font
+# and analytics beacons, so the request blocking policy has something to block
+ASSET_BYTES = {"images": 15_000, "fonts": 40_000, "uedata": 500}
+ASSET_TYPES = {"images": "image/jpeg", "fonts": "font/woff2", "uedata": "application/javascript"}
+
+SIGN_IN_STEP = """<form method="post" action="{action}">
+  <input name="{field}" type="{type}">
+  <input id="{submit}" type="submit" value="Continue">
+</form>"""
+
+SWITCHER_JS = """
+function pick(button) {
+  document.querySelectorAll(".full-page-account-switcher-account > button")
+    .forEach(b => b.classList.remove("selected"));
+  button.classList.add("selected");
+  document.querySelector("#select-account").disabled = false;
+}
+function toggleGroup(label) {
+  const accounts = label.closest(".full-page-account-switcher-account-group")
+    .querySelector(".full-page-account-switcher-accounts");
+  accounts.hidden = !accounts.hidden;
+}
+function selectAccount() {
+  const chosen = document.querySelector(".full-page-account-switcher-account > button.selected");
+  location.href = "/account-switcher/select?marketplace=" + encodeURIComponent(chosen.dataset.marketplace);
+}
+"""
+
+REPORTS_JS = """
+function toggle(header) {
+  const options = header.parentElement.querySelector(".options");
+  options.style.display = options.style.display === "block" ? "none" : "block";
+}
+function choose(option) {
+  const container = option.closest(".kat-select-container");
+  container.querySelector(".select-header").textContent = option.textContent;
+  container.dataset.value = option.textContent.trim();
+  option.closest(".options").style.display = "none";
+}
+function row(report) {
+  const element = document.createElement("kat-table-row");
+  element.dataset.reportId = report.reportId;
+  element.innerHTML =
+    `<kat-table-cell class="header-cell-report-type">${report.type}</kat-table-cell>` +
+    `<kat-table-cell class="header-cell-requested">${report.requestedAt}</kat-table-cell>` +
+    `<kat-table-cell class="header-cell-month">${report.month}</kat-table-cell>` +
+    `<kat-table-cell class="header-cell-report-id">${report.reportId}</kat-table-cell>` +
+    `<kat-table-cell class="header-cell-report-action"><kat-button label="${report.label}" onclick="act(this)">${report.label}</kat-button></kat-table-cell>`;
+  return element;
+}
+async function requestReport() {
+  const [typeSelect, monthSelect] = document.querySelectorAll(".kat-select-container");
+  const type = typeSelect.dataset.value || "Summary";
+  const month = monthSelect.dataset.value || monthSelect.querySelector(".select-header").textContent.trim();
+  const monthly = document.querySelector("#katal-id-9").checked;
+  const response = await fetch("/payments/api/report-request", {
+    method: "POST",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify({type, month, monthly}),
+  });
+  const report = await response.json();
+  document.querySelector("kat-table").prepend(row(report));
+}
+async function act(button) {
+  const id = button.closest("kat-table-row").dataset.reportId;
+  if (button.getAttribute("label") === "Download CSV") {
+    location.href = "/payments/download?id=" + encodeURIComponent(id);
+    return;
+  }
+  const response = await fetch("/payments/api/report-status?id=" + encodeURIComponent(id));
+  const report = await response.json();
+  button.setAttribute("label", report.label);
+  button.textContent = report.label;
+}
+"""
+
+
+def marketplace_id(name):
+    """Stable fake marketplace id in Amazon's format ("A" + uppercase alphanumerics)"""
+    return "A" + hashlib.sha1(name.encode()).hexdigest()[:12].upper()
+
+
+def account_header(marketplace):
+    return f'<span class="dropdown-account-switcher-header-label">TCF Trading | {html.escape(marketplace)}</span>'
+
+
+def recent_months(count):
+    """Month labels ("September 2025") from last month backwards, as the month filter lists them"""
+    year, month = time.localtime().tm_year, time.localtime().tm_mon
+    labels = []
+    for _ in range(count):
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+        labels.append(time.strftime("%B %Y", (year, month, 1, 0, 0, 0, 0, 1, -1)))
+    return labels
+
+
+class SellerCentralHandler(FakeHandler):
+    def route(self, method):
+        url = urlparse(self.path)
+        path = url.path.rstrip("/") or "/"
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if path.split("/")[1] in ASSET_BYTES:
+            kind = path.split("/")[1]
+            self.count(f"asset_{kind}")
+            headers = {"Cache-Control": "max-age=3600"}
+            return self.send(200, os.urandom(ASSET_BYTES[kind]), ASSET_TYPES[kind], headers)
+        if path.startswith("/ap/"):
+            self.count("sign_in")
+            return self.sign_in(path)
+        if not self.server.is_signed_in(self.cookies().get("session")):
+            self.count("bounced_to_sign_in")
+            return self.redirect("/ap/signin")
+
+        marketplace = unquote(self.cookies().get("marketplace", "")) or self.server.marketplaces[1]
+        # Deep link with merchant/marketplace ids: switch and serve the page in one go
+        headers = []
+        if "mons_sel_mkid" in query:
+            self.count("direct_switch")
+            chosen = self.server.by_marketplace_id.get(query["mons_sel_mkid"])
+            if chosen and query.get("mons_sel_dir_mcid") == MERCHANT_ID:
+                marketplace = chosen
+                headers = [f"marketplace={quote(chosen)}; Path=/"]
+        if path == "/account-switcher/default/merchantMarketplace":
+            self.count("account_switcher")
+            return self.page("Account switcher", self.switcher(marketplace), SWITCHER_JS)
+        if path == "/account-switcher/select":
+            self.count("select_account")
+            chosen = query.get("marketplace", marketplace)
+            return self.redirect("/home", [f"marketplace={quote(chosen)}; Path=/"])
+        if path == "/home":
+            self.count("home")
+            return self.page("Home", account_header(marketplace) + f"<h1>{html.escape(marketplace)}</h1>", cookies=headers)
+        if path == "/payments/reports-repository":
+            self.count("reports_page")
+            return self.page("Reports repository", self.reports(marketplace), REPORTS_JS, cookies=headers)
+        if method == "POST" and path == "/payments/api/report-request":
+            self.count("report_request")
+            request = json.loads(self.body() or b"{}")
+            return self.json(self.server.request_report(marketplace, request.get("type", "Summary"), request.get("month", "")))
+        if path == "/payments/api/report-status":
+            self.count("report_status")
+            report_id = query.get("id")
+            return self.json(self.server.report_state(report_id) or {"reportId": report_id, "status": "NOT_FOUND"})
+        if path == "/payments/download":
+            self.count("report_download")
+            return self.download(query.get("id"))
+        self.count("not_found")
+        self.send(404)
+
+    def sign_in(self, path):
+        steps = {
+            "/ap/signin": ("/ap/signin/password", "email", "email", "continue"),
+            "/ap/signin/password": ("/ap/signin/mfa", "password", "password", "signInSubmit"),
+            "/ap/signin/mfa": ("/ap/signin/done", "otpCode", "text", "auth-signin-button"),
+        }
+        if path in steps:
+            action, field, kind, submit = steps[path]
+            form = SIGN_IN_STEP.format(action=action, field=field, type=kind, submit=submit)
+            return self.page("Amazon Sign-In", form)
+        if path == "/ap/signin/done":
+            session = self.server.new_session()
+            return self.redirect("/home", [f"session={session}; Path=/; HttpOnly"])
+        self.send(404)
+
+    def switcher(self, current):
+        accounts = "".join(
+            f'<div class="full-page-account-switcher-account">'
+            f'<button data-marketplace="{html.escape(name)}" data-merchant-id="{MERCHANT_ID}" '
+            f'data-marketplace-id="{marketplace_id(name)}" onclick="pick(this)">'
+            f'<span class="full-page-account-switcher-account-label">'
+            f'{html.escape(name)}{" (current)" if name == current else ""}</span></button></div>'
+            for name in self.server.marketplaces
+        )
+        return (
+            '<div class="full-page-account-switcher-account-group">'
+            '<div class="group-header"><button onclick="toggleGroup(this)">'
+            '<span class="full-page-account-switcher-account-label">TCF Trading</span>'
+            '</button></div>'
+            f'<div class="full-page-account-switcher-accounts">{accounts}</div>'
+            '</div>'
+            '<button id="select-account" class="kat-button--primary" disabled onclick="selectAccount()">Select account</button>'
+        )
+
+    def reports(self, marketplace):
+        options = "".join(
+            f'<div class="standard-option-name" onclick="choose(this)">{name}</div>'
+            for name in ("Summary", "Transaction", "Date Range")
+        )
+        months = recent_months(24)
+        month_options = "".join(
+            f'<div class="standard-option-name" onclick="choose(this)">{month}</div>' for month in months
+        )
+        rows = "".join(
+            f'<kat-table-row data-report-id="{report["reportId"]}">'
+            f'<kat-table-cell class="header-cell-report-type">{report["type"]}</kat-table-cell>'
+            f'<kat-table-cell class="header-cell-requested">{report["requestedAt"]}</kat-table-cell>'
+            f'<kat-table-cell class="header-cell-month">{report["month"]}</kat-table-cell>'
+            f'<kat-table-cell class="header-cell-report-id">{report["reportId"]}</kat-table-cell>'
+            f'<kat-table-cell class="header-cell-report-action"><kat-button label="{report["label"]}" '
+            f'onclick="act(this)">{report["label"]}</kat-button></kat-table-cell></kat-table-row>'
+            for report in self.server.reports_for(marketplace)
+        )
+        return (
+            f'{account_header(marketplace)}<h1>{html.escape(marketplace)}</h1>'
+            f'<div class="kat-select-container"><div class="select-header" onclick="toggle(this)">Summary</div>'
+            f'<div class="options">{options}</div></div>'
+            f'<div class="kat-select-container"><div class="select-header" onclick="toggle(this)">{months[0]}</div>'
+            f'<div class="options">{month_options}</div></div>'
+            '<label><input type="radio" name="period" id="katal-id-8" checked> Daily</label>'
+            '<label><input type="radio" name="period" id="katal-id-9"> Monthly</label>'
+            '<button onclick="requestReport()"><span>Request Report</span></button>'
+            f'<kat-table>{rows}</kat-table>'
+        )
+
+    def download(self, report_id):
+        report = self.server.report_state(report_id)
+        if report.get("label") != "Download CSV":
+            return self.send(404)
+        self.count("report_bytes", len(self.server.payload))
+        filename = f"{report['reportId']}.csv"
+        self.send(200, self.server.payload, "text/csv", {"Content-Disposition": f'attachment; filename="{filename}"'})
+
+    def page(self, title, body, script="", cookies=()):
+        assets = "".join(f'<img src="/images/I/{n}.jpg" width="1" height="1">' for n in range(self.server.images))
+        if self.server.images:
+            assets += '<script src="/uedata/ue.js" async></script>'
+        content = PAGE.format(title=title, assets=assets, body=body + (f"<script>{script}</script>" if script else ""))
+        self.send(200, content, "text/html; charset=utf-8", {"Set-Cookie": list(cookies)})
+
+    def json(self, payload):
+        self.send(200, json.dumps(payload), "application/json")
+
+
+class FakeSellerCentral(FakeServer):
+    """`marketplaces` accounts under TCF Trading; each starts with one old,
+    ready transaction report so the script has to find the new row. Every
+    page also loads `images` images, a web font and an analytics script.
+    """
+
+    def __init__(self, marketplaces=20, report_delay=10.0, report_size=500_000, latency=0.02, images=8):
+        super().__init__(SellerCentralHandler, latency)
+        self.images = images
+        names = MARKETPLACES[:marketplaces]
+        names += [f"Marketplace {n:02d}" for n in range(len(names) + 1, marketplaces + 1)]
+        self.marketplaces = names
+        self.by_marketplace_id = {marketplace_id(name): name for name in names}
+        self.report_delay = report_delay
+        self.payload = b"date,type,amount\n" + os.urandom(report_size // 2).hex().encode()[:report_size]
+        self.sessions = set()
+        self.reports = {}
+        self.state_lock = threading.Lock()
+        for name in self.marketplaces:
+            self._add_report(name, "Transaction", recent_months(1)[0], ready_at=0, requested_at="2020-01-01 00:00")
+
+    def new_session(self):
+        session = uuid.uuid4().hex
+        with self.state_lock:
+            self.sessions.add(session)
+        return session
+
+    def is_signed_in(self, session):
+        return session in self.sessions
+
+    def _add_report(self, marketplace, report_type, month, ready_at, requested_at):
+        report_id = f"{len(self.reports) + 1:08d}"
+        self.reports[report_id] = {
+            "reportId": report_id,
+            "marketplace": marketplace,
+            "type": report_type,
+            "month": month,
+            "requestedAt": requested_at,
+            "ready_at": ready_at,
+        }
+        return report_id
+
+    def request_report(self, marketplace, report_type, month):
+        with self.state_lock:
+            report_id = self._add_report(
+                marketplace, report_type, month,
+                ready_at=time.time() + self.report_delay,
+                requested_at=time.strftime("%Y-%m-%d %H:%M:%S"),
+            )
+        return self.report_state(report_id)
+
+    def report_state(self, report_id):
+        report = self.reports.get(report_id)
+        if not report:
+            return {}
+        label = "Download CSV" if time.time() >= report["ready_at"] else "Refresh"
+        return {key: value for key, value in report.items() if key != "ready_at"} | {"label": label}
+
+    def reports_for(self, marketplace):
+        with self.state_lock:
+            ids = [id for id, report in self.reports.items() if report["marketplace"] == marketplace]
+        return [self.report_state(id) for id in reversed(ids)]
+
+    def env(self):
+        """Environment that points amazon-automation.py at this server"""
+        return {
+            "AMAZON_SELLER_CENTRAL_URL": self.url,
+            "AMAZON_SELLER_EMAIL": "benchmark@example.com",
+            "AMAZON_SELLER_PASSWORD": "benchmark",
+            "AMAZON_SELLER_TOTP_SECRET": pyotp.random_base32(),
+            "AMAZON_REPORT_REQUEST_PATH": "/payments/api/report-request",
+            "AMAZON_REPORT_STATUS_PATH": "/payments/api/report-status",
+            "AMAZON_REPORT_DOWNLOAD_PATH": "/payments/download",
+            # This fake's own formats; Seller Central's have to be copied from its XHRs
+            "AMAZON_REPORT_REQUEST_BODY": '{"type": "Transaction", "month": "{month}", "monthly": true}',
+            "AMAZON_REPORT_ID_PARAM": "id",
+        }
@@ -0,0 +1,87 @@
+import time
+import threading
+from collections import Counter
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """Keep-alive request handler that counts requests and adds latency.
+
+    Subclasses implement `route(method)`; the server object carries the
+    configuration and the shared counters.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def handle_request(self, method):
+        # Always consume the body so the next request on the connection starts clean
+        length = int(self.headers.get("Content-Length") or 0)
+        self.request_body = self.rfile.read(length) if length else b""
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.route(method)
+
+    def count(self, endpoint, amount=1):
+        with self.server.lock:
+            self.server.requests[endpoint] += amount
+
+    def body(self):
+        return self.request_body
+
+    def cookies(self):
+        return {key: morsel.value for key, morsel in SimpleCookie(self.headers.get("Cookie", "")).items()}
+
+    def send(self, status, body=b"", content_type="text/plain", headers=None):
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            if isinstance(value, list):
+                for item in value:
+                    self.send_header(name, item)
+            else:
+                self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def redirect(self, location, cookies=()):
+        self.send(302, headers={"Location": location, "Set-Cookie": list(cookies)})
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, handler, latency=0.0):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
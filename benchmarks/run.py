@@ -0,0 +1,202 @@
+"""Offline benchmarks: run the automations against local stand-ins and measure them.
+
+    python benchmarks/run.py bol --accounts 50 --invoices 4 --throttle-rate 0.05
+    python benchmarks/run.py amazon --marketplaces 20 --report-delay 10
+    python benchmarks/run.py blocking --marketplaces 5 --report-delay 2
+    python benchmarks/run.py all --json results.jsonl
+
+Each automation runs as a subprocess in a scratch directory, so the real
+downloads/, .cache/ and credentials are never touched. Reported per run: wall
+time, peak RSS of the whole process tree (browser included), requests per
+endpoint as seen by the fake server, files downloaded, and the slowest spans
+from the run metrics. `blocking` runs the Amazon benchmark with request
+blocking off and then on, and prints the wall time the blocking saved.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+AUTOMATION_DIR = ROOT / "browser-automation"
+sys.path.insert(0, str(AUTOMATION_DIR))
+
+from fake_bol import FakeBol  # noqa: E402
+from fake_seller_central import FakeSellerCentral  # noqa: E402
+import metrics  # noqa: E402
+from resource_policy import DEFAULT_CATEGORIES  # noqa: E402
+
+SAMPLE_INTERVAL = 0.2
+
+
+def tree_rss(pid):
+    """Resident memory in bytes of `pid` and all its descendants (Linux /proc)"""
+    children = {}
+    rss = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+            fields = stat[stat.rindex(")") + 2:].split()
+            children.setdefault(int(fields[1]), []).append(int(entry.name))
+            rss[int(entry.name)] = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            continue
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += rss.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total
+
+
+def run_script(script, env, workdir, timeout):
+    """Run an automation script; returns exit code, wall time and peak tree RSS"""
+    started = time.perf_counter()
+    log = open(workdir / "output.log", "w")
+    process = subprocess.Popen(
+        [sys.executable, str(script)], cwd=workdir, env={**os.environ, **env},
+        stdout=log, stderr=subprocess.STDOUT,
+    )
+    peak = 0
+    try:
+        while process.poll() is None:
+            if time.perf_counter() - started > timeout:
+                process.kill()
+                break
+            if sys.platform.startswith("linux"):
+                peak = max(peak, tree_rss(process.pid))
+            time.sleep(SAMPLE_INTERVAL)
+        process.wait()
+    finally:
+        log.close()
+    if not peak:
+        import resource
+        # ru_maxrss is in kB on Linux; only covers the python process itself
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    return process.returncode, time.perf_counter() - started, peak
+
+
+def span_summary(workdir, top=5):
+    files = list((workdir / "metrics").glob("*.jsonl"))
+    if not files:
+        return {}
+    stats = metrics.aggregate(metrics.load(files[0]))
+    rows = sorted(stats.items(), key=lambda item: item[1]["total"], reverse=True)[:top]
+    return {name: {"count": s["count"], "total": round(s["total"], 2), "retries": s["retries"]} for name, s in rows}
+
+
+def benchmark(name, server, env, script, args):
+    with tempfile.TemporaryDirectory(prefix=f"bench_{name}_") as tmp:
+        workdir = Path(tmp)
+        env = {**env, "METRICS_DIR": str(workdir / "metrics"), "METRICS_RUN_ID": name}
+        server.start()
+        try:
+            code, duration, peak = run_script(script, env, workdir, args.timeout)
+        finally:
+            server.stop()
+        downloads = [path for path in (workdir / "downloads").rglob("*") if path.is_file()]
+        result = {
+            "benchmark": name,
+            "exit_code": code,
+            "seconds": round(duration, 2),
+            "peak_rss_mb": round(peak / 1_000_000, 1),
+            "files": len([f for f in downloads if not f.name.endswith((".part", ".meta.json"))]),
+            "requests": dict(server.requests),
+            "spans": span_summary(workdir),
+        }
+        if code != 0 or args.keep_log:
+            result["log_tail"] = (workdir / "output.log").read_text(errors="replace").splitlines()[-20:]
+        return result
+
+
+def bench_bol(args):
+    server = FakeBol(
+        invoices=args.invoices, spec_size=args.spec_size, latency=args.latency,
+        throttle_rate=args.throttle_rate, retry_after=args.retry_after, page_size=args.page_size,
+    )
+    result = benchmark("bol", server, server.env(args.accounts), AUTOMATION_DIR / "bol-automation.py", args)
+    result["expected_files"] = args.accounts * args.invoices
+    return result
+
+
+def bench_amazon(args, block=None):
+    server = FakeSellerCentral(
+        marketplaces=args.marketplaces, report_delay=args.report_delay,
+        report_size=args.report_size, latency=args.latency, images=args.images,
+    )
+    env = server.env()
+    name = "amazon"
+    if block is not None:
+        env["AMAZON_BLOCK"] = block
+        name = f"amazon AMAZON_BLOCK={block}"
+    result = benchmark(name, server, env, AUTOMATION_DIR / "amazon-automation.py", args)
+    result["expected_files"] = args.marketplaces
+    return result
+
+
+def bench_blocking(args):
+    """The Amazon benchmark without and with request blocking"""
+    return [bench_amazon(args, "none"), bench_amazon(args, args.block)]
+
+
+def print_result(result):
+    status = "ok" if result["exit_code"] == 0 else f"exit {result['exit_code']}"
+    print(
+        f"🏁 {result['benchmark']}: {result['seconds']:.1f}s, peak RSS {result['peak_rss_mb']:.0f} MB, "
+        f"{result['files']}/{result['expected_files']} files, {status}"
+    )
+    for endpoint, count in sorted(result["requests"].items()):
+        print(f"   {endpoint}: {count}")
+    for span, stats in result["spans"].items():
+        print(f"   ⏱️ {span}: {stats['total']}s over {stats['count']} ({stats['retries']} retries)")
+    for line in result.get("log_tail", []):
+        print(f"   | {line}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the automations against local fakes")
+    parser.add_argument("target", choices=["bol", "amazon", "blocking", "all"])
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--invoices", type=int, default=3, help="invoices per Bol account")
+    parser.add_argument("--page-size", type=int, default=50, help="invoices per Bol listing page")
+    parser.add_argument("--spec-size", type=int, default=200_000, help="bytes per specification")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of Bol API calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--marketplaces", type=int, default=20)
+    parser.add_argument("--report-delay", type=float, default=10.0, help="seconds until a requested report is ready")
+    parser.add_argument("--report-size", type=int, default=500_000, help="bytes per Amazon CSV")
+    parser.add_argument("--images", type=int, default=8, help="images on every fake Seller Central page")
+    parser.add_argument("--block", default=DEFAULT_CATEGORIES, help="AMAZON_BLOCK for the blocking run")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every fake response")
+    parser.add_argument("--timeout", type=float, default=1800)
+    parser.add_argument("--json", help="append results as JSON lines to this file")
+    parser.add_argument("--keep-log", action="store_true", help="show the script's last output lines")
+    args = parser.parse_args(argv)
+
+    benches = {"bol": bench_bol, "amazon": bench_amazon, "blocking": bench_blocking}
+    targets = ["bol", "amazon"] if args.target == "all" else [args.target]
+    failed = False
+    for target in targets:
+        results = benches[target](args)
+        results = results if isinstance(results, list) else [results]
+        for result in results:
+            result["params"] = vars(args)
+            print_result(result)
+            failed |= result["exit_code"] != 0 or result["files"] < result["expected_files"]
+            if args.json:
+                with open(args.json, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(result) + "\n")
+        if target == "blocking":
+            off, on = (result["seconds"] for result in results)
+            print(f"⚖️ Request blocking: {off:.1f}s without, {on:.1f}s with ({off - on:+.1f}s saved)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,354 +1,1276 @@
 import asyncio
-from playwright.async_api import async_playwright, TimeoutError
-import os, pyotp
+from playwright.async_api import async_playwright, Error as PlaywrightError, TimeoutError
+import os, re, json, pyotp
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
 from dotenv import load_dotenv
 from pathlib import Path
-from datetime import datetime
+from manifest import Manifest, last_month_period
+from secure_store import open_encrypted
+from resource_policy import ResourcePolicy
+from resource_governor import ResourceGovernor
+from waits import Waits
+from debug_capture import DebugRecorder
+import dom_extract
+from checkpoint import Checkpoint, SWITCHED, REQUESTED, READY, DOWNLOADED
+import amazon_http
+from amazon_http import find_report_id, REPORT_SPECIFIC_KEYS
+from sources import Source, WorkUnit, BROWSER, HTTP, run_standalone
+import metrics
 
 load_dotenv()
 EMAIL = os.getenv("AMAZON_SELLER_EMAIL")
 PASSWORD = os.getenv("AMAZON_SELLER_PASSWORD")
 TOTP_SECRET = os.getenv("AMAZON_SELLER_TOTP_SECRET")
-URL = "https://sellercentral.amazon.com.be/payments/reports-repository"
+# Overridable so the benchmarks can point the script at a local stand-in
+SELLER_CENTRAL_URL = os.getenv("AMAZON_SELLER_CENTRAL_URL", "https://sellercentral.amazon.com.be").rstrip("/")
+URL = f"{SELLER_CENTRAL_URL}/payments/reports-repository"
+ACCOUNT_SWITCHER_URL = f"{SELLER_CENTRAL_URL}/account-switcher/default/merchantMarketplace"
+SOURCE = "amazon"
+REPORT_ID = "transaction-monthly"
+
+# Report readiness: hard deadline, refresh backoff bounds, and how long to wait
+# for a new table row before accepting a ready report that names the requested month
+REPORT_TIMEOUT = int(os.getenv("AMAZON_REPORT_TIMEOUT", 1200))
+REFRESH_INTERVAL_MIN = 3
+REFRESH_INTERVAL_MAX = 30
+NEW_ROW_GRACE = 60
+# Path of the "Request Report" XHR when AMAZON_REPORT_REQUEST_PATH is not configured
+REPORT_REQUEST_PATH = re.compile(os.getenv("AMAZON_REPORT_REQUEST_PATTERN", r"report[-_]?request"), re.I)
+
+# "queue": one work unit per country and period, spread over the scheduler's browser contexts.
+# "harvest": request every country first, then download in completion order, on one page.
+MODE = os.getenv("AMAZON_MODE", "queue").lower()
+
+# Use the browser only to log in and select the marketplace; request, poll and
+# download reports over HTTP with its cookies, falling back to the UI when that fails.
+HTTP_MODE = os.getenv("AMAZON_HTTP_MODE", "").lower() in ("1", "true", "yes")
+
+# Encrypted storage_state reused across runs so we only log in when it has expired
+SESSION_KEY = os.getenv("AMAZON_SESSION_KEY")
+SESSION_PATH = Path(os.getenv("AMAZON_SESSION_PATH", ".cache/amazon_session.bin"))
+
+# Switch marketplaces by opening the reports page with the country's merchant and
+# marketplace ids in the URL, instead of clicking through the account switcher.
+# The ids are read from the switcher once and cached (set the path empty to keep them in memory only).
+DIRECT_SWITCH = os.getenv("AMAZON_DIRECT_SWITCH", "1").lower() not in ("0", "false", "no")
+MARKETPLACE_IDS_PATH = os.getenv("AMAZON_MARKETPLACE_IDS_PATH", ".cache/amazon_marketplaces.json")
+# Header showing the selected account ("TCF Trading | Germany"); used to verify a direct switch
+ACCOUNT_HEADER = os.getenv("AMAZON_ACCOUNT_HEADER_SELECTOR", ".dropdown-account-switcher-header-label")
+DIRECT_SWITCH_CHECK_TIMEOUT = 5000  # ms
+# How long the switcher's confirm button gets to start and load its navigation
+SWITCH_CONFIRM_TIMEOUT = 10000  # ms
+
+# Progress per country and month (switched, requested, ready, downloaded), so a rerun
+# resumes a requested report instead of requesting it again
+CHECKPOINT_PATH = Path(os.getenv("AMAZON_CHECKPOINT_PATH", ".cache/amazon_checkpoint.json"))
+# Attempts per country and month; every retry runs in a fresh browser context
+COUNTRY_ATTEMPTS = int(os.getenv("AMAZON_COUNTRY_ATTEMPTS", 3))
+# Older requested reports are requested again rather than waited for
+RESUME_MAX_AGE = 24 * 3600
+
+# Blocks images, fonts, trackers… in every context (AMAZON_BLOCK / AMAZON_BLOCK_URLS)
+resource_policy = ResourcePolicy.from_env()
+
+# Replaces a browser context after AMAZON_RECYCLE_AFTER units or when memory passes
+# AMAZON_MAX_RSS_MB / AMAZON_MAX_JS_HEAP_MB; peak memory is printed at the end of the run
+governor = ResourceGovernor.from_env()
+
+# Every wait is named and timed; the slowest are printed at the end of the run
+waits = Waits()
+
+# Step snapshots kept in memory; written as one zip only when something fails (AMAZON_DEBUG)
+debug = DebugRecorder("amazon")
+
+TUTORIAL_SELECTOR = ".react-joyride__tooltip"
+SWITCHER_READY = ".full-page-account-switcher-account-label"
+REPORTS_READY = ".kat-select-container"
+ACCOUNT_LABEL = ".full-page-account-switcher-account-label"
+DROPDOWNS = ".kat-select-container"
+DROPDOWN_OPTION = ".standard-option-name"
+
+
+async def close_tutorial(page):
+    if await page.is_visible('button[data-action="skip"]'):
+        await page.click('button[data-action="skip"]')
+    elif await page.is_visible('button[data-action="close"]'):
+        await page.click('button[data-action="close"]')
+    else:
+        await page.keyboard.press("Escape")
+    await page.locator(TUTORIAL_SELECTOR).first.wait_for(state="hidden", timeout=5000)
+    print("✅ Tutorial dismissed.")
 
 
 async def dismiss_tutorial(page):
-    try:
-        tutorial_selector = '.react-joyride__tooltip'
-        await page.wait_for_selector(tutorial_selector, timeout=2000)
-        if await page.is_visible('button[data-action="skip"]'):
-            await page.click('button[data-action="skip"]')
-        elif await page.is_visible('button[data-action="close"]'):
-            await page.click('button[data-action="close"]')
-        else:
-            await page.keyboard.press("Escape")
-        print("✅ Tutorial dismissed.")
-        await asyncio.sleep(1)
-    except TimeoutError:
-        print("ℹ️ No tutorial popup detected.")
+    """Close the tutorial if it is showing right now; later ones are caught by the page's handler"""
+    if await page.locator(TUTORIAL_SELECTOR).first.is_visible():
+        await close_tutorial(page)
 
 
+async def new_page(context):
+    """New page that dismisses the tutorial overlay whenever it blocks an action"""
+    page = await context.new_page()
+    await page.add_locator_handler(
+        page.locator(TUTORIAL_SELECTOR).first, lambda: close_tutorial(page)
+    )
+    return page
+
+
+@metrics.instrument("amazon.select_belgium")
 async def select_belgium(page):
     print("🇧🇪 Selecting Belgium account…")
-    await page.goto("https://sellercentral.amazon.com.be/account-switcher/default/merchantMarketplace")
-    await page.wait_for_selector(".full-page-account-switcher-accounts", timeout=5000)
+    await debug.step(page, "belgium: start")
+    buttons, countries = await open_account_switcher(page)
 
-    tcf_button = page.locator(".full-page-account-switcher-account-label", has_text="TCF Trading").first
-    await tcf_button.wait_for()
-    await tcf_button.click()
-    await asyncio.sleep(1)
-
-    countries = await get_country_buttons(page, tcf_button)
-
-    for btn in countries:
-        name = (await btn.locator(".full-page-account-switcher-account-label").inner_text()).strip()
-        if name == "Belgium":
-            print(f"✅ Found Belgium: {name}")
-            await btn.click()
-            # Find and click the confirm button by exact text
-            found = False
-            buttons = await page.locator('button').all()
-            for btn_elem in buttons:
-                try:
-                    text = (await btn_elem.inner_text()).strip()
-                except Exception:
-                    text = ""
-                if text == "Select account":
-                    print(f"✅ Found confirm button: '{text}'")
-                    await btn_elem.click()
-                    found = True
-                    break
-            if not found:
-                print("❌ Could not find the confirm button by text. Printing all button texts for debugging:")
-                for idx, btn_elem in enumerate(buttons):
-                    try:
-                        text = await btn_elem.inner_text()
-                    except Exception:
-                        text = "<error>"
-                    class_name = await btn_elem.get_attribute('class')
-                    print(f"Button {idx}: '{text}' | class='{class_name}'")
-                await page.screenshot(path="debug_confirm_button_not_found.png", full_page=True)
-                print("📷 Screenshot saved as debug_confirm_button_not_found.png")
-                raise Exception("Could not find the confirm button by text")
-            await page.wait_for_load_state("networkidle")
-            print(f"🎉 Belgium selected: {name}")
-            return
-    raise Exception("❌ Could not find Belgium account.")
+    belgium = dom_extract.find(countries, "Belgium")
+    if not belgium:
+        raise Exception("❌ Could not find Belgium account.")
+    name = belgium["label"]
+    print(f"✅ Found Belgium: {name}")
+    await buttons.nth(belgium["index"]).click()
+
+    # Find and click the confirm button by exact text; all button texts are read in one call
+    page_buttons = page.locator("button")
+    found = await dom_extract.items(page_buttons)
+    confirm = dom_extract.find(found, "Select account")
+    if not confirm:
+        print("❌ Could not find the confirm button by text. Printing all button texts for debugging:")
+        for button in found:
+            print(f"Button {button['index']}: '{button['label']}' | class='{button['className']}'")
+        error = Exception("Could not find the confirm button by text")
+        await debug.failure(page, "belgium: confirm button", error)
+        raise error
+    print(f"✅ Found confirm button: '{confirm['label']}'")
+    await page_buttons.nth(confirm["index"]).click()
+    await waits.url("belgium: leave switcher", page, lambda url: "account-switcher" not in url)
+    print(f"🎉 Belgium selected: {name}")
 
 
-async def get_country_buttons(page, tcf_button):
+def country_buttons(tcf_button):
     tcf_container = tcf_button.locator("xpath=../../..")
     inner_accounts = tcf_container.locator(".full-page-account-switcher-accounts")
-    buttons = await inner_accounts.locator(".full-page-account-switcher-account > button").all()
-    return buttons
+    return inner_accounts.locator(".full-page-account-switcher-account > button")
 
 
-async def set_filters_and_request(page):
-    print("🎛 Setting filters…")
-    dropdowns = page.locator(".kat-select-container")
-    count = await dropdowns.count()
+async def choose_option(dropdowns, label, contains=False):
+    """Open the dropdown that offers `label` and click that option; False if none offers it.
 
-    for i in range(count):
-        dropdown = dropdowns.nth(i)
+    The options of every dropdown are read in one call instead of one by one.
+    Dropdowns that only render their options once opened are then opened in
+    turn, as before that batched read existed.
+    """
+    found = await dom_extract.options(dropdowns, DROPDOWN_OPTION)
+    match = dom_extract.find_option(found, label, contains)
+    if match is not None:
+        dropdown_index, option = match
+        dropdown = dropdowns.nth(dropdown_index)
+        await dropdown.locator(".select-header").click()
+        await click_option(dropdown, option)
+        return True
+
+    seen = [option for dropdown in found for option in dropdown["options"]]
+    for dropdown_index in range(len(found)):
+        dropdown = dropdowns.nth(dropdown_index)
         header = dropdown.locator(".select-header")
         await header.click()
-        options = dropdown.locator(".standard-option-name")
-        for j in range(await options.count()):
-            option = options.nth(j)
-            if (await option.inner_text()).strip().lower() == "transaction":
-                await option.click()
-                print("✅ Selected 'Transaction'.")
-                break
-        else:
+        try:
+            await waits.locator("filters: dropdown options", dropdown.locator(DROPDOWN_OPTION).first, timeout=3000)
+        except TimeoutError:
             await header.click()
             continue
-        break
+        opened = await dom_extract.options(dropdown, DROPDOWN_OPTION)
+        match = dom_extract.find_option(opened, label, contains)
+        if match is not None:
+            print(f"ℹ️ '{label}' only showed up after opening dropdown {dropdown_index + 1}.")
+            await click_option(dropdown, match[1])
+            return True
+        seen += opened[0]["options"] if opened else []
+        await header.click()
+
+    print(f"⚠️ No dropdown offers '{label}' ({len(found)} dropdowns, options: {', '.join(seen) or 'none'}).")
+    return False
+
+
+async def click_option(dropdown, option):
+    """Click the option labelled exactly `option` in an open dropdown"""
+    exact = re.compile(rf"^\s*{re.escape(option)}\s*$")
+    await dropdown.locator(DROPDOWN_OPTION, has_text=exact).first.click()
+
+
+@metrics.instrument("amazon.set_filters_and_request")
+async def set_filters_and_request(page, period=None):
+    print("🎛 Setting filters…")
+    if await choose_option(page.locator(DROPDOWNS), "Transaction"):
+        print("✅ Selected 'Transaction'.")
 
     monthly_radio = page.locator("input#katal-id-9")
-    await monthly_radio.wait_for(state="visible")
-    if not await monthly_radio.is_checked():
-        await page.evaluate("(el) => el.click()", await monthly_radio.element_handle())
+    await waits.locator("filters: monthly radio", monthly_radio)
+    # Check and click in one call
+    if await monthly_radio.evaluate("(el) => el.checked ? false : (el.click(), true)"):
         print("✅ Selected 'Monthly'.")
     else:
         print("ℹ️ 'Monthly' already selected.")
 
-    request_button = page.locator("button span", has_text="Request Report")
-    await request_button.first.click()
-    print("📄 Clicked 'Request Report'.")
+    if period and not await select_month(page, period):
+        # Amazon's default month is last month, so only a backfill needs the selector
+        if period != last_month_period():
+            raise Exception(f"❌ No month option for {period} in the report filters.")
+        print("ℹ️ No month selector found, using the default month.")
+
+    # Remember what the table looked like so the new row can be told apart,
+    # and try to read the report id from the request's XHR response.
+    baseline = await page.evaluate(ROW_SIGNATURES_JS)
+    report_id = await click_request_report(page)
+    print(f"📄 Clicked 'Request Report'{f' (report {report_id})' if report_id else ''}.")
+    return {
+        "report_id": report_id,
+        "period": period,
+        "baseline": baseline,
+        "requested_at": asyncio.get_running_loop().time(),
+    }
+
+
+async def click_request_report(page):
+    """Click "Request Report" and return the report id its XHR answered with, or None.
+
+    A failed click raises: the report was never requested. Only a missing
+    or unreadable XHR response leaves the id unknown.
+    """
+    clicked = False
+
+    async def click():
+        nonlocal clicked
+        await page.locator("button span", has_text="Request Report").first.click()
+        clicked = True
+
+    try:
+        response = await waits.response(
+            "filters: request report", page, is_report_request_response, click, timeout=10000,
+        )
+    except TimeoutError as e:
+        if not clicked:
+            raise
+        print(f"ℹ️ No report request XHR seen after the click: {e}")
+        return None
+    try:
+        # Only keys that name a report: a generic "id" could belong to anything
+        return find_report_id(await response.json(), REPORT_SPECIFIC_KEYS)
+    except (ValueError, PlaywrightError) as e:
+        print(f"ℹ️ Could not read report id from request response: {e}")
+        return None
+
+
+async def select_month(page, period):
+    """Pick `period` (e.g. "September 2025") in the month dropdown; False if no dropdown offers it"""
+    label = datetime.strptime(period, "%Y-%m").strftime("%B %Y")
+    if not await choose_option(page.locator(DROPDOWNS), label, contains=True):
+        return False
+    print(f"✅ Selected '{label}'.")
+    return True
+
+
+def is_report_request_response(response):
+    """The XHR that "Request Report" sends; the page posts other report-related calls too"""
+    if response.request.method != "POST":
+        return False
+    path = urlsplit(response.url).path
+    if amazon_http.REQUEST_PATH:
+        return path.rstrip("/") == amazon_http.REQUEST_PATH.rstrip("/")
+    return bool(REPORT_REQUEST_PATH.search(path))
+
+
+# A row's identity without its action cell, whose label changes as the report progresses
+ROW_SIGNATURES_JS = """
+() => [...document.querySelectorAll("kat-table-row")].map(row => {
+    const clone = row.cloneNode(true);
+    clone.querySelectorAll(".header-cell-report-action").forEach(cell => cell.remove());
+    return clone.textContent.replace(/\\s+/g, " ").trim();
+})
+"""
+
+# Builds `findRow({reportId, baseline, month, fallback})`, which returns our
+# transaction row as {index, label, signature}, or null. A row that names months
+# ("July 2025", "Jul 1, 2025 - Jul 31, 2025", a requested-at date) is for the
+# earliest of them, and only matches if that is `month` ("YYYY-MM"). Without
+# `baseline` only `reportId` matches; `fallback` also accepts any row for `month`.
+REPORT_ROW_FINDER_JS = """
+(() => {
+    const signature = row => {
+        const clone = row.cloneNode(true);
+        clone.querySelectorAll(".header-cell-report-action").forEach(cell => cell.remove());
+        return clone.textContent.replace(/\\s+/g, " ").trim();
+    };
+    const MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"];
+    const monthsOf = text => new Set([
+        ...text.matchAll(/\\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\\.?\\s+(?:\\d{1,2},?\\s+)?(\\d{4})\\b/gi),
+    ].map(m => `${m[2]}-${String(MONTHS.indexOf(m[1].toLowerCase()) + 1).padStart(2, "0")}`));
+    // A report is requested after its month ends, so a later date is the request's
+    const periodOf = row => [...monthsOf(signature(row))].sort()[0];
+    // Words of the row's text and attribute values, so an id only matches whole
+    const words = row => {
+        const parts = [row.textContent];
+        for (const element of [row, ...row.querySelectorAll("*")]) {
+            for (const attribute of element.attributes) parts.push(attribute.value);
+        }
+        return new Set(parts.join(" ").split(/[^\\w.-]+/));
+    };
+    return ({reportId, baseline, month, fallback}) => {
+        const candidates = [];
+        document.querySelectorAll("kat-table-row").forEach((row, index) => {
+            const type = (row.querySelector(".header-cell-report-type")?.textContent || "").trim().toLowerCase();
+            const button = row.querySelector(".header-cell-report-action kat-button");
+            if (type !== "transaction" || !button) return;
+            const period = periodOf(row);
+            // A row for another month is never ours, whatever else matches
+            if (month && period && period !== month) return;
+            candidates.push({row, index, button});
+        });
+        const result = ({row, index, button}) => ({
+            index,
+            label: (button.getAttribute("label") || "").trim().toLowerCase(),
+            signature: signature(row),
+        });
+        if (reportId) {
+            const byId = candidates.filter(({row}) => words(row).has(reportId));
+            if (byId.length === 1) return result(byId[0]);
+            // Id not in the markup (or on several rows): tell the new row apart instead
+        }
+        const fresh = baseline && candidates.find(({row}) => !baseline.includes(signature(row)));
+        if (fresh) return result(fresh);
+        // Never just the top row: it has to say it is for the requested month
+        const sameMonth = fallback && month && candidates.find(({row}) => periodOf(row) === month);
+        return sameMonth ? result(sameMonth) : null;
+    };
+})()
+"""
 
+# Resolves as soon as our row shows "Download CSV" (watched with a
+# MutationObserver), or after `timeout` ms with the row's current state.
+REPORT_READY_JS = """
+({reportId, baseline, month, fallback, timeout}) => new Promise(resolve => {
+    const findRow = """ + REPORT_ROW_FINDER_JS + """;
+    const find = () => findRow({reportId, baseline, month, fallback});
+    let observer = null;
+    let timer = null;
+    const done = match => {
+        if (observer) observer.disconnect();
+        clearTimeout(timer);
+        resolve(match);
+    };
+    const check = () => {
+        const match = find();
+        if (match && match.label === "download csv") done(match);
+    };
+    timer = setTimeout(() => done(find()), timeout);
+    observer = new MutationObserver(check);
+    observer.observe(document.body, {
+        subtree: true, childList: true, characterData: true,
+        attributes: true, attributeFilter: ["label"],
+    });
+    check();
+})
+"""
 
-async def wait_for_report_and_download(page, country):
+# The current row of every report in `reports`, without waiting. A row taken
+# as one report's new row is not also taken as another's.
+REPORT_ROWS_JS = """
+reports => {
+    const findRow = """ + REPORT_ROW_FINDER_JS + """;
+    const taken = [];
+    return reports.map(report => {
+        const baseline = report.baseline && [...report.baseline, ...taken];
+        const match = findRow({...report, baseline});
+        if (match) taken.push(match.signature);
+        return match;
+    });
+}
+"""
+
+
+async def find_report_row(page, report, wait_seconds, fallback=False):
+    """Wait up to `wait_seconds` for the requested row to become downloadable.
+
+    Returns {"index", "label", "signature"} for the row as it is at that point,
+    or None if the row is not in the table yet. With `fallback`, once
+    NEW_ROW_GRACE has passed without a new row, a row that names the requested
+    month is accepted as well (Amazon may hand back an existing report instead
+    of adding a row).
+    """
+    requested_at = report.get("requested_at")
+    late = fallback and requested_at and asyncio.get_running_loop().time() - requested_at > NEW_ROW_GRACE
+    return await page.evaluate(REPORT_READY_JS, {
+        "reportId": report.get("report_id"),
+        "baseline": report.get("baseline"),
+        "month": report.get("period"),
+        "fallback": bool(late),
+        "timeout": int(wait_seconds * 1000),
+    })
+
+
+async def read_report_rows(page, reports):
+    """The current row of each report in `reports` (None if not in the table), read in one call"""
+    return await page.evaluate(REPORT_ROWS_JS, [
+        {"reportId": report.get("report_id"), "baseline": report.get("baseline"),
+         "month": report.get("period"), "fallback": False}
+        for report in reports
+    ])
+
+
+async def download_report_row(page, index, country, period=None):
+    action_button = page.locator("kat-table-row").nth(index).locator(
+        ".header-cell-report-action kat-button"
+    ).first
+    print("📥 Downloading…")
+    async with page.expect_download() as download_info:
+        await action_button.click()
+    download = await download_info.value
+    folder = Path("downloads") / (period or last_month_period())
+    folder.mkdir(parents=True, exist_ok=True)
+    save_as = folder / f"Amazon - {country} - {download.suggested_filename}"
+    await download.save_as(save_as)
+    print(f"✅ Downloaded: {save_as}")
+    return save_as
+
+
+async def check_report(page, country, report, wait_seconds, on_ready=None, fallback=False):
+    """One readiness check: download if ready, click "Refresh" if offered, else return None"""
+    match = await find_report_row(page, report, wait_seconds, fallback)
+    return await handle_report_row(page, country, report, match, on_ready)
+
+
+async def handle_report_row(page, country, report, match, on_ready=None):
+    """Download the report's row `match` if it is ready, click "Refresh" if offered, else return None"""
+    if not match:
+        return None
+    if match["label"] == "download csv":
+        if on_ready:
+            on_ready()
+        # Lets the caller keep this row from matching another period's request
+        report["row"] = match["signature"]
+        return await download_report_row(page, match["index"], country, report.get("period"))
+    if match["label"] == "refresh":
+        print(f"🔄 Refreshing {country}…")
+        await page.locator("kat-table-row").nth(match["index"]).locator(
+            ".header-cell-report-action kat-button"
+        ).first.click()
+    return None
+
+
+@metrics.instrument("amazon.wait_for_report_and_download")
+async def wait_for_report_and_download(page, country, report=None, on_ready=None):
+    """Wait until the requested report can be downloaded, then save it to downloads/.
+
+    `report` is what set_filters_and_request returned. The row is matched by
+    report id when the request response exposed one and exactly one row
+    carries it, otherwise as the new transaction row compared to the table
+    before the request. If no new row appears within NEW_ROW_GRACE seconds,
+    a ready row that names the requested month is taken. Between waits the
+    row's "Refresh" action is clicked with a bounded backoff, and the whole
+    wait gives up after REPORT_TIMEOUT seconds.
+    """
     print(f"📊 Waiting for report for {country}…")
-    await page.locator("kat-table").wait_for()
+    metrics.current().set(country=country, checks=0)
+    await waits.selector("reports: table", page, "kat-table")
+
+    report = report or {}
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + REPORT_TIMEOUT
+    interval = REFRESH_INTERVAL_MIN
 
     while True:
-        rows = page.locator("kat-table-row")
-        if await rows.count() == 0:
-            await asyncio.sleep(3)
-            continue
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise TimeoutError(f"Report for {country} not ready after {REPORT_TIMEOUT}s")
 
-        for i in range(await rows.count()):
-            row = rows.nth(i)
-            report_type = (await row.locator(".header-cell-report-type").inner_text()).strip()
-            if report_type.lower() != "transaction":
-                continue
+        async with waits.timed("reports: ready check"):
+            save_as = await check_report(page, country, report, min(interval, remaining), on_ready, fallback=True)
+        metrics.current().attrs["checks"] += 1
+        if save_as:
+            print(f"⏱️ Report for {country} ready after {loop.time() - started:.0f}s")
+            metrics.add_bytes(save_as.stat().st_size)
+            return save_as
 
-            action_button = row.locator(".header-cell-report-action kat-button")
-            if await action_button.count() == 0:
-                continue
+        interval = min(interval * 2, REFRESH_INTERVAL_MAX)
 
-            label = (await action_button.first.get_attribute("label")).strip()
-            if label.lower() == "download csv":
-                print("📥 Downloading…")
-                async with page.expect_download() as download_info:
-                    await action_button.first.click()
-                download = await download_info.value
-                Path("downloads").mkdir(exist_ok=True)
-                save_as = Path("downloads") / f"Amazon - {country} - {download.suggested_filename}"
-                await download.save_as(save_as)
-                print(f"✅ Downloaded: {save_as}")
-                return
-            elif label.lower() == "refresh":
-                print("🔄 Refreshing…")
-                await action_button.first.click()
-                await asyncio.sleep(3)
-                break
-        else:
-            await asyncio.sleep(3)
 
+def country_key(country):
+    """Account switcher label without the "(current)" marker"""
+    return country.removesuffix("(current)").strip()
 
-async def main():
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(
-            headless=True  # 👈 headless!
-        )
-        # Set Accept-Language to English
-        context = await browser.new_context(locale="en-US", extra_http_headers={"Accept-Language": "en-US,en;q=0.9"})
-        page = await context.new_page()
+
+async def new_context(browser, storage_state=None):
+    # Set Accept-Language to English
+    context = await browser.new_context(
+        locale="en-US",
+        extra_http_headers={"Accept-Language": "en-US,en;q=0.9"},
+        storage_state=storage_state,
+    )
+    await resource_policy.install(context)
+    await debug.start_tracing(context)
+    return context
+
+
+@metrics.instrument("amazon.login")
+async def login(page):
+    await waits.goto("login: sign-in page", page, URL, 'input[name="email"]')
+    print("✅ Navigated to Amazon Seller Central")
+    
+    await debug.step(page, "login: 01 initial page")
+
+    # === LOGIN ===
+    print("🔐 Starting login process...")
+    
+    try:
+        await page.fill('input[name="email"]', EMAIL)
+        print("✅ Email filled")
+        await debug.step(page, "login: 02 after email")
+        
+        await page.click('input#continue')
+        print("✅ Continue button clicked")
+        await waits.selector("login: password field", page, 'input[name="password"]')
+        await debug.step(page, "login: 03 after continue")
         
+        await page.fill('input[name="password"]', PASSWORD)
+        print("✅ Password filled")
+        await debug.step(page, "login: 04 after password")
+        
+        await page.click('input#signInSubmit')
+        print("✅ Sign in button clicked")
+        await waits.selector("login: otp field", page, 'input[name="otpCode"]')
+        await debug.step(page, "login: 05 after signin")
+        
+        await page.fill('input[name="otpCode"]', pyotp.TOTP(TOTP_SECRET).now())
+        print("✅ TOTP code filled")
+        await debug.step(page, "login: 06 after totp")
+        
+        await page.click('input#auth-signin-button')
+        print("✅ TOTP submit button clicked")
+        # Signed in once we leave the /ap/ authentication pages
+        await waits.url("login: leave sign-in", page, lambda url: "/ap/" not in url)
+        await debug.step(page, "login: 07 after totp submit")
+        
+        print("✅ Logged in successfully")
+        
+    except Exception as login_error:
+        print(f"❌ Login failed: {login_error}")
+        await debug.failure(page, "login", login_error)
+        raise login_error
+
+
+def session_store():
+    return open_encrypted(SESSION_PATH, SESSION_KEY, "AMAZON_SESSION_KEY")
+
+
+async def session_is_valid(context):
+    """Cheap check: does the reports page answer without bouncing us to the sign-in page?"""
+    try:
+        response = await context.request.get(URL, max_redirects=0, timeout=15000)
+    except Exception as e:
+        print(f"⚠️ Session check failed: {e}")
+        return False
+    location = response.headers.get("location", "")
+    return response.ok and "signin" not in response.url and "signin" not in location
+
+
+async def start_session(browser):
+    """Return a logged-in (context, page), reusing the saved session when it is still valid"""
+    store = session_store()
+    storage_state = store.load() if store else None
+
+    if storage_state:
+        context = await new_context(browser, storage_state)
+        if await session_is_valid(context):
+            print("♻️ Reusing saved Amazon session, skipping login.")
+            return context, await new_page(context)
+        print("ℹ️ Saved Amazon session expired, logging in again.")
+        await debug.stop_tracing(context, "expired_session")
+        await context.close()
+
+    context = await new_context(browser)
+    page = await new_page(context)
+    await login(page)
+    await save_session(context)
+    return context, page
+
+
+async def save_session(context):
+    store = session_store()
+    if store:
+        store.save(await context.storage_state())
+        print(f"💾 Session saved: {SESSION_PATH}")
+
+
+async def open_account_switcher(page):
+    """Go to the account switcher and make sure TCF Trading's countries are expanded.
+
+    Returns the country buttons locator and one item per button (index, label,
+    state), all read in a single call.
+    """
+    await waits.goto("switcher: open", page, ACCOUNT_SWITCHER_URL, SWITCHER_READY)
+
+    tcf_button = page.locator(".full-page-account-switcher-account-label", has_text="TCF Trading").first
+    await waits.locator("switcher: TCF Trading", tcf_button)
+
+    buttons = country_buttons(tcf_button)
+    for _ in range(3):
+        countries = await dom_extract.items(buttons, ACCOUNT_LABEL)
+        if countries:
+            if marketplace_ids.missing(country["label"] for country in countries):
+                await marketplace_ids.harvest(buttons)
+            return buttons, countries
+        print("⚠️ No countries found — expanding TCF Trading.")
+        await tcf_button.click()
         try:
-            await page.goto(URL)
-            print("✅ Navigated to Amazon Seller Central")
-            
-            # Take screenshot of initial page
-            await page.screenshot(path="debug_01_initial_page.png", full_page=True)
-            print("📷 Screenshot saved: debug_01_initial_page.png")
-
-            # === LOGIN ===
-            print("🔐 Starting login process...")
-            
+            await waits.locator("switcher: expand TCF Trading", country_buttons(tcf_button).first, timeout=5000)
+        except TimeoutError:
+            pass
+    raise Exception("❌ TCF Trading did not expand to show its countries.")
+
+
+# Every attribute (and href) of each country button, its descendants and its account wrapper
+COUNTRY_ATTRIBUTES_JS = """
+(buttons) => buttons.map(button => {
+    const elements = [button, ...button.querySelectorAll("*")];
+    const wrapper = button.closest(".full-page-account-switcher-account");
+    if (wrapper) elements.push(wrapper);
+    const attributes = [];
+    for (const element of elements) {
+        for (const attribute of element.attributes) attributes.push([attribute.name, attribute.value]);
+    }
+    const label = button.querySelector(".full-page-account-switcher-account-label");
+    return {label: ((label && label.innerText) || "").trim(), attributes};
+})
+"""
+
+MERCHANT_ID = re.compile(r"amzn1\.merchant\.[\w.]+|^A[0-9A-Z]{8,}$")
+MARKETPLACE_ID = re.compile(r"^A[0-9A-Z]{5,}$")
+PARTNER_ID = re.compile(r"amzn1\.pa\.[\w.]+")
+QUERY_IDS = {"mons_sel_dir_mcid": "merchant_id", "mons_sel_mkid": "marketplace_id", "mons_sel_dir_paid": "partner_id"}
+
+
+def parse_marketplace_ids(attributes):
+    """{"merchant_id", "marketplace_id"[, "partner_id"]} from a button's attributes, or None"""
+    ids = {}
+    for name, value in attributes:
+        name = name.lower()
+        # Deep links such as ...?mons_sel_dir_mcid=…&mons_sel_mkid=…
+        for key, field in QUERY_IDS.items():
+            match = re.search(rf"[?&]{key}=([^&#]+)", value)
+            if match:
+                ids.setdefault(field, match.group(1))
+        if ("merchant" in name or "mcid" in name) and MERCHANT_ID.search(value):
+            ids.setdefault("merchant_id", MERCHANT_ID.search(value).group(0))
+        elif ("marketplace" in name or "mkid" in name) and MARKETPLACE_ID.match(value):
+            ids.setdefault("marketplace_id", value)
+        elif PARTNER_ID.search(value):
+            ids.setdefault("partner_id", PARTNER_ID.search(value).group(0))
+    if "merchant_id" in ids and "marketplace_id" in ids:
+        return ids
+    return None
+
+
+class MarketplaceIds:
+    """Country -> merchant/marketplace ids, kept in memory and in MARKETPLACE_IDS_PATH"""
+
+    def __init__(self, path=MARKETPLACE_IDS_PATH):
+        self.path = Path(path) if path else None
+        self.ids = {}
+        if self.path and self.path.exists():
             try:
-                await page.fill('input[name="email"]', EMAIL)
-                print("✅ Email filled")
-                await page.screenshot(path="debug_02_after_email.png", full_page=True)
-                print("📷 Screenshot saved: debug_02_after_email.png")
-                
-                await page.click('input#continue')
-                print("✅ Continue button clicked")
-                await page.wait_for_load_state("networkidle")
-                await page.screenshot(path="debug_03_after_continue.png", full_page=True)
-                print("📷 Screenshot saved: debug_03_after_continue.png")
-                
-                await page.fill('input[name="password"]', PASSWORD)
-                print("✅ Password filled")
-                await page.screenshot(path="debug_04_after_password.png", full_page=True)
-                print("📷 Screenshot saved: debug_04_after_password.png")
-                
-                await page.click('input#signInSubmit')
-                print("✅ Sign in button clicked")
-                await page.wait_for_load_state("networkidle")
-                await page.screenshot(path="debug_05_after_signin.png", full_page=True)
-                print("📷 Screenshot saved: debug_05_after_signin.png")
-                
-                await page.fill('input[name="otpCode"]', pyotp.TOTP(TOTP_SECRET).now())
-                print("✅ TOTP code filled")
-                await page.screenshot(path="debug_06_after_totp.png", full_page=True)
-                print("📷 Screenshot saved: debug_06_after_totp.png")
-                
-                await page.click('input#auth-signin-button')
-                print("✅ TOTP submit button clicked")
-                await page.wait_for_load_state("networkidle")
-                await page.screenshot(path="debug_07_after_totp_submit.png", full_page=True)
-                print("📷 Screenshot saved: debug_07_after_totp_submit.png")
-                
-                print("✅ Logged in successfully")
-                
-            except Exception as login_error:
-                print(f"❌ Login failed: {login_error}")
-                await page.screenshot(path="debug_login_failed.png", full_page=True)
-                print("📷 Screenshot saved: debug_login_failed.png")
-                
-                # Try to get page content for debugging
+                self.ids = json.loads(self.path.read_text())
+            except ValueError:
+                print(f"⚠️ Ignoring unreadable marketplace id cache {self.path}")
+        # Set when a direct switch could not be verified; the switcher UI is used from then on
+        self.disabled = not DIRECT_SWITCH
+        # Countries whose direct switch failed this run: neither used nor harvested again
+        self.failed = set()
+
+    def get(self, country):
+        if self.disabled or country_key(country) in self.failed:
+            return None
+        return self.ids.get(country_key(country))
+
+    def missing(self, labels):
+        return any(key not in self.ids and key not in self.failed for key in map(country_key, labels))
+
+    async def harvest(self, buttons):
+        """Read the ids of every country button in one call and store those found"""
+        found = 0
+        for entry in await buttons.evaluate_all(COUNTRY_ATTRIBUTES_JS):
+            ids = parse_marketplace_ids(entry["attributes"])
+            if entry["label"] and ids and country_key(entry["label"]) not in self.failed:
+                self.ids[country_key(entry["label"])] = ids
+                found += 1
+        if found:
+            print(f"🗺️ Cached marketplace ids for {found} countries.")
+            self.save()
+
+    def forget(self, country):
+        """Drop the ids of `country` and switch to it through the UI for the rest of the run"""
+        self.failed.add(country_key(country))
+        self.ids.pop(country_key(country), None)
+        self.save()
+
+    def save(self):
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(self.ids, indent=2, sort_keys=True))
+
+
+marketplace_ids = MarketplaceIds()
+
+
+async def list_countries(page):
+    _, countries = await open_account_switcher(page)
+    return [country["label"] for country in countries]
+
+
+@metrics.instrument("amazon.switch_to_country")
+async def switch_to_country(page, country):
+    """Select `country` (a switcher label, with or without "(current)") under TCF Trading"""
+    metrics.current().set(country=country_key(country))
+    buttons, countries = await open_account_switcher(page)
+    match = dom_extract.find(countries, country, key=lambda label: country_key(label).lower())
+    if not match:
+        raise Exception(f"❌ Could not find country {country} in the account switcher.")
+
+    await buttons.nth(match["index"]).click()
+    current = match["label"].endswith("(current)")
+    if not current:
+        select_button = page.locator("button", has_text="Select account")
+        state = await dom_extract.items(select_button)
+        if state and not state[0]["disabled"]:
+            await select_button.first.click()
+            await waits.url("switch: leave switcher", page, lambda url: "account-switcher" not in url)
+    primary_button = page.locator('button.kat-button--primary')
+    state = await dom_extract.items(primary_button)
+    if state and state[0]["visible"] and not state[0]["disabled"]:
+        # Confirms the switch; it is only done once the navigation it starts has loaded
+        try:
+            await waits.navigation("switch: confirm", page, primary_button.first.click, timeout=SWITCH_CONFIRM_TIMEOUT)
+        except TimeoutError:
+            print(f"ℹ️ Confirming {country_key(country)} did not navigate.")
+    if not current and "account-switcher" in page.url:
+        raise Exception(f"❌ Switch to {country_key(country)} did not leave the account switcher.")
+
+
+@metrics.instrument("amazon.switch_directly")
+async def switch_directly(page, country):
+    """Open the reports page already switched to `country` through its cached ids.
+
+    Returns False, and forgets the ids, when there are none or the page does
+    not show `country` as the selected account afterwards.
+    """
+    ids = marketplace_ids.get(country)
+    if not ids:
+        return False
+    metrics.current().set(country=country_key(country))
+    query = {key: ids[field] for key, field in QUERY_IDS.items() if ids.get(field)}
+    try:
+        await waits.goto("switch: direct", page, f"{URL}?{urlencode(query)}", REPORTS_READY)
+        header = await page.locator(ACCOUNT_HEADER).first.inner_text(timeout=DIRECT_SWITCH_CHECK_TIMEOUT)
+    except Exception as e:
+        header = ""
+        print(f"⚠️ Direct switch to {country_key(country)} failed: {e}")
+    if country_key(country).lower() in header.lower():
+        return True
+
+    print(f"⚠️ Could not verify the direct switch to {country_key(country)}; using the account switcher.")
+    marketplace_ids.forget(country)
+    if not header:
+        # No account header at all: direct switching does not work here, stop trying for this run
+        marketplace_ids.disabled = True
+    return False
+
+
+async def open_reports_for(page, country):
+    """Switch to `country` and open its reports repository"""
+    if await switch_directly(page, country):
+        await dismiss_tutorial(page)
+        await debug.step(page, f"reports (direct): {country_key(country)}")
+        return
+
+    await switch_to_country(page, country)
+    await debug.step(page, f"switched: {country_key(country)}")
+
+    await waits.goto("reports: open", page, URL, REPORTS_READY)
+    await dismiss_tutorial(page)
+    await debug.step(page, f"reports: {country_key(country)}")
+
+
+@metrics.instrument("amazon.process_country")
+async def process_country(page, country, period, checkpoint):
+    """Switch to `country`, request its monthly transaction report for `period` and download it.
+
+    Each step is saved to `checkpoint`. A report requested by an earlier
+    attempt or run is waited for again instead of being requested anew, as
+    long as its row is still in the table.
+    """
+    key = country_key(country)
+    metrics.current().set(country=key, period=period)
+    await open_reports_for(page, country)
+
+    report = None
+    report_id = checkpoint.resumable_report(key, period, RESUME_MAX_AGE)
+    if report_id:
+        report = {"report_id": report_id, "period": period}
+        if await find_report_row(page, report, 0):
+            print(f"⏯️ Resuming {period} report {report_id} for {key}")
+            metrics.current().set(resumed=True)
+        else:
+            report = None
+    if report is None:
+        checkpoint.advance(key, period, SWITCHED)
+        report = await set_filters_and_request(page, period)
+        checkpoint.advance(key, period, REQUESTED, report_id=report["report_id"])
+    await debug.step(page, f"requested: {key}", report_id=report["report_id"])
+    return await wait_for_report_and_download(
+        page, key, report, on_ready=lambda: checkpoint.advance(key, period, READY),
+    )
+
+
+def by_country(work):
+    """Group (country, period) work items by country, keeping their order"""
+    grouped = {}
+    for country, period in work:
+        grouped.setdefault(country, []).append(period)
+    return grouped
+
+
+async def request_then_harvest(page, work, manifest, checkpoint, govern=None, replace_page=None):
+    """Two-phase run on a single page.
+
+    Phase one submits the report request for every (country, period) and
+    remembers which report each request created; all periods of a country are
+    requested after a single account switch. Phase two visits the countries
+    round-robin, reads the state of all of a country's reports in one go and
+    downloads whichever are ready, so Amazon generates all of them at the
+    same time instead of one after another. Each report fails on its own
+    after REPORT_TIMEOUT seconds, and the passes are spaced with a backoff
+    from REFRESH_INTERVAL_MIN to REFRESH_INTERVAL_MAX seconds. Reports a
+    previous run already requested (see `checkpoint`) are not requested again.
+    `govern(page)` is awaited after every country visit and returns the page
+    to continue on, so a long run can move to a fresh browser context.
+
+    A failed request or check is tried up to COUNTRY_ATTEMPTS times per
+    report. After each failure `replace_page(page)` is awaited for a page in
+    a fresh context, so whatever broke the old page does not carry over.
+    """
+    loop = asyncio.get_running_loop()
+    requested = {}
+    resumed = set()
+    for country, periods in by_country(work).items():
+        opened = False
+        for period in periods:
+            key = country_key(country)
+            report_id = checkpoint.resumable_report(key, period, RESUME_MAX_AGE)
+            if report_id:
+                print(f"⏯️ Resuming {period} report {report_id} for {country}")
+                requested[country, period] = {"report_id": report_id, "period": period, "requested_at": loop.time()}
+                resumed.add((country, period))
+                continue
+            for attempt in range(1, COUNTRY_ATTEMPTS + 1):
+                retry = f" (attempt {attempt}/{COUNTRY_ATTEMPTS})" if attempt > 1 else ""
                 try:
-                    page_content = await page.content()
-                    with open("debug_login_page.html", "w", encoding="utf-8") as f:
-                        f.write(page_content)
-                    print("📄 Page HTML saved: debug_login_page.html")
+                    print(f"📝 Requesting {period} report for {country}{retry}")
+                    if not opened:
+                        await open_reports_for(page, country)
+                        checkpoint.advance(key, period, SWITCHED)
+                        opened = True
+                    else:
+                        await waits.goto("reports: open", page, URL, REPORTS_READY)
+                    requested[country, period] = await set_filters_and_request(page, period)
+                    checkpoint.advance(key, period, REQUESTED, report_id=requested[country, period]["report_id"])
+                    break
                 except Exception as e:
-                    print(f"⚠️ Could not save page HTML: {e}")
-                
-                raise login_error
+                    print(f"❌ Failed to request {period} report for {country}{retry}: {e}")
+                    checkpoint.failed(key, period, e)
+                    await debug.failure(page, f"request: {key} {period} attempt {attempt}", e)
+                    if attempt == COUNTRY_ATTEMPTS:
+                        manifest.mark_failed(SOURCE, key, period, REPORT_ID, e)
+                    elif replace_page:
+                        page = await replace_page(page)
+                        opened = False
+        if opened and govern:
+            page = await govern(page)
+
+    errors = {item: 0 for item in requested}
+
+    async def harvest_failed(page, items, e):
+        """Count a failed visit against `items`; returns the page to continue on"""
+        for country, period in items:
+            checkpoint.failed(country_key(country), period, e)
+            errors[country, period] += 1
+            print(f"⚠️ Harvest check {errors[country, period]}/{COUNTRY_ATTEMPTS} failed for {country} {period}: {e}")
+            if errors[country, period] >= COUNTRY_ATTEMPTS:
+                manifest.mark_failed(SOURCE, country_key(country), period, REPORT_ID, e)
+                del requested[country, period]
+        attempt = max(errors[item] for item in items)
+        periods = " ".join(period for _, period in items)
+        await debug.failure(page, f"harvest: {country_key(items[0][0])} {periods} attempt {attempt}", e)
+        return await replace_page(page) if replace_page else page
+
+    interval = REFRESH_INTERVAL_MIN
+    while requested:
+        # Every report gets REPORT_TIMEOUT from its own request
+        for (country, period), report in list(requested.items()):
+            if loop.time() - report["requested_at"] > REPORT_TIMEOUT:
+                print(f"❌ Report for {country} {period} not ready after {REPORT_TIMEOUT}s")
+                manifest.mark_failed(SOURCE, country_key(country), period, REPORT_ID, "report not ready before deadline")
+                del requested[country, period]
+
+        for country, periods in by_country(list(requested)).items():
+            key = country_key(country)
+            items = [(country, period) for period in periods]
+            try:
+                # One account switch and one read of the table cover all periods of a country
+                await open_reports_for(page, country)
+                await waits.selector("reports: table", page, "kat-table")
+                async with waits.timed("reports: ready check"):
+                    rows = await read_report_rows(page, [requested[item] for item in items])
+            except Exception as e:
+                page = await harvest_failed(page, items, e)
+                continue
+
+            gone = []
+            item = None
+            try:
+                for item, row in zip(items, rows):
+                    period = item[1]
+                    if item in resumed:
+                        if not row:
+                            gone.append(item)
+                            continue
+                        resumed.discard(item)
+                    save_as = await handle_report_row(
+                        page, key, requested[item], row, lambda: checkpoint.advance(key, period, READY),
+                    )
+                    if save_as:
+                        manifest.record(SOURCE, key, period, REPORT_ID, save_as)
+                        checkpoint.advance(key, period, DOWNLOADED, path=str(save_as))
+                        print(f"✅ Completed processing for {country} {period}")
+                        claimed = requested.pop(item)["row"]
+                        # The same row must not also be taken as another period's new report
+                        for other in periods:
+                            # Resumed reports have no baseline: they only match by id
+                            if requested.get((country, other), {}).get("baseline") is not None:
+                                requested[country, other]["baseline"].append(claimed)
+                # Requested last: a new row shifts the rows read above
+                for index, item in enumerate(gone):
+                    period = item[1]
+                    print(f"🔁 Earlier {period} report for {country} is gone; requesting it again")
+                    if index:
+                        await waits.goto("reports: open", page, URL, REPORTS_READY)
+                    requested[item] = await set_filters_and_request(page, period)
+                    resumed.discard(item)
+                    checkpoint.advance(key, period, REQUESTED, report_id=requested[item]["report_id"])
+            except Exception as e:
+                # The rows read above belong to the old page; the rest waits for the next pass
+                page = await harvest_failed(page, [item], e)
+                continue
+            if govern:
+                page = await govern(page)
+
+        if requested:
+            # Give Amazon time to generate before visiting the countries again
+            next_deadline = min(report["requested_at"] for report in requested.values()) + REPORT_TIMEOUT
+            await asyncio.sleep(max(0, min(interval, next_deadline - loop.time())))
+            interval = min(interval * 2, REFRESH_INTERVAL_MAX)
+
+
+class AmazonSource(Source):
+    """Seller Central transaction reports; one work unit per country and period.
+
+    Logs in once; each unit runs on a page taken from a pool. The pool starts
+    with the login page and grows with contexts cloned from its storage_state,
+    up to the scheduler's MAX_BROWSER_CONTEXTS. The governor has a context
+    replaced by a fresh clone once it has served enough units or grown too big.
+    """
+    name = SOURCE
+    kind = BROWSER
+
+    def __init__(self):
+        self.scheduler = None
+        self.http = None
+        # Set once the HTTP endpoints turn out not to work; later units go through the UI
+        self.http_disabled = False
+        self.manifest = None
+        self.checkpoint = Checkpoint(CHECKPOINT_PATH)
+        self.playwright = self.browser = self.context = self.page = None
+        self.storage_state = None
+        self.idle_pages = []
+        self.worker_contexts = []
+        self.countries = []
+
+    async def open(self, scheduler):
+        self.scheduler = scheduler
+        self.manifest = Manifest()
+        if HTTP_MODE:
+            amazon_http.check_paths()
+            self.http = amazon_http.create_client(scheduler.http_connections)
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(
+            headless=True  # 👈 headless!
+        )
+        try:
+            self.context, self.page = await start_session(self.browser)
 
             # === Belgium first ===
             try:
-                await select_belgium(page)
+                await select_belgium(self.page)
                 print("✅ Belgium selection completed")
             except Exception as belgium_error:
                 print(f"❌ Belgium selection failed: {belgium_error}")
-                await page.screenshot(path="debug_belgium_selection_failed.png", full_page=True)
-                print("📷 Screenshot saved: debug_belgium_selection_failed.png")
+                await debug.failure(self.page, "belgium selection", belgium_error)
                 raise belgium_error
 
-            # === Back to account switcher ===
-            try:
-                await page.goto("https://sellercentral.amazon.com.be/account-switcher/default/merchantMarketplace")
-                await page.wait_for_load_state("networkidle")
-                print("✅ Navigated to account switcher")
-            except Exception as nav_error:
-                print(f"❌ Navigation to account switcher failed: {nav_error}")
-                await page.screenshot(path="debug_account_switcher_nav_failed.png", full_page=True)
-                print("📷 Screenshot saved: debug_account_switcher_nav_failed.png")
-                raise nav_error
-
-            # === Loop over countries ===
-            try:
-                tcf_button = page.locator(".full-page-account-switcher-account-label", has_text="TCF Trading").first
-                await tcf_button.wait_for()
-                print("✅ TCF Trading button found")
-
-                while True:
-                    countries = await get_country_buttons(page, tcf_button)
-                    if len(countries) == 0:
-                        print("⚠️ No countries found — re-expanding TCF Trading.")
-                        await tcf_button.click()
-                        await asyncio.sleep(1)
-                    else:
-                        break
-
-                print(f"✅ Found {len(countries)} countries to process")
-
-                for i, btn in enumerate(countries):
-                    try:
-                        country = (await btn.locator(".full-page-account-switcher-account-label").inner_text()).strip()
-                        print(f"🔄 Processing country {i+1}/{len(countries)}: {country}")
-                        
-                        await btn.click()
-                        is_current = country.endswith("(current)")
-                        if not is_current:
-                            select_button = page.locator("button", has_text="Select account")
-                            if await select_button.count() > 0 and await select_button.is_enabled():
-                                await select_button.click()
-                                await page.wait_for_load_state("networkidle")
-                        primary_button = page.locator('button.kat-button--primary')
-                        if await primary_button.count() > 0 and await primary_button.is_visible():
-                            await primary_button.click()
-                        await page.wait_for_load_state("networkidle")
-
-                        await dismiss_tutorial(page)
-
-                        await page.goto(URL)
-                        await page.wait_for_load_state("networkidle")
-                        await dismiss_tutorial(page)
-
-                        await set_filters_and_request(page)
-                        await wait_for_report_and_download(page, country)
-
-                        await page.goto("https://sellercentral.amazon.com.be/account-switcher/default/merchantMarketplace")
-                        await page.wait_for_load_state("networkidle")
-
-                        # Ensure TCF is expanded again
-                        while True:
-                            countries = await get_country_buttons(page, tcf_button)
-                            if len(countries) == 0:
-                                await tcf_button.click()
-                                await asyncio.sleep(1)
-                            else:
-                                break
-                                
-                        print(f"✅ Completed processing for {country}")
-                        
-                    except Exception as country_error:
-                        print(f"❌ Failed to process country {country}: {country_error}")
-                        await page.screenshot(path=f"debug_country_{country.replace(' ', '_')}_failed.png", full_page=True)
-                        print(f"📷 Screenshot saved: debug_country_{country.replace(' ', '_')}_failed.png")
-                        # Continue with next country instead of failing completely
-                        continue
-
-                print("✅ All countries processed")
-
-            except Exception as countries_error:
-                print(f"❌ Country processing failed: {countries_error}")
-                await page.screenshot(path="debug_countries_processing_failed.png", full_page=True)
-                print("📷 Screenshot saved: debug_countries_processing_failed.png")
-                raise countries_error
-
-            print("✅ All done, exiting.")
-            
+            self.countries = await list_countries(self.page)
+            print(f"✅ Found {len(self.countries)} countries to process")
+            self.idle_pages.append(self.page)
+
         except Exception as main_error:
             print(f"❌ Main execution failed: {main_error}")
-            await page.screenshot(path="debug_main_execution_failed.png", full_page=True)
-            print("📷 Screenshot saved: debug_main_execution_failed.png")
-            
-            # Try to get page content for debugging
-            try:
-                page_content = await page.content()
-                with open("debug_main_failed_page.html", "w", encoding="utf-8") as f:
-                    f.write(page_content)
-                print("📄 Page HTML saved: debug_main_failed_page.html")
-            except Exception as e:
-                print(f"⚠️ Could not save page HTML: {e}")
-            
-            # Create a failure marker file
-            try:
-                with open("amazon_automation_failed.txt", "w") as f:
-                    f.write(f"Amazon automation failed at {datetime.now().isoformat()}\n")
-                    f.write(f"Error: {main_error}\n")
-                print("📝 Failure marker file created: amazon_automation_failed.txt")
-            except Exception as e:
-                print(f"⚠️ Could not create failure marker: {e}")
-            
+            # Inner steps capture their own failures; only capture here if none did
+            if not debug.failures:
+                await debug.failure(self.page, "main execution", main_error)
             raise main_error
 
+    async def list_work(self, periods):
+        pending = []
+        for country in self.countries:
+            for period in periods:
+                if self.manifest.is_complete(SOURCE, country_key(country), period, REPORT_ID):
+                    print(f"⏭️ {period} report for {country} already downloaded, skipping.")
+                else:
+                    pending.append((country, period))
+
+        if HTTP_MODE:
+            # Only the marketplace switch needs a browser context; the scheduler
+            # runs these as HTTP units and fetch_http takes a context just for that
+            return [WorkUnit(country_key(country), period, country, kind=HTTP) for country, period in pending]
+        if MODE == "harvest":
+            # Both phases run on the login page, so the whole harvest is one unit
+            label = periods[0] if len(periods) == 1 else f"{periods[0]}..{periods[-1]}"
+            return [WorkUnit("harvest", label, pending)] if pending else []
+        return [WorkUnit(country_key(country), period, country) for country, period in pending]
+
+    async def acquire_page(self):
+        if self.idle_pages:
+            return self.idle_pages.pop()
+        return await self.fresh_page()
+
+    async def fresh_page(self):
+        """Page in a new context that starts from the authenticated cookies/localStorage"""
+        if self.storage_state is None:
+            self.storage_state = await self.context.storage_state()
+        context = await new_context(self.browser, self.storage_state)
+        self.worker_contexts.append(context)
+        print(f"🧵 Opened browser context {len(self.worker_contexts) + 1}")
+        return await new_page(context)
+
+    async def release_page(self, page):
+        """Return a page to the pool after a unit, in a fresh context if the governor asks for one"""
+        page = await self.govern(page)
+        if not page.is_closed():
+            self.idle_pages.append(page)
+
+    async def govern(self, page):
+        """`page`, or a page in a new context when `page`'s context is due for recycling.
+
+        Called once a unit's result is saved, so a failure here is only logged
+        and the unit still counts as done.
+        """
+        try:
+            reason = await governor.check(page)
+            if not reason:
+                return page
+            print(f"♻️ Recycling browser context: {reason}")
+            return await self.recycle(page)
+        except Exception as e:
+            print(f"⚠️ Could not recycle the browser context: {e}")
+            return page
+
+    async def recycle(self, page):
+        """Replace `page`'s context with a new one carrying its current cookies/localStorage"""
+        old = page.context
+        # Cookies may have been refreshed since login; later fresh contexts start from these
+        self.storage_state = await old.storage_state()
+        context = await new_context(self.browser, self.storage_state)
+        page = await new_page(context)
+        if old is self.context:
+            self.context, self.page = context, page
+        else:
+            self.worker_contexts[self.worker_contexts.index(old)] = context
+        governor.forget(old, recycled=True)
+        await debug.stop_tracing(old, f"recycled_{governor.recycled}")
+        await old.close()
+        return page
+
+    async def replace_page(self, page):
+        """A page in a fresh context, in place of one a failure may have left in a bad state"""
+        await self.discard_page(page)
+        return await self.fresh_page()
+
+    async def discard_page(self, page):
+        """Drop a page a failure may have left in a bad state, with its context unless that holds the login"""
+        try:
+            if page.context is self.context:
+                await page.close()
+            else:
+                self.worker_contexts.remove(page.context)
+                governor.forget(page.context)
+                await debug.stop_tracing(page.context, "failed_context")
+                await page.context.close()
+        except Exception as e:
+            print(f"⚠️ Could not close a failed page: {e}")
+
+    async def fetch(self, unit):
+        if unit.kind == HTTP:
+            if not self.http_disabled:
+                try:
+                    await self.fetch_http(unit)
+                    return
+                except amazon_http.EndpointError as e:
+                    print(f"⚠️ HTTP report endpoints do not work ({e}); using the browser from now on.")
+                    self.http_disabled = True
+                except Exception as e:
+                    print(f"⚠️ HTTP fetch of {unit} failed ({e}); retrying in the browser.")
+            async with self.scheduler.contexts:
+                await self.fetch_ui(unit)
+            return
+        if MODE == "harvest":
+            await request_then_harvest(
+                self.page, unit.data, self.manifest, self.checkpoint, self.govern, self.replace_page,
+            )
+            return
+        await self.fetch_ui(unit)
+
+    @metrics.instrument("amazon.fetch_http")
+    async def fetch_http(self, unit):
+        """Select the marketplace in the browser, then request, poll and download over HTTP"""
+        country, period = unit.data, unit.period
+        key = country_key(country)
+        metrics.current().set(country=key, period=period)
+        connections = self.scheduler.connections
+
+        report_id = self.checkpoint.resumable_report(key, period, RESUME_MAX_AGE)
+        resumed = bool(report_id)
+        if resumed:
+            # Status and download go by report id, so no marketplace switch is needed
+            print(f"⏯️ Resuming {period} report {report_id} for {key} over HTTP")
+            headers = amazon_http.session_headers(await self.context.cookies(), SELLER_CENTRAL_URL)
+        else:
+            async with self.scheduler.contexts:
+                page = await self.acquire_page()
+                try:
+                    await open_reports_for(page, country)
+                    self.checkpoint.advance(key, period, SWITCHED)
+                    csrf_token = await page.evaluate(
+                        "(selector) => document.querySelector(selector)?.content || null", amazon_http.CSRF_META,
+                    )
+                    headers = amazon_http.session_headers(
+                        await page.context.cookies(), SELLER_CENTRAL_URL, csrf_token,
+                    )
+                    # Requested while this marketplace is selected
+                    report_id = await amazon_http.request_report(
+                        self.http, SELLER_CENTRAL_URL, headers, period, connections,
+                    )
+                except Exception:
+                    await self.release_page(page)
+                    raise
+                self.checkpoint.advance(key, period, REQUESTED, report_id=report_id)
+                await self.release_page(page)
+            print(f"📄 Requested {period} report {report_id} for {key} over HTTP")
+
+        try:
+            await amazon_http.wait_until_ready(
+                self.http, SELLER_CENTRAL_URL, headers, report_id,
+                REPORT_TIMEOUT, REFRESH_INTERVAL_MIN, REFRESH_INTERVAL_MAX, connections,
+            )
+        except amazon_http.ReportNotFound:
+            if not resumed:
+                # The endpoints work, but this report did not; only this unit goes to the browser
+                raise RuntimeError(f"report {report_id} is gone right after the request")
+            print(f"🔁 Earlier {period} report for {key} is gone; requesting it again")
+            self.checkpoint.advance(key, period, SWITCHED)
+            return await self.fetch_http(unit)
+        self.checkpoint.advance(key, period, READY)
+        folder = Path("downloads") / period
+        folder.mkdir(parents=True, exist_ok=True)
+        save_as = folder / f"Amazon - {key} - {period} - {report_id}.csv"
+        meta = await amazon_http.download_report(
+            self.http, SELLER_CENTRAL_URL, headers, report_id, save_as, connections,
+        )
+        metrics.add_bytes(meta["size"])
+        self.manifest.record(SOURCE, key, period, REPORT_ID, save_as, sha256=meta["sha256"], size=meta["size"])
+        self.checkpoint.advance(key, period, DOWNLOADED, path=str(save_as))
+        print(f"✅ Downloaded over HTTP: {save_as}")
+
+    async def fetch_ui(self, unit):
+        """Process one country and month; a failed attempt is retried in a fresh browser context"""
+        country, period = unit.data, unit.period
+        key = country_key(country)
+        for attempt in range(1, COUNTRY_ATTEMPTS + 1):
+            page = await self.acquire_page() if attempt == 1 else await self.fresh_page()
+            try:
+                retry = f" (attempt {attempt}/{COUNTRY_ATTEMPTS})" if attempt > 1 else ""
+                print(f"🔄 Processing {country} {period}{retry}")
+                save_as = await process_country(page, country, period, self.checkpoint)
+            except Exception as country_error:
+                print(f"❌ Failed to process country {country} {period}{retry}: {country_error}")
+                self.checkpoint.failed(key, period, country_error)
+                await debug.failure(page, f"country: {key} {period} attempt {attempt}", country_error)
+                # Whatever state broke this page must not leak into the next attempt or country
+                await self.discard_page(page)
+                if attempt == COUNTRY_ATTEMPTS:
+                    self.manifest.mark_failed(SOURCE, key, period, REPORT_ID, country_error)
+                    raise
+                continue
+            self.manifest.record(SOURCE, key, period, REPORT_ID, save_as)
+            self.checkpoint.advance(key, period, DOWNLOADED, path=str(save_as))
+            print(f"✅ Completed processing for {country} {period}")
+            await self.release_page(page)
+            return
+
+    async def close(self):
+        try:
+            if self.context is not None and self.countries:
+                # Keep the refreshed cookies for the next run
+                await save_session(self.context)
+            resource_policy.report()
+            governor.report()
+            waits.report()
+            for n, context in enumerate(self.worker_contexts, 2):
+                await debug.stop_tracing(context, f"worker_{n}")
+                await context.close()
+            if self.context is not None:
+                await debug.stop_tracing(self.context, "main")
+        finally:
+            debug.save()
+            if self.http is not None:
+                await self.http.aclose()
+            if self.manifest is not None:
+                self.manifest.close()
+            if self.browser is not None:
+                await self.browser.close()
+            if self.playwright is not None:
+                await self.playwright.stop()
+
+
+def create_source():
+    return AmazonSource()
+
+
+async def run(periods=None):
+    """Download every country's monthly transaction report for `periods` (default last month)"""
+    await run_standalone(create_source(), periods or [last_month_period()])
+    print("✅ All done, exiting.")
+
+
+def main():
+    asyncio.run(run())
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -0,0 +1,210 @@
+"""Seller Central report request, status polling and download as plain HTTP calls.
+
+The browser is only needed to log in and to select a marketplace. These
+calls reuse its cookies on a pooled `httpx.AsyncClient`, so a report costs a
+few small requests instead of a page load and a chain of DOM clicks per step.
+The endpoint paths, the request body and how the report id is passed are
+what the reports-repository page sends itself. None of them has a default:
+capture them from the page's XHRs (browser devtools) and set them in the
+environment. The values in benchmarks/fake_seller_central.py only match that
+fake. When an endpoint answers with something unexpected, `EndpointError`
+tells the caller to fall back to the browser.
+"""
+import os
+import json
+import asyncio
+from datetime import datetime, timedelta
+from urllib.parse import quote, urlencode, urlsplit
+import httpx
+from dotenv import load_dotenv
+from download_utils import stream_download
+import metrics
+
+load_dotenv()
+
+REQUEST_PATH = os.getenv("AMAZON_REPORT_REQUEST_PATH", "")
+STATUS_PATH = os.getenv("AMAZON_REPORT_STATUS_PATH", "")
+DOWNLOAD_PATH = os.getenv("AMAZON_REPORT_DOWNLOAD_PATH", "")
+# JSON body of the report request; "{month}" ("July 2025"), "{period}" ("2025-07"),
+# "{start}" and "{end}" (first and last day, ISO) inside its strings are filled in
+REQUEST_BODY = os.getenv("AMAZON_REPORT_REQUEST_BODY", "")
+# Query parameter carrying the report id, for status/download paths without a "{report_id}"
+ID_PARAM = os.getenv("AMAZON_REPORT_ID_PARAM", "")
+# Meta tag holding the token Seller Central expects on XHRs that change state
+CSRF_META = 'meta[name="anti-csrftoken-a2z"]'
+CSRF_HEADER = "anti-csrftoken-a2z"
+READY_STATES = {"download csv", "done", "ready", "completed", "_done_"}
+# States of a report id the status endpoint no longer has (e.g. expired since an earlier run)
+GONE_STATES = {"not_found", "not found", "expired", "deleted", "cancelled"}
+REPORT_ID_KEYS = ("reportId", "reportReferenceId", "referenceId", "requestId", "id")
+# Keys that name a report whatever the endpoint; for responses whose origin is less certain
+REPORT_SPECIFIC_KEYS = ("reportId", "reportReferenceId", "referenceId")
+
+
+class EndpointError(Exception):
+    """The endpoint did not answer the way the reports page's own XHRs do"""
+
+
+class ReportNotFound(Exception):
+    """The status endpoint says the report is gone (e.g. an expired id from an earlier run)"""
+
+
+def check_paths():
+    """Fail early when HTTP mode is on but the endpoints were never configured"""
+    id_in_paths = all("{report_id}" in path for path in (STATUS_PATH, DOWNLOAD_PATH))
+    missing = [
+        name for name, value in (
+            ("AMAZON_REPORT_REQUEST_PATH", REQUEST_PATH),
+            ("AMAZON_REPORT_STATUS_PATH", STATUS_PATH),
+            ("AMAZON_REPORT_DOWNLOAD_PATH", DOWNLOAD_PATH),
+            ("AMAZON_REPORT_REQUEST_BODY", REQUEST_BODY),
+            ("AMAZON_REPORT_ID_PARAM", ID_PARAM or id_in_paths),
+        ) if not value
+    ]
+    if missing:
+        raise RuntimeError(
+            f"AMAZON_HTTP_MODE needs {', '.join(missing)}: copy them from the XHRs of the "
+            "reports-repository page, or turn HTTP mode off"
+        )
+    try:
+        json.loads(REQUEST_BODY)
+    except ValueError as e:
+        raise RuntimeError(f"AMAZON_REPORT_REQUEST_BODY is not valid JSON: {e}")
+
+
+def request_body(period):
+    """REQUEST_BODY with the placeholders in its strings filled in for `period`"""
+    first = datetime.strptime(period, "%Y-%m").date()
+    last = (first + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    values = {
+        "{month}": first.strftime("%B %Y"), "{period}": period,
+        "{start}": first.isoformat(), "{end}": last.isoformat(),
+    }
+
+    def fill(value):
+        if isinstance(value, str):
+            for placeholder, text in values.items():
+                value = value.replace(placeholder, text)
+            return value
+        if isinstance(value, list):
+            return [fill(item) for item in value]
+        if isinstance(value, dict):
+            return {key: fill(item) for key, item in value.items()}
+        return value
+
+    return fill(json.loads(REQUEST_BODY))
+
+
+def report_url(base_url, path, report_id):
+    """URL of `path` for `report_id`: in its "{report_id}" placeholder, else in the ID_PARAM query parameter"""
+    if "{report_id}" in path:
+        return base_url + path.replace("{report_id}", quote(report_id, safe=""))
+    return f"{base_url}{path}?{urlencode({ID_PARAM: report_id})}"
+
+
+def create_client(max_connections):
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        timeout=httpx.Timeout(30.0, read=120.0),
+        follow_redirects=False,
+    )
+
+
+def session_headers(cookies, base_url, csrf_token=None):
+    """Request headers carrying the browser context's cookies for `base_url`'s host"""
+    host = urlsplit(base_url).hostname or ""
+    pairs = [
+        f"{cookie['name']}={cookie['value']}"
+        for cookie in cookies
+        if host == cookie["domain"].lstrip(".") or host.endswith("." + cookie["domain"].lstrip("."))
+    ]
+    headers = {"Cookie": "; ".join(pairs), "Accept": "application/json", "X-Requested-With": "XMLHttpRequest"}
+    if csrf_token:
+        headers[CSRF_HEADER] = csrf_token
+    return headers
+
+
+def check(response):
+    """JSON body of a successful response; anything else means the endpoint is not what we expect"""
+    if response.status_code in (301, 302, 303, 401, 403):
+        raise EndpointError(f"{response.request.url.path}: session not accepted ({response.status_code})")
+    if not response.is_success:
+        # A 5xx is no more likely to pass for the next unit than a 404: use the browser instead
+        raise EndpointError(f"{response.request.url.path}: {response.status_code}")
+    try:
+        return response.json()
+    except ValueError:
+        raise EndpointError(f"{response.request.url.path}: response is not JSON")
+
+
+def find_report_id(payload, keys=REPORT_ID_KEYS, depth=0):
+    if not isinstance(payload, dict) or depth > 1:
+        return None
+    for key in keys:
+        if payload.get(key):
+            return str(payload[key])
+    for value in payload.values():
+        found = find_report_id(value, keys, depth + 1)
+        if found:
+            return found
+    return None
+
+
+def report_state(payload):
+    for key in ("label", "status", "state", "reportStatus"):
+        if isinstance(payload, dict) and payload.get(key):
+            return str(payload[key]).strip().lower()
+    return ""
+
+
+async def request_report(client, base_url, headers, period, connections):
+    """Request the monthly transaction report for `period`; returns its report id"""
+    async with connections:
+        with metrics.span("amazon.http_request", period=period):
+            response = await client.post(base_url + REQUEST_PATH, headers=headers, json=request_body(period))
+    report_id = find_report_id(check(response))
+    if not report_id:
+        raise EndpointError(f"{REQUEST_PATH}: no report id in the response")
+    return report_id
+
+
+async def wait_until_ready(client, base_url, headers, report_id, timeout, interval_min, interval_max, connections):
+    """Poll the report's status with a bounded backoff until it can be downloaded"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    interval = interval_min
+    with metrics.span("amazon.http_wait", report=report_id) as span:
+        while True:
+            async with connections:
+                response = await client.get(report_url(base_url, STATUS_PATH, report_id), headers=headers)
+            span.set(checks=span.attrs.get("checks", 0) + 1)
+            state = report_state(check(response))
+            if state in GONE_STATES:
+                raise ReportNotFound(report_id)
+            if not state:
+                raise EndpointError(f"{STATUS_PATH}: no state for report {report_id}")
+            if state in READY_STATES:
+                return
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError(f"Report {report_id} not ready after {timeout}s")
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * 2, interval_max)
+
+
+async def download_report(client, base_url, headers, report_id, target, connections):
+    """Stream the report's CSV to `target` (through a .part file); returns its size/sha256"""
+    async with connections:
+        with metrics.span("amazon.http_download", report=report_id) as span:
+            url = report_url(base_url, DOWNLOAD_PATH, report_id)
+            headers = {key: value for key, value in headers.items() if key != "Accept"}
+            try:
+                meta = await stream_download(client, url, target, headers=headers)
+            except httpx.HTTPStatusError as e:
+                location = e.response.headers.get("location")
+                if not e.response.is_redirect or not location:
+                    raise EndpointError(f"{DOWNLOAD_PATH}: {e.response.status_code}") from e
+                # Usually a pre-signed storage URL; it must not receive the session cookies
+                meta = await stream_download(client, str(e.response.url.join(location)), target)
+            span.add_bytes(meta["size"])
+    return meta
@@ -1,41 +1,63 @@
 import os
+import json
+import asyncio
+import hashlib
 import httpx
-from datetime import datetime, timedelta
+from datetime import datetime
 from dotenv import load_dotenv
 from pathlib import Path
+from download_utils import stream_download
+from bol_auth import TokenManager, create_token_cache
+from manifest import Manifest, last_month_period, period_bounds
+from bol_client import BolApiClient, TOKEN, INVOICE_LIST, SPECIFICATION
+from sources import Source, WorkUnit, HTTP, numbered_accounts, run_standalone
+import metrics
 
 load_dotenv()
 
 downloads_dir = Path("downloads")
 downloads_dir.mkdir(exist_ok=True)
 
-API_BASE = "https://api.bol.com/retailer"
-TOKEN_URL = "https://login.bol.com/token"
+# Overridable so the benchmarks can point the script at a local stand-in
+API_BASE = os.getenv("BOL_API_BASE", "https://api.bol.com/retailer")
+TOKEN_URL = os.getenv("BOL_TOKEN_URL", "https://login.bol.com/token")
+SOURCE = "bol"
 
-def get_access_token(client_id, client_secret):
-    response = httpx.post(
+# Parallel specification downloads within a single account; the total number of
+# requests in flight is the scheduler's MAX_HTTP_CONNECTIONS.
+ACCOUNT_CONCURRENCY = int(os.getenv("BOL_ACCOUNT_CONCURRENCY", 4))
+# Listed invoices waiting for a download worker; the listing pauses when it is full
+INVOICE_QUEUE_SIZE = int(os.getenv("BOL_INVOICE_QUEUE_SIZE", 2 * ACCOUNT_CONCURRENCY))
+
+
+def create_client(max_connections):
+    """Create the pooled client shared by every account (HTTP/2 when h2 is installed)."""
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        ),
+        timeout=httpx.Timeout(30.0, read=60.0),  # 60 second read timeout for large XLSX files
+    )
+
+async def get_access_token(client, client_id, client_secret):
+    response = await client.post(
         TOKEN_URL,
         data={"grant_type": "client_credentials"},
         auth=(client_id, client_secret),
         headers={"Accept": "application/json"},
     )
     response.raise_for_status()
-    token = response.json()["access_token"]
+    payload = response.json()
     print("🔐 Access token retrieved.")
-    return token
-
-def get_last_month_period():
-    today = datetime.today()
-    # Get the first day of current month, then subtract 1 day to get last day of previous month
-    first_day_current_month = today.replace(day=1)
-    last_day_previous_month = first_day_current_month - timedelta(days=1)
-    # Get the first day of previous month
-    first_day_previous_month = last_day_previous_month.replace(day=1)
-    
-    return (
-        first_day_previous_month.strftime("%Y-%m-%d"),
-        last_day_previous_month.strftime("%Y-%m-%d"),
-    )
+    # Bol tokens currently live 299 seconds; fall back to that if the field is missing
+    return payload["access_token"], int(payload.get("expires_in", 299))
 
 def get_month_name_from_date(date_str):
     """Convert date string to month name for filename"""
@@ -45,93 +67,231 @@ def get_month_name_from_date(date_str):
     except:
         return "unknown_month"
 
-def fetch_invoices(token, start_date, end_date):
+async def fetch_invoices(client, token, start_date, end_date, page=1):
     headers = {
         "Authorization": f"Bearer {token}",
         "Accept": "application/vnd.retailer.v10+json",
     }
-    url = f"{API_BASE}/invoices?period={start_date}/{end_date}"
-    response = httpx.get(url, headers=headers)
+    url = f"{API_BASE}/invoices?period={start_date}/{end_date}&page={page}"
+    response = await client.get(url, headers=headers)
     response.raise_for_status()
     return response.json().get("invoiceListItems", [])
 
-def download_specification(token, invoice_id, filename):
+async def iter_invoices(bol, client, authorized, global_limit, start_date, end_date, description):
+    """Yield listing entries page by page, until a page is empty or only repeats earlier ones"""
+    seen = set()
+    page = 1
+    while True:
+        # The global slot is only held for the request, never while the consumer is busy
+        async with global_limit:
+            with metrics.span("bol.invoice_list", description=description, page=page):
+                items = await bol.call(
+                    INVOICE_LIST,
+                    lambda attempt, page=page: authorized(
+                        lambda token: fetch_invoices(client, token, start_date, end_date, page)
+                    ),
+                    description=f"{description} page {page}",
+                )
+        new = [item for item in items if item["invoiceId"] not in seen]
+        if not new:
+            return
+        for item in new:
+            seen.add(item["invoiceId"])
+            yield item
+        page += 1
+
+async def download_specification(client, token, invoice_id, filename, resume=False):
     headers = {
         "Authorization": f"Bearer {token}",
         "Accept": "application/vnd.retailer.v10+openxmlformats-officedocument.spreadsheetml.sheet",
     }
     url = f"{API_BASE}/invoices/{invoice_id}/specification"
-    response = httpx.get(url, headers=headers, timeout=60.0)  # 60 second timeout
-    response.raise_for_status()
-    with open(filename, "wb") as f:
-        f.write(response.content)
-    print(f"📥 Saved XLSX: {filename}")
+    # Streamed to a .part file and renamed when complete; retries resume via Range
+    meta = await stream_download(client, url, filename, headers=headers, resume=resume)
+    print(f"📥 Saved XLSX: {filename} ({meta['size']} bytes)")
+    return meta
 
-def process_account(i):
-    username = os.getenv(f"BOL_USERNAME_{i}")
-    client_id = os.getenv(f"BOL_CLIENT_ID_{i}")
-    client_secret = os.getenv(f"BOL_API_SECRET_{i}")
+async def download_with_retries(bol, client, authorized, invoice_id, filename):
+    """Return the size/sha256 of the saved file, or raise the last error"""
+    # Retries continue the partial file with a Range request
+    return await bol.call(
+        SPECIFICATION,
+        lambda attempt: authorized(lambda token: download_specification(
+            client, token, invoice_id, filename, resume=attempt > 0
+        )),
+        description=f"invoice {invoice_id}",
+    )
 
-    if not all([username, client_id, client_secret]):
-        print(f"⚠️ Missing credentials for account {i}")
-        return
+def account_numbers():
+    """Account numbers configured as BOL_CLIENT_ID_<n>, in order"""
+    return numbered_accounts("BOL_CLIENT_ID")
 
-    print(f"\n🚀 Processing account {username}")
-    
-    try:
-        token = get_access_token(client_id, client_secret)
-    except Exception as e:
-        print(f"❌ Failed to get access token: {e}")
-        return
+def invoice_fingerprint(invoice):
+    """Stable hash of a listing entry, so an invoice that changes upstream is fetched again"""
+    return hashlib.sha256(json.dumps(invoice, sort_keys=True).encode()).hexdigest()
+
+@metrics.instrument("bol.process_account")
+async def process_account(bol, client, tokens, manifest, account, global_limit, account_limit, period):
+    """List and download one account's invoices for `period`"""
+    username, client_id, client_secret = account
+    account_span = metrics.current()
+    account_span.set(account=username, period=period, invoices=0, skipped=0, failed=0)
 
-    start_date, end_date = get_last_month_period()
-    print(f"📆 Fetching invoices for {start_date} to {end_date}")
+    def authorized(request):
+        # Cached token, refreshed before expiry and replayed once on a 401
+        return tokens.call(client_id, client_secret, request)
 
     try:
-        invoices = fetch_invoices(token, start_date, end_date)
+        await tokens.get(client_id, client_secret)
     except Exception as e:
-        print(f"❌ Failed to fetch invoices: {e}")
-        return
+        print(f"❌ [{username}] Failed to get access token: {e}")
+        account_span.outcome, account_span.error = "error", str(e)
+        raise
 
-    if not invoices:
-        print("⚠️ No invoices found.")
-        return
+    start_date, end_date = period_bounds(period)
+    print(f"📆 [{username}] Fetching invoices for {start_date} to {end_date}")
 
     # Get the month name for the period we're fetching
     period_month_name = get_month_name_from_date(start_date)
+    period_dir = downloads_dir / period
+    period_dir.mkdir(exist_ok=True)
 
-    for invoice in invoices:
+    async def download(invoice):
         invoice_id = invoice["invoiceId"]
         invoice_start_date = invoice.get("startDate", "")
         invoice_end_date = invoice.get("endDate", "")
-        
+
         # Use the month from the invoice dates if available, otherwise use the period we're fetching
         if invoice_start_date and invoice_end_date:
             month_name = get_month_name_from_date(invoice_start_date)
         else:
             # Fallback to the period we're fetching
             month_name = period_month_name
-        
-        filename = downloads_dir / f"Bol.com - {username} - {month_name} - {invoice_id}.xlsx"
-        
-        # Try up to 3 times with increasing delays
-        for attempt in range(3):
+
+        filename = period_dir / f"Bol.com - {username} - {month_name} - {invoice_id}.xlsx"
+        fingerprint = invoice_fingerprint(invoice)
+
+        if manifest.is_complete(SOURCE, username, period, invoice_id, fingerprint):
+            print(f"⏭️ [{username}] Invoice {invoice_id} already downloaded, skipping.")
+            account_span.attrs["skipped"] += 1
+            return
+
+        # Always take the per-account slot before the global one so accounts
+        # cannot starve each other while holding a global slot.
+        async with account_limit, global_limit:
             try:
-                download_specification(token, invoice_id, filename)
-                break  # Success, exit retry loop
+                with metrics.span("bol.download_specification", account=username, invoice=invoice_id) as span:
+                    meta = await download_with_retries(bol, client, authorized, invoice_id, filename)
+                    span.add_bytes(meta["size"])
             except Exception as e:
-                if attempt < 2:  # Not the last attempt
-                    print(f"⚠️ Attempt {attempt + 1} failed for invoice {invoice_id}: {e}")
-                    import time
-                    time.sleep(2 ** attempt)  # Exponential backoff: 1s, 2s, 4s
-                else:  # Last attempt
-                    print(f"❌ Failed to download invoice {invoice_id} after 3 attempts: {e}")
+                print(f"❌ [{username}] Failed to download invoice {invoice_id}: {e}")
+                manifest.mark_failed(SOURCE, username, period, invoice_id, e)
+                account_span.attrs["failed"] += 1
+                return
+        account_span.add_bytes(meta["size"])
+        manifest.record(
+            SOURCE, username, period, invoice_id, filename,
+            sha256=meta["sha256"], size=meta["size"], fingerprint=fingerprint,
+        )
 
-def main():
-    # Process all accounts
-    for i in range(1, 5):
-        process_account(i)
+    # The listing feeds a bounded queue, so downloads start with the first
+    # page and memory stays flat however many invoices the account has.
+    queue = asyncio.Queue(maxsize=INVOICE_QUEUE_SIZE)
+
+    async def worker():
+        while (invoice := await queue.get()) is not None:
+            try:
+                await download(invoice)
+            except Exception as e:
+                print(f"❌ [{username}] Unexpected error for invoice {invoice.get('invoiceId')}: {e}")
+
+    workers = [asyncio.create_task(worker()) for _ in range(ACCOUNT_CONCURRENCY)]
+    listed = 0
+    try:
+        async for invoice in iter_invoices(
+            bol, client, authorized, global_limit, start_date, end_date,
+            f"invoice list for {username} {period}",
+        ):
+            listed += 1
+            account_span.attrs["invoices"] += 1
+            await queue.put(invoice)
+    except Exception as e:
+        print(f"❌ [{username}] Failed to fetch invoices for {period}: {e}")
+        account_span.outcome, account_span.error = "error", str(e)
+        raise
+    finally:
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    if not listed:
+        print(f"⚠️ [{username}] No invoices found for {period}.")
+
+
+class BolSource(Source):
+    """Retailer API invoices; one work unit per account and period"""
+    name = SOURCE
+    kind = HTTP
+
+    def __init__(self):
+        self.client = self.manifest = None
+        # Shared by all periods of an account
+        self.account_limits = {}
+
+    async def open(self, scheduler):
+        self.global_limit = scheduler.connections
+        self.manifest = Manifest()
+        self.client = create_client(scheduler.http_connections)
+        # Per-endpoint rate limits fed by every response's headers
+        self.bol = BolApiClient()
+        self.bol.install(self.client)
+
+        async def fetch_token(client_id, client_secret):
+            with metrics.span("bol.token"):
+                return await self.bol.call(
+                    TOKEN,
+                    lambda attempt: get_access_token(self.client, client_id, client_secret),
+                    description="access token",
+                )
+
+        self.tokens = TokenManager(fetch_token, cache=create_token_cache())
+
+    async def list_work(self, periods):
+        units = []
+        for i in account_numbers():
+            account = tuple(os.getenv(f"BOL_{key}_{i}") for key in ("USERNAME", "CLIENT_ID", "API_SECRET"))
+            if not all(account):
+                print(f"⚠️ Missing credentials for account {i}")
+                continue
+            print(f"\n🚀 Processing account {account[0]}")
+            # Every period of a backfill is listed and downloaded at the same time
+            units += [WorkUnit(account[0], period, account) for period in periods]
+        return units
+
+    async def fetch(self, unit):
+        account_limit = self.account_limits.setdefault(unit.account, asyncio.Semaphore(ACCOUNT_CONCURRENCY))
+        await process_account(
+            self.bol, self.client, self.tokens, self.manifest, unit.data,
+            self.global_limit, account_limit, unit.period,
+        )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+        if self.manifest is not None:
+            self.manifest.close()
+
+
+def create_source():
+    return BolSource()
+
+async def run(periods=None):
+    """Download every account's invoices for `periods` ("YYYY-MM" keys, default last month)"""
+    await run_standalone(create_source(), periods or [last_month_period()])
     print("\n✅ All done!")
 
+def main():
+    asyncio.run(run())
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,76 @@
+import os
+import time
+import asyncio
+import httpx
+from pathlib import Path
+from dotenv import load_dotenv
+from secure_store import open_encrypted
+
+load_dotenv()
+
+# Refresh this many seconds before the token actually expires so a request
+# started just before expiry does not arrive with a dead token.
+REFRESH_MARGIN = int(os.getenv("BOL_TOKEN_REFRESH_MARGIN", 30))
+
+# Optional cross-run cache. Only used when a Fernet key is configured.
+TOKEN_CACHE_KEY = os.getenv("BOL_TOKEN_CACHE_KEY")
+TOKEN_CACHE_PATH = Path(os.getenv("BOL_TOKEN_CACHE_PATH", ".cache/bol_tokens.bin"))
+
+
+def create_token_cache():
+    return open_encrypted(TOKEN_CACHE_PATH, TOKEN_CACHE_KEY, "BOL_TOKEN_CACHE_KEY")
+
+
+class TokenManager:
+    """Caches client-credential tokens per client_id and refreshes them before expiry.
+
+    `fetch_token(client_id, client_secret)` must return `(access_token, expires_in)`.
+    Concurrent callers for the same client_id wait on one shared refresh.
+    """
+
+    def __init__(self, fetch_token, cache=None):
+        self.fetch_token = fetch_token
+        self.cache = cache
+        self.tokens = cache.load(default={}) if cache else {}
+        self.locks = {}
+
+    def _valid(self, client_id):
+        entry = self.tokens.get(client_id)
+        if entry and entry["expires_at"] - REFRESH_MARGIN > time.time():
+            return entry["access_token"]
+        return None
+
+    async def get(self, client_id, client_secret):
+        token = self._valid(client_id)
+        if token:
+            return token
+        return await self.refresh(client_id, client_secret)
+
+    async def refresh(self, client_id, client_secret, stale_token=None):
+        """Fetch a new token unless another caller already replaced `stale_token`"""
+        lock = self.locks.setdefault(client_id, asyncio.Lock())
+        async with lock:
+            token = self._valid(client_id)
+            if token and token != stale_token:
+                return token
+
+            token, expires_in = await self.fetch_token(client_id, client_secret)
+            self.tokens[client_id] = {
+                "access_token": token,
+                "expires_at": time.time() + expires_in,
+            }
+            if self.cache:
+                self.cache.save(self.tokens)
+            return token
+
+    async def call(self, client_id, client_secret, request):
+        """Run `request(token)`, refreshing the token and replaying once on a 401"""
+        token = await self.get(client_id, client_secret)
+        try:
+            return await request(token)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 401:
+                raise
+            print("🔐 Token rejected (401), refreshing and retrying once…")
+            token = await self.refresh(client_id, client_secret, stale_token=token)
+            return await request(token)
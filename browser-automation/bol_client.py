@@ -0,0 +1,202 @@
+import os
+import time
+import random
+import asyncio
+import httpx
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+from download_utils import IncompleteDownloadError
+import metrics
+
+load_dotenv()
+
+# Endpoint groups Bol rate-limits separately
+TOKEN = "token"
+INVOICE_LIST = "invoice_list"
+SPECIFICATION = "specification"
+
+# Requests per second allowed into each group before the server says otherwise
+GROUP_RATES = {
+    TOKEN: float(os.getenv("BOL_RATE_TOKEN", 5)),
+    INVOICE_LIST: float(os.getenv("BOL_RATE_INVOICE_LIST", 5)),
+    SPECIFICATION: float(os.getenv("BOL_RATE_SPECIFICATION", 10)),
+}
+# Upper bound for the adaptive in-flight limit of each group
+GROUP_MAX_CONCURRENCY = {
+    TOKEN: int(os.getenv("BOL_MAX_CONCURRENCY_TOKEN", 2)),
+    INVOICE_LIST: int(os.getenv("BOL_MAX_CONCURRENCY_INVOICE_LIST", 4)),
+    SPECIFICATION: int(os.getenv("BOL_MAX_CONCURRENCY_SPECIFICATION", 8)),
+}
+
+MAX_RETRIES = int(os.getenv("BOL_MAX_RETRIES", 3))  # timeouts and 5xx
+MAX_THROTTLE_RETRIES = int(os.getenv("BOL_MAX_THROTTLE_RETRIES", 6))  # 429s
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+
+
+class NonRetryableError(Exception):
+    """A 4xx response that will not succeed on retry"""
+
+
+def group_for_url(url):
+    url = str(url).split("?")[0]
+    if "login.bol.com" in url or url.rstrip("/").endswith("/token"):
+        return TOKEN
+    if url.rstrip("/").endswith("/specification"):
+        return SPECIFICATION
+    return INVOICE_LIST
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class EndpointLimiter:
+    """Token bucket plus an AIMD in-flight limit for one endpoint group.
+
+    The in-flight limit halves whenever the server throttles us and grows by
+    one after a full window of healthy responses, up to `max_concurrency`.
+    """
+
+    def __init__(self, name, rate, max_concurrency):
+        self.name = name
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self.healthy_streak = 0
+        self.paused_until = 0.0
+        self.throttled = 0
+        self.condition = asyncio.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        while True:
+            delay = self.paused_until - time.monotonic()
+            self._refill()
+            if delay <= 0 and self.tokens >= 1:
+                self.tokens -= 1
+                return
+            if delay <= 0:
+                delay = (1 - self.tokens) / self.rate
+            await asyncio.sleep(delay)
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def throttle(self, seconds):
+        """Server asked us to slow down: pause the group and halve concurrency"""
+        self.throttled += 1
+        self.healthy_streak = 0
+        self.pause(seconds)
+        async with self.condition:
+            self.limit = max(1, self.limit // 2)
+        print(f"🐢 Bol throttled {self.name}: waiting {seconds:.1f}s, concurrency now {self.limit}")
+
+    async def healthy(self):
+        self.healthy_streak += 1
+        if self.healthy_streak >= self.limit and self.limit < self.max_concurrency:
+            self.healthy_streak = 0
+            async with self.condition:
+                self.limit += 1
+                self.condition.notify_all()
+
+    def observe_headers(self, headers):
+        """Respect X-RateLimit-* even on successful responses"""
+        remaining = headers.get("x-ratelimit-remaining")
+        reset = headers.get("x-ratelimit-reset")
+        if remaining is not None and reset is not None:
+            try:
+                if int(remaining) <= 0:
+                    self.pause(float(reset))
+            except ValueError:
+                pass
+
+
+class BolApiClient:
+    """Rate-limit-aware wrapper around the shared httpx.AsyncClient.
+
+    `install(client)` registers a response hook so every response, including
+    streamed downloads, feeds the limiter of its endpoint group. `call` runs one
+    logical request with per-group admission and the retry policy: 429 waits
+    for Retry-After, timeouts and 5xx back off with jitter, other 4xx fail fast.
+    """
+
+    def __init__(self):
+        self.limiters = {
+            group: EndpointLimiter(group, GROUP_RATES[group], GROUP_MAX_CONCURRENCY[group])
+            for group in GROUP_RATES
+        }
+
+    def install(self, client):
+        client.event_hooks["response"].append(self._on_response)
+        return client
+
+    async def _on_response(self, response):
+        self.limiters[group_for_url(response.request.url)].observe_headers(response.headers)
+
+    async def call(self, group, request, description=""):
+        """Run `request(attempt)` under the group's limits, retrying what is worth retrying"""
+        limiter = self.limiters[group]
+        attempt = 0
+        throttles = 0
+        while True:
+            await limiter.acquire()
+            try:
+                result = await request(attempt)
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                if status == 429:
+                    throttles += 1
+                    if throttles > MAX_THROTTLE_RETRIES:
+                        raise
+                    wait = parse_retry_after(e.response.headers.get("retry-after"))
+                    if wait is None:
+                        wait = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** throttles)
+                    metrics.count_retry()
+                    await limiter.throttle(wait + random.uniform(0, 0.5))
+                    continue
+                if status < 500:
+                    raise NonRetryableError(f"{description} failed with HTTP {status}") from e
+                error = e
+            except (httpx.TransportError, IncompleteDownloadError) as e:
+                error = e
+            else:
+                await limiter.healthy()
+                return result
+            finally:
+                await limiter.release()
+
+            attempt += 1
+            if attempt >= MAX_RETRIES:
+                raise error
+            metrics.count_retry()
+            # Full jitter keeps parallel retries from arriving together
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            print(f"⚠️ Attempt {attempt} failed for {description}: {error}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
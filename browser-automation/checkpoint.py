@@ -0,0 +1,70 @@
+"""Per-unit progress saved to a JSON file, so a rerun resumes where a unit stopped.
+
+Each (account, period) moves through SWITCHED -> REQUESTED -> READY ->
+DOWNLOADED. The manifest stays the record of finished downloads; the
+checkpoint adds the steps in between, such as which report a request created,
+and how many attempts failed and why.
+"""
+import os
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+SWITCHED = "switched"
+REQUESTED = "requested"
+READY = "ready"
+DOWNLOADED = "downloaded"
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.units = {}
+        if self.path.exists():
+            try:
+                self.units = json.loads(self.path.read_text())
+            except ValueError:
+                print(f"⚠️ Ignoring unreadable checkpoint {self.path}")
+
+    @staticmethod
+    def key(account, period):
+        return f"{account}|{period}"
+
+    def get(self, account, period):
+        return self.units.get(self.key(account, period), {})
+
+    def advance(self, account, period, state, **data):
+        """Move the unit to `state`; `data` (report id, path, …) is kept with it"""
+        unit = self.units.setdefault(self.key(account, period), {})
+        if state in (SWITCHED, DOWNLOADED):
+            # A new request or a finished download makes the old report id meaningless
+            unit.pop("report_id", None)
+            unit.pop("requested_at", None)
+        if state == REQUESTED:
+            unit["requested_at"] = datetime.now().isoformat(timespec="seconds")
+        unit.update(data, state=state, updated_at=datetime.now().isoformat(timespec="seconds"))
+        self.save()
+
+    def failed(self, account, period, error):
+        """Count a failed attempt; the unit keeps its last state so the next one can resume"""
+        unit = self.units.setdefault(self.key(account, period), {})
+        unit["attempts"] = unit.get("attempts", 0) + 1
+        unit["error"] = str(error).strip().splitlines()[0] if str(error).strip() else type(error).__name__
+        unit.setdefault("state", None)
+        self.save()
+
+    def resumable_report(self, account, period, max_age):
+        """Report id requested earlier and not downloaded yet, unless older than `max_age` seconds"""
+        unit = self.get(account, period)
+        if unit.get("state") not in (REQUESTED, READY) or not unit.get("report_id"):
+            return None
+        requested_at = datetime.fromisoformat(unit["requested_at"])
+        if datetime.now() - requested_at > timedelta(seconds=max_age):
+            return None
+        return unit["report_id"]
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_name(self.path.name + ".tmp")
+        temp.write_text(json.dumps(self.units, indent=2, sort_keys=True))
+        os.replace(temp, self.path)
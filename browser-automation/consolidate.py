@@ -0,0 +1,446 @@
+"""Merge a month's Bol specifications and Amazon transaction reports into one ledger.
+
+    python browser-automation/consolidate.py --period 2025-07 --format parquet
+
+Every input is streamed (openpyxl read-only for XLSX, row by row for CSV) and
+normalized into LEDGER_COLUMNS. The normalized rows of each input are cached
+under its SHA-256, so re-consolidating only parses files that are new or changed.
+"""
+import os
+import re
+import csv
+import sys
+import json
+import hashlib
+import argparse
+import unicodedata
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from dotenv import load_dotenv
+from manifest import Manifest, last_month_period, month_periods
+import metrics
+
+load_dotenv()
+
+LEDGER_DIR = Path(os.getenv("LEDGER_DIR", "ledger"))
+PARTS_DIR = Path(os.getenv("LEDGER_PARTS_DIR", ".cache/ledger_parts"))
+# Rows per write; bounds memory for the Parquet writer
+CHUNK_ROWS = 5_000
+# How far down a sheet/file to look for the header row (Amazon CSVs start with notes)
+HEADER_SCAN_ROWS = 30
+# Bump when normalization changes so cached parts are rebuilt
+PARTS_VERSION = 2
+
+LEDGER_COLUMNS = [
+    "period", "source", "shop", "marketplace", "date", "type", "order_id",
+    "description", "quantity", "amount", "currency", "source_file", "source_row", "raw",
+]
+
+# Normalized column -> header names seen in Bol specifications and in Amazon
+# reports of the EN, NL, DE, FR, IT and ES seller centrals (lower case, no trailing colon)
+HEADER_ALIASES = {
+    "date": {
+        "date/time", "date", "datum", "transactiedatum", "order date", "besteldatum", "posted date",
+        "datum/uhrzeit", "date/heure", "data/ora", "fecha y hora", "fecha/hora",
+    },
+    "type": {"type", "transaction type", "transactietype", "soort", "typ", "tipo"},
+    "order_id": {
+        "order id", "order-id", "order number", "bestelnummer", "ordernummer", "bestellnummer",
+        "numéro de la commande", "numero ordine", "número de pedido",
+    },
+    "description": {
+        "description", "omschrijving", "product", "titel", "product title",
+        "beschreibung", "descrizione", "descripción",
+    },
+    "quantity": {"quantity", "aantal", "menge", "quantité", "quantità", "cantidad"},
+    "amount": {
+        "total", "amount", "bedrag", "totaal", "totaalbedrag", "bedrag incl. btw", "amount incl. vat",
+        "gesamt", "totale",
+    },
+    "currency": {"currency", "valuta", "währung", "devise", "divisa", "moneda"},
+}
+ALIAS_TO_COLUMN = {alias: column for column, aliases in HEADER_ALIASES.items() for alias in aliases}
+
+# Codes picked out of notes lines such as "All amounts in GBP, unless specified"
+CURRENCY_CODES = {
+    "EUR", "GBP", "PLN", "SEK", "DKK", "CZK", "CHF", "TRY", "USD", "CAD", "MXN", "BRL",
+    "JPY", "AUD", "INR", "SGD", "AED", "SAR", "EGP",
+}
+CURRENCY_WORDS = {"euro": "EUR", "€": "EUR", "£": "GBP", "zł": "PLN"}
+# Amazon marketplaces outside the euro area; every other marketplace (and Bol) is in EUR
+MARKETPLACE_CURRENCY = {
+    "united kingdom": "GBP", "poland": "PLN", "sweden": "SEK", "turkey": "TRY", "türkiye": "TRY",
+    "united states": "USD", "canada": "CAD", "mexico": "MXN", "brazil": "BRL", "japan": "JPY",
+    "australia": "AUD", "india": "INR", "singapore": "SGD", "united arab emirates": "AED",
+    "saudi arabia": "SAR", "egypt": "EGP",
+}
+
+# Month names of the report languages, matched by any prefix of at least three letters
+MONTH_NAMES = [
+    ("january", "januari", "januar", "janvier", "gennaio", "enero", "styczen"),
+    ("february", "februari", "februar", "fevrier", "febbraio", "febrero", "luty"),
+    ("march", "maart", "mrt", "marz", "mars", "marzo", "marzec"),
+    ("april", "avril", "aprile", "abril", "kwiecien"),
+    ("may", "mei", "mai", "maggio", "mayo", "maj"),
+    ("june", "juni", "juin", "giugno", "junio", "czerwiec"),
+    ("july", "juli", "juillet", "luglio", "julio", "lipiec"),
+    ("august", "augustus", "augusti", "aout", "agosto", "sierpien"),
+    ("september", "septembre", "settembre", "septiembre", "wrzesien"),
+    ("october", "oktober", "octobre", "ottobre", "octubre", "pazdziernik"),
+    ("november", "novembre", "noviembre", "listopad"),
+    ("december", "dezember", "decembre", "dicembre", "diciembre", "grudzien"),
+]
+TIME_ZONES = {"utc": 0, "gmt": 0, "z": 0, "bst": 1, "cet": 1, "cest": 2, "pst": -8, "pdt": -7, "est": -5, "edt": -4}
+NUMERIC_DATE = re.compile(r"(\d{1,4})[./-](\d{1,2})[./-](\d{1,4})")
+TIME = re.compile(r"(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([ap]\.?m\.?)?", re.I)
+ZONE = re.compile(r"\b(utc|gmt|z|bst|cet|cest|pst|pdt|est|edt)\s*(?:([+-])(\d{1,2})(?::?(\d{2}))?)?\s*$", re.I)
+
+
+def parse_amount(value):
+    """Decimal string from numbers like 1234.5, "1.234,50", "1,234.50", "€ -3,10" or "£12.50" """
+    if value is None or value == "":
+        return ""
+    if isinstance(value, (int, float, Decimal)):
+        return str(Decimal(str(value)))
+    text = re.sub(r"[^\d,.+-]", "", str(value))
+    if "," in text and "." in text:
+        if text.rfind(",") > text.rfind("."):
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "")
+    elif "," in text:
+        text = text.replace(",", ".")
+    try:
+        return str(Decimal(text))
+    except InvalidOperation:
+        return ""
+
+
+def plain(text):
+    """Lower case without accents, for matching month names"""
+    return "".join(c for c in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(c))
+
+
+def month_number(word):
+    word = plain(word).strip(".")
+    if len(word) < 3:
+        return None
+    months = {n for n, names in enumerate(MONTH_NAMES, 1) for name in names if name.startswith(word)}
+    return months.pop() if len(months) == 1 else None
+
+
+def parse_date(value):
+    """ISO 8601 from the date formats of the reports, e.g. "1 Jul 2025 10:00:00 UTC",
+    "01.07.2025 10:00:00 UTC", "1 juil. 2025", "Jul 1, 2025 10:00:00 PM PDT" or "2025-07-01".
+
+    Numeric dates are read day first unless that is impossible. The time (and
+    its offset, when the zone is known) is kept when there is one; "" when the
+    value is not a date.
+    """
+    text = cell_text(value)
+    if not text:
+        return ""
+    try:
+        return (date if len(text) == 10 else datetime).fromisoformat(text).isoformat()
+    except ValueError:
+        pass
+
+    numeric = NUMERIC_DATE.search(text)
+    if numeric:
+        a, b, c = (int(part) for part in numeric.groups())
+        if len(numeric.group(1)) == 4:
+            year, month, day = a, b, c
+        else:
+            day, month, year = (b, a, c) if b > 12 else (a, b, c)
+        rest = text[:numeric.start()] + text[numeric.end():]
+    else:
+        clock = TIME.search(text)
+        words = re.findall(r"[^\W\d_]+|\d+", text[:clock.start()] if clock else text)
+        months = [month_number(word) for word in words if not word.isdigit()]
+        numbers = [int(word) for word in words if word.isdigit()]
+        month = next((m for m in months if m), None)
+        years = [n for n in numbers if n > 31]
+        days = [n for n in numbers if n <= 31]
+        if month is None or len(years) != 1 or not days:
+            return ""
+        year, day = years[0], days[0]
+        rest = text
+    try:
+        parsed = datetime(year if year > 99 else 2000 + year, month, day)
+    except ValueError:
+        return ""
+
+    clock = TIME.search(rest)
+    if not clock:
+        return parsed.date().isoformat()
+    hour, minute, second = int(clock.group(1)), int(clock.group(2)), int(clock.group(3) or 0)
+    meridiem = (clock.group(4) or "").lower().replace(".", "")
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+    try:
+        parsed = parsed.replace(hour=hour, minute=minute, second=second)
+    except ValueError:
+        return parsed.date().isoformat()
+    zone = ZONE.search(rest[clock.end():])
+    if zone:
+        name, sign, hours, minutes = zone.groups()
+        offset = timedelta(hours=TIME_ZONES[name.lower()])
+        if sign:
+            extra = timedelta(hours=int(hours), minutes=int(minutes or 0))
+            offset += extra if sign == "+" else -extra
+        parsed = parsed.replace(tzinfo=timezone(offset))
+    return parsed.isoformat()
+
+
+def notes_currency(rows):
+    """The currency a report's notes lines (the rows above its header) say amounts are in, or None"""
+    for row in rows:
+        text = " ".join(cell_text(value) for value in row)
+        codes = set(re.findall(r"\b[A-Z]{3}\b", text)) & CURRENCY_CODES
+        codes |= {code for word, code in CURRENCY_WORDS.items() if re.search(rf"(?<!\w){re.escape(word)}(?!\w)", text.lower())}
+        if len(codes) == 1:
+            return codes.pop()
+    return None
+
+
+def marketplace_currency(tags):
+    """Currency of the marketplace a file came from, for reports that do not name one"""
+    marketplace = tags.get("marketplace", "").lower()
+    return next((code for name, code in MARKETPLACE_CURRENCY.items() if name in marketplace), "EUR")
+
+
+def header_name(value):
+    return cell_text(value).lower().rstrip(":").strip()
+
+
+def cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value).strip()
+
+
+class UnknownHeaderError(ValueError):
+    """No row near the top of a file names the columns of a known report"""
+
+
+def find_header(rows):
+    """(header, notes rows above it, remaining rows): the first row naming at least two known columns.
+
+    Raises UnknownHeaderError when the first HEADER_SCAN_ROWS rows have content
+    but none of them is a header; (None, [], empty) for a file without content.
+    """
+    scanned = []
+    for row in rows:
+        names = [header_name(value) for value in row]
+        if sum(name in ALIAS_TO_COLUMN for name in names) >= 2:
+            return names, scanned, rows
+        scanned.append(row)
+        if len(scanned) >= HEADER_SCAN_ROWS:
+            break
+    if any(cell_text(value) for row in scanned for value in row):
+        raise UnknownHeaderError(f"no known header in the first {len(scanned)} rows")
+    return None, [], iter(())
+
+
+def normalize(rows, tags):
+    """Yield ledger rows from raw rows; `tags` fills period/source/shop/marketplace/source_file.
+
+    Dates become ISO 8601 and amounts decimals. A row without a currency
+    column gets the one its notes lines name, else its marketplace's.
+    """
+    header, notes, rows = find_header(iter(rows))
+    if header is None:
+        return
+    mapping = {index: ALIAS_TO_COLUMN[name] for index, name in enumerate(header) if name in ALIAS_TO_COLUMN}
+    missing = {"date", "amount"} - set(mapping.values())
+    if missing:
+        print(f"⚠️ {tags.get('source_file', 'input')}: no {' or '.join(sorted(missing))} column in its header")
+    currency = notes_currency(notes) or marketplace_currency(tags)
+    for number, row in enumerate(rows, 1):
+        values = [cell_text(value) for value in row]
+        if not any(values):
+            continue
+        record = dict(tags, source_row=number)
+        for index, column in mapping.items():
+            if index < len(values) and column not in record:
+                record[column] = values[index]
+        record["date"] = parse_date(record.get("date"))
+        record["amount"] = parse_amount(record.get("amount"))
+        record["currency"] = record.get("currency") or currency
+        record["raw"] = json.dumps(
+            {name or f"column_{i}": value for i, (name, value) in enumerate(zip(header, values)) if value},
+            ensure_ascii=False,
+        )
+        yield [record.get(column, "") for column in LEDGER_COLUMNS]
+
+
+def read_xlsx(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("openpyxl is needed to read Bol specifications (pip install openpyxl)")
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(f, dialect)
+
+
+def entry_tags(row, period):
+    if row["source"] == "amazon":
+        shop, marketplace = "", row["account"]
+    else:
+        shop, marketplace = row["account"], f"{row['source']}.com"
+    return {
+        "period": period,
+        "source": row["source"],
+        "shop": shop,
+        "marketplace": marketplace,
+        "source_file": Path(row["path"]).name,
+    }
+
+
+def build_part(row, period):
+    """Normalized rows of one input, cached by content hash and tags; returns (part path, parsed?)"""
+    tags = entry_tags(row, period)
+    key = hashlib.sha256(json.dumps([PARTS_VERSION, row["sha256"], tags], sort_keys=True).encode()).hexdigest()
+    part = PARTS_DIR / period / f"{key}.csv"
+    if part.exists():
+        return part, False
+    path = Path(row["path"])
+    reader = read_xlsx(path) if path.suffix.lower() in (".xlsx", ".xlsm") else read_csv(path)
+    part.parent.mkdir(parents=True, exist_ok=True)
+    temp = part.with_suffix(".csv.part")
+    with open(temp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(LEDGER_COLUMNS)
+        for record in normalize(reader, tags):
+            writer.writerow(record)
+    os.replace(temp, part)
+    return part, True
+
+
+def part_rows(parts):
+    for part in parts:
+        with open(part, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from reader
+
+
+def write_csv(parts, target):
+    with open(target, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(LEDGER_COLUMNS)
+        for record in part_rows(parts):
+            writer.writerow(record)
+
+
+def write_parquet(parts, target):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("pyarrow is needed for Parquet output (pip install pyarrow), or use --format csv")
+    schema = pa.schema([(column, pa.string()) for column in LEDGER_COLUMNS])
+    with pq.ParquetWriter(target, schema, compression="zstd") as writer:
+        chunk = []
+        for record in part_rows(parts):
+            chunk.append(record)
+            if len(chunk) >= CHUNK_ROWS:
+                writer.write_batch(batch(pa, schema, chunk))
+                chunk = []
+        if chunk:
+            writer.write_batch(batch(pa, schema, chunk))
+
+
+def batch(pa, schema, rows):
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays([pa.array(column, pa.string()) for column in columns], schema=schema)
+
+
+def consolidate(period, fmt="csv", manifest=None):
+    """Write `ledger/ledger_<period>.<fmt>` from the period's downloads; returns its path or None"""
+    own_manifest = manifest is None
+    manifest = manifest or Manifest()
+    try:
+        entries = manifest.entries(period=period)
+    finally:
+        if own_manifest:
+            manifest.close()
+
+    with metrics.span("ledger.consolidate", period=period, format=fmt) as span:
+        parts, parsed, skipped = [], 0, 0
+        for row in entries:
+            if not row["sha256"] or not Path(row["path"]).exists():
+                continue
+            try:
+                part, built = build_part(row, period)
+            except Exception as e:
+                print(f"⚠️ Could not read {row['path']} for the ledger: {e}")
+                skipped += 1
+                continue
+            parts.append(part)
+            parsed += built
+
+        # Parts of files that were replaced or removed since the last run
+        for stale in set((PARTS_DIR / period).glob("*.csv")) - set(parts):
+            stale.unlink(missing_ok=True)
+
+        if not parts:
+            print(f"ℹ️ Nothing to consolidate for {period}.")
+            return None
+
+        LEDGER_DIR.mkdir(parents=True, exist_ok=True)
+        target = LEDGER_DIR / f"ledger_{period}.{fmt}"
+        state_path = LEDGER_DIR / f".ledger_{period}.{fmt}.json"
+        state = {"parts": sorted(part.name for part in parts)}
+        if target.exists() and state_path.exists() and json.loads(state_path.read_text()) == state:
+            print(f"⏭️ Ledger {target} is up to date.")
+            span.set(inputs=len(parts), parsed=0, skipped=skipped)
+            return target
+
+        temp = target.with_name(target.name + ".part")
+        (write_parquet if fmt == "parquet" else write_csv)(parts, temp)
+        os.replace(temp, target)
+        state_path.write_text(json.dumps(state))
+        span.set(inputs=len(parts), parsed=parsed, skipped=skipped)
+        span.add_bytes(target.stat().st_size)
+        print(f"📒 Ledger written: {target} ({len(parts)} files, {parsed} parsed, {skipped} skipped)")
+        return target
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consolidate downloaded reports into a monthly ledger")
+    parser.add_argument("--period", help="month to consolidate (YYYY-MM, default last month)")
+    parser.add_argument("--from", dest="start", help="first month of a range")
+    parser.add_argument("--to", dest="end", help="last month of a range (default last month; alone: only that month)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args(argv)
+
+    if args.start or args.end:
+        periods = month_periods(args.start or args.end, args.end or last_month_period())
+    else:
+        periods = [args.period or last_month_period()]
+    with Manifest() as manifest:
+        for period in periods:
+            consolidate(period, args.format, manifest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import zipfile
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "ring": keep the last N DOM snapshots in memory, write them only on failure.
+# "trace": additionally record a Playwright trace per context, kept only on failure.
+# "off": no step snapshots; failures still get a screenshot and the page HTML.
+MODE = os.getenv("AMAZON_DEBUG", "ring").lower()
+SNAPSHOTS = int(os.getenv("AMAZON_DEBUG_SNAPSHOTS", 10))
+OUTPUT_DIR = Path(os.getenv("AMAZON_DEBUG_DIR", "."))
+
+
+class DebugRecorder:
+    """Cheap step-by-step diagnostics that only hit the disk when something fails.
+
+    `step()` stores the URL and HTML of the page in a per-page ring buffer.
+    `failure()` adds a screenshot and the current buffer for a failed step.
+    `save()` writes everything collected into one compressed
+    `debug_<name>_<timestamp>.zip`, or nothing at all if no step failed.
+    """
+
+    def __init__(self, name, mode=MODE, size=SNAPSHOTS, output_dir=OUTPUT_DIR):
+        self.name = name
+        self.mode = mode
+        self.size = size
+        self.rings = {}
+        self.failures = []
+        self.traces = []
+        self.output_dir = Path(output_dir)
+        self.started = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    def _ring(self, page):
+        return self.rings.setdefault(id(page), deque(maxlen=self.size))
+
+    async def step(self, page, step, **meta):
+        entry = {"step": step, "time": time.time(), "meta": meta}
+        if self.mode != "off":
+            try:
+                entry["url"] = page.url
+                entry["html"] = await page.content()
+            except Exception as e:
+                entry["error"] = f"snapshot failed: {e}"
+        self._ring(page).append(entry)
+
+    async def failure(self, page, step, error):
+        print(f"🧾 Capturing debug state for failed step: {step}")
+        entry = {
+            "step": step,
+            "time": time.time(),
+            "error": repr(error),
+            "history": list(self._ring(page)) if page is not None else [],
+        }
+        if page is not None:
+            try:
+                entry["url"] = page.url
+                entry["html"] = await page.content()
+                entry["screenshot"] = await page.screenshot(full_page=True)
+            except Exception as e:
+                entry["capture_error"] = repr(e)
+        self.failures.append(entry)
+
+    async def start_tracing(self, context):
+        if self.mode == "trace":
+            await context.tracing.start(screenshots=True, snapshots=True)
+
+    async def stop_tracing(self, context, label):
+        """Keep the trace only if something has failed by now"""
+        if self.mode != "trace":
+            return
+        try:
+            if self.failures:
+                path = self.output_dir / f"debug_{self.name}_trace_{label}_{self.started}.zip"
+                await context.tracing.stop(path=path)
+                self.traces.append(path)
+                print(f"🧵 Trace saved: {path}")
+            else:
+                await context.tracing.stop()
+        except Exception as e:
+            print(f"⚠️ Could not stop tracing: {e}")
+
+    def save(self):
+        if not self.failures:
+            return None
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        path = self.output_dir / f"debug_{self.name}_{self.started}.zip"
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+            summary = []
+            for n, failure in enumerate(self.failures, 1):
+                prefix = f"{n:02d}_{slug(failure['step'])}"
+                if "screenshot" in failure:
+                    # PNGs are already compressed
+                    bundle.writestr(f"{prefix}/screenshot.png", failure["screenshot"], zipfile.ZIP_STORED)
+                if "html" in failure:
+                    bundle.writestr(f"{prefix}/page.html", failure["html"])
+                for i, step in enumerate(failure["history"], 1):
+                    if "html" in step:
+                        bundle.writestr(f"{prefix}/steps/{i:02d}_{slug(step['step'])}.html", step["html"])
+                summary.append({
+                    "step": failure["step"],
+                    "error": failure["error"],
+                    "url": failure.get("url"),
+                    "capture_error": failure.get("capture_error"),
+                    "history": [
+                        {key: value for key, value in step.items() if key != "html"}
+                        for step in failure["history"]
+                    ],
+                })
+            bundle.writestr("summary.json", json.dumps(summary, indent=2, default=str))
+        print(f"🗜️ Debug bundle saved: {path} ({path.stat().st_size // 1024} kB)")
+        return path
+
+
+def slug(text):
+    return "".join(c if c.isalnum() else "_" for c in str(text))[:60]
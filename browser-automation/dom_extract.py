@@ -0,0 +1,69 @@
+"""Read whole lists of elements in one round trip to the browser.
+
+Every `inner_text()` or `get_attribute()` on a locator is a separate IPC call
+to Chromium. These helpers read label, state and index for every element a
+locator matches with a single `evaluate_all`, so a loop over N buttons or rows
+costs one call; the caller then acts on `locator.nth(item["index"])`.
+"""
+
+# label: innerText of the element (or of its first `labelSelector` descendant)
+ITEMS_JS = """
+(elements, labelSelector) => elements.map((element, index) => {
+    const labelElement = labelSelector ? element.querySelector(labelSelector) : element;
+    const text = labelElement ? (labelElement.innerText || labelElement.textContent || "") : "";
+    return {
+        index,
+        label: text.replace(/\\s+/g, " ").trim(),
+        className: element.getAttribute("class") || "",
+        disabled: !!element.disabled || element.getAttribute("aria-disabled") === "true",
+        visible: element.getClientRects().length > 0,
+    };
+})
+"""
+
+# Labels of every `optionSelector` inside each matched element (e.g. dropdown options),
+# including options inside open shadow roots as Katal components render them
+OPTIONS_JS = """
+(elements, optionSelector) => {
+    const deepQuery = (root, selector) => {
+        const found = [...root.querySelectorAll(selector)];
+        for (const host of [root, ...root.querySelectorAll("*")]) {
+            if (host.shadowRoot) found.push(...deepQuery(host.shadowRoot, selector));
+        }
+        return found;
+    };
+    return elements.map((element, index) => ({
+        index,
+        options: deepQuery(element, optionSelector).map(
+            option => (option.innerText || option.textContent || "").replace(/\\s+/g, " ").trim()
+        ),
+    }));
+}
+"""
+
+
+async def items(locator, label_selector=None):
+    """[{"index", "label", "className", "disabled", "visible"}] for every element `locator` matches"""
+    return await locator.evaluate_all(ITEMS_JS, label_selector)
+
+
+async def options(locator, option_selector):
+    """[{"index", "options": [labels]}] for every element `locator` matches"""
+    return await locator.evaluate_all(OPTIONS_JS, option_selector)
+
+
+def find(found, label, key=None):
+    """First item whose label equals `label` (case-insensitive; `key` normalizes both sides)"""
+    key = key or (lambda text: text.strip().lower())
+    wanted = key(label)
+    return next((item for item in found if key(item["label"]) == wanted), None)
+
+
+def find_option(found, label, contains=False):
+    """(element index, option label) of the first element offering `label`, or None"""
+    wanted = label.strip().lower()
+    for element in found:
+        for option in element["options"]:
+            if option.lower() == wanted or (contains and wanted in option.lower()):
+                return element["index"], option
+    return None
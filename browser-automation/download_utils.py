@@ -0,0 +1,131 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+
+CHUNK_SIZE = 64 * 1024
+PART_SUFFIX = ".part"
+SIDECAR_SUFFIX = ".meta.json"
+
+
+class IncompleteDownloadError(IOError):
+    """The connection closed before the advertised Content-Length arrived"""
+
+
+def part_path(target):
+    target = Path(target)
+    return target.with_name(target.name + PART_SUFFIX)
+
+
+def sidecar_path(target):
+    target = Path(target)
+    return target.with_name(target.name + SIDECAR_SUFFIX)
+
+
+def is_auxiliary_file(path):
+    """True for in-progress downloads and sidecars, which are never reports themselves"""
+    name = Path(path).name
+    return name.endswith(PART_SUFFIX) or name.endswith(SIDECAR_SUFFIX)
+
+
+def write_sidecar(target, size, sha256):
+    data = {"size": size, "sha256": sha256}
+    tmp = sidecar_path(target).with_name(sidecar_path(target).name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, sidecar_path(target))
+    return data
+
+
+def read_sidecar(target):
+    """Return the recorded size/sha256 for a file, or None if there is no sidecar"""
+    try:
+        with open(sidecar_path(target), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def verify_file(target):
+    """Cheap integrity check: file exists and its size matches the sidecar"""
+    meta = read_sidecar(target)
+    if meta is None:
+        return False
+    try:
+        return Path(target).stat().st_size == meta["size"]
+    except OSError:
+        return False
+
+
+def _hash_existing(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha
+
+
+async def stream_download(client, url, target, headers=None, resume=False):
+    """Stream a GET response to `target` through a `.part` file.
+
+    The part file is renamed over the target only once the body is complete,
+    so a crash never leaves a truncated report behind. With `resume=True` an
+    existing part file is continued with an HTTP Range request; servers that
+    ignore the range simply send the whole body again. Writes a size/SHA-256
+    sidecar next to the file and returns its contents.
+    """
+    target = Path(target)
+    part = part_path(target)
+    headers = dict(headers or {})
+
+    offset = 0
+    if resume and part.exists():
+        offset = part.stat().st_size
+    elif part.exists():
+        part.unlink()
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+
+    async with client.stream("GET", url, headers=headers) as response:
+        resumed = bool(offset) and response.status_code == 206 and response.headers.get(
+            "content-range", ""
+        ).startswith(f"bytes {offset}-")
+        if response.status_code == 206 and "Range" not in headers:
+            raise IncompleteDownloadError(f"Unrequested partial response for {target.name}")
+        if response.status_code == 416 or (response.status_code == 206 and not resumed):
+            # Our part file is already complete, no longer matches, or the server
+            # answered a different range than we asked for; start over
+            part.unlink(missing_ok=True)
+            await response.aclose()
+            return await stream_download(client, url, target, headers={
+                k: v for k, v in headers.items() if k != "Range"
+            })
+        response.raise_for_status()
+
+        if resumed:
+            sha = _hash_existing(part)
+            mode = "ab"
+            print(f"⏯️ Resuming {target.name} from byte {offset}")
+        else:
+            sha = hashlib.sha256()
+            offset = 0
+            mode = "wb"
+
+        # Content-Length counts encoded bytes, so it is only comparable for identity bodies
+        expected = None
+        if "content-encoding" not in response.headers:
+            expected = response.headers.get("content-length")
+        received = 0
+        with open(part, mode) as f:
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                f.write(chunk)
+                sha.update(chunk)
+                received += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+    if expected is not None and received != int(expected):
+        raise IncompleteDownloadError(f"Incomplete body for {target.name}: {received}/{expected} bytes")
+
+    os.replace(part, target)
+    return write_sidecar(target, offset + received, sha.hexdigest())
@@ -0,0 +1,159 @@
+import os
+import hashlib
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MANIFEST_PATH = Path(os.getenv("MANIFEST_PATH", ".cache/manifest.sqlite"))
+
+DOWNLOADED = "downloaded"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    source      TEXT NOT NULL,
+    account     TEXT NOT NULL,
+    period      TEXT NOT NULL,
+    item_id     TEXT NOT NULL,
+    path        TEXT,
+    sha256      TEXT,
+    size        INTEGER,
+    fingerprint TEXT,
+    status      TEXT NOT NULL,
+    error       TEXT,
+    updated_at  TEXT NOT NULL,
+    PRIMARY KEY (source, account, period, item_id)
+)
+"""
+
+
+def last_month_period():
+    """Period key ("YYYY-MM") of the previous calendar month"""
+    first_of_this_month = datetime.today().replace(day=1)
+    return (first_of_this_month - timedelta(days=1)).strftime("%Y-%m")
+
+
+def month_periods(start, end):
+    """Period keys of every month from `start` to `end` inclusive ("YYYY-MM" or "YYYY-MM-DD")"""
+    year, month = int(start[:4]), int(start[5:7])
+    last = (int(end[:4]), int(end[5:7]))
+    if (year, month) > last:
+        raise ValueError(f"Backfill range starts after it ends: {start} > {end}")
+    periods = []
+    while (year, month) <= last:
+        periods.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return periods
+
+
+def period_bounds(period):
+    """First and last day ("YYYY-MM-DD") of a period key"""
+    first = datetime.strptime(period, "%Y-%m")
+    next_month = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return first.strftime("%Y-%m-%d"), (next_month - timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def file_digest(path):
+    """(sha256, size) of a file, read in chunks"""
+    sha = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            sha.update(chunk)
+            size += len(chunk)
+    return sha.hexdigest(), size
+
+
+class Manifest:
+    """Record of every report this project has downloaded.
+
+    Rows are keyed by (source, account, period, item_id) and store where the
+    file lives, its content hash and size, and whether the download finished.
+    `fingerprint` is an optional caller-defined summary of the upstream
+    listing entry, so a changed invoice is fetched again.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, source, account, period, item_id):
+        return self.conn.execute(
+            "SELECT * FROM downloads WHERE source=? AND account=? AND period=? AND item_id=?",
+            (source, account, period, item_id),
+        ).fetchone()
+
+    def is_complete(self, source, account, period, item_id, fingerprint=None):
+        """True if the item was downloaded, is still on disk and has not changed upstream"""
+        row = self.get(source, account, period, item_id)
+        if row is None or row["status"] != DOWNLOADED:
+            return False
+        if fingerprint is not None and row["fingerprint"] != fingerprint:
+            return False
+        try:
+            return Path(row["path"]).stat().st_size == row["size"]
+        except (OSError, TypeError):
+            return False
+
+    def record(self, source, account, period, item_id, path, sha256=None, size=None, fingerprint=None):
+        if sha256 is None:
+            sha256, size = file_digest(path)
+        self._upsert(source, account, period, item_id, {
+            "path": str(path),
+            "sha256": sha256,
+            "size": size,
+            "fingerprint": fingerprint,
+            "status": DOWNLOADED,
+            "error": None,
+        })
+
+    def mark_failed(self, source, account, period, item_id, error):
+        self._upsert(source, account, period, item_id, {
+            "status": FAILED,
+            "error": str(error),
+        })
+
+    def _upsert(self, source, account, period, item_id, fields):
+        fields = dict(fields, updated_at=datetime.now().isoformat(timespec="seconds"))
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        updates = ", ".join(f"{column}=excluded.{column}" for column in fields)
+        self.conn.execute(
+            f"INSERT INTO downloads (source, account, period, item_id, {columns}) "
+            f"VALUES (?, ?, ?, ?, {placeholders}) "
+            f"ON CONFLICT (source, account, period, item_id) DO UPDATE SET {updates}",
+            (source, account, period, item_id, *fields.values()),
+        )
+        self.conn.commit()
+
+    def entries(self, period=None, status=DOWNLOADED, source=None):
+        query = "SELECT * FROM downloads WHERE status=?"
+        params = [status]
+        if period is not None:
+            query += " AND period=?"
+            params.append(period)
+        if source is not None:
+            query += " AND source=?"
+            params.append(source)
+        return self.conn.execute(query + " ORDER BY source, account, item_id", params).fetchall()
+
+    def files(self, period=None, source=None):
+        """Paths of completed downloads that still exist on disk"""
+        paths = [Path(row["path"]) for row in self.entries(period=period, source=source)]
+        return [path for path in paths if path.exists()]
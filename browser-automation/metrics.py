@@ -0,0 +1,200 @@
+"""Span-based run metrics written as JSON lines, plus a CLI to compare two runs.
+
+    python browser-automation/metrics.py list
+    python browser-automation/metrics.py show  <run.jsonl>
+    python browser-automation/metrics.py compare <before.jsonl> <after.jsonl>
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import inspect
+import argparse
+import functools
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_DIR = Path(os.getenv("METRICS_DIR", ".cache/metrics"))
+RUN_ID = os.getenv("METRICS_RUN_ID") or datetime.now().strftime("%Y%m%d_%H%M%S")
+ENABLED = os.getenv("METRICS", "1").lower() not in ("0", "false", "no")
+
+_current = contextvars.ContextVar("metrics_span", default=None)
+
+
+class Span:
+    def __init__(self, name, attrs):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs = dict(attrs)
+        self.bytes = 0
+        self.retries = 0
+        self.outcome = "ok"
+        self.error = None
+        parent = _current.get()
+        self.parent = parent.id if parent else None
+
+    def add_bytes(self, count):
+        self.bytes += count or 0
+
+    def retry(self):
+        self.retries += 1
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+def run_file():
+    return METRICS_DIR / f"{RUN_ID}.jsonl"
+
+
+def _write(record):
+    if not ENABLED:
+        return
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    with open(run_file(), "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a stage; the span is current for everything awaited inside it"""
+    current = Span(name, attrs)
+    token = _current.set(current)
+    started_at = time.time()
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.outcome = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+        current.error = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        _current.reset(token)
+        _write({
+            "run": RUN_ID,
+            "span": current.name,
+            "id": current.id,
+            "parent": current.parent,
+            "start": started_at,
+            "duration": round(time.perf_counter() - started, 4),
+            "bytes": current.bytes,
+            "retries": current.retries,
+            "outcome": current.outcome,
+            "error": current.error,
+            **current.attrs,
+        })
+
+
+def current():
+    """The innermost open span, or None outside any span"""
+    return _current.get()
+
+
+def add_bytes(count):
+    if _current.get():
+        _current.get().add_bytes(count)
+
+
+def count_retry():
+    if _current.get():
+        _current.get().retry()
+
+
+def instrument(name):
+    """Decorator wrapping every call of a sync or async function in a span"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# === CLI ===
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def aggregate(records):
+    stats = {}
+    for record in records:
+        entry = stats.setdefault(record["span"], {
+            "count": 0, "total": 0.0, "max": 0.0, "bytes": 0, "retries": 0, "errors": 0, "durations": [],
+        })
+        entry["count"] += 1
+        entry["total"] += record["duration"]
+        entry["max"] = max(entry["max"], record["duration"])
+        entry["bytes"] += record.get("bytes") or 0
+        entry["retries"] += record.get("retries") or 0
+        entry["errors"] += record.get("outcome") == "error"
+        entry["durations"].append(record["duration"])
+    for entry in stats.values():
+        durations = sorted(entry.pop("durations"))
+        entry["p50"] = durations[len(durations) // 2]
+    return stats
+
+
+def show(path):
+    stats = aggregate(load(path))
+    print(f"{'span':45} {'count':>6} {'total s':>9} {'p50 s':>8} {'max s':>8} {'MB':>8} {'retries':>8} {'errors':>7}")
+    for name, s in sorted(stats.items(), key=lambda item: item[1]["total"], reverse=True):
+        print(
+            f"{name[:45]:45} {s['count']:>6} {s['total']:>9.1f} {s['p50']:>8.2f} {s['max']:>8.1f} "
+            f"{s['bytes'] / 1e6:>8.2f} {s['retries']:>8} {s['errors']:>7}"
+        )
+
+
+def compare(before_path, after_path):
+    before = aggregate(load(before_path))
+    after = aggregate(load(after_path))
+    print(f"{'span':45} {'before s':>9} {'after s':>9} {'delta':>8} {'count':>11} {'retries':>11} {'errors':>9}")
+    names = sorted(set(before) | set(after), key=lambda n: -max(before.get(n, {}).get("total", 0), after.get(n, {}).get("total", 0)))
+    empty = {"total": 0.0, "count": 0, "retries": 0, "errors": 0}
+    for name in names:
+        b, a = before.get(name, empty), after.get(name, empty)
+        delta = f"{(a['total'] - b['total']) / b['total'] * 100:+.0f}%" if b["total"] else "new"
+        print(
+            f"{name[:45]:45} {b['total']:>9.1f} {a['total']:>9.1f} {delta:>8} "
+            f"{b['count']:>5}→{a['count']:<5} {b['retries']:>5}→{a['retries']:<5} {b['errors']:>4}→{a['errors']:<4}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and compare run metrics")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list recorded runs")
+    show_parser = commands.add_parser("show", help="summarize one run")
+    show_parser.add_argument("run")
+    compare_parser = commands.add_parser("compare", help="compare two runs")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for path in sorted(METRICS_DIR.glob("*.jsonl")):
+            print(path)
+    elif args.command == "show":
+        show(args.run)
+    else:
+        compare(args.before, args.after)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
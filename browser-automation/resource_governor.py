@@ -0,0 +1,143 @@
+"""Keeps a long browser run's memory flat by recycling pages and contexts.
+
+After every unit the governor counts the unit against the page's context and
+samples the memory of the Chromium processes (read from /proc) and the page's
+JS heap. Once a context has served AMAZON_RECYCLE_AFTER units, or the browser
+or the page's heap grows past AMAZON_MAX_RSS_MB / AMAZON_MAX_JS_HEAP_MB, the
+caller replaces the context with a fresh one built from the authenticated
+storage_state. Peak values are printed at the end of the run.
+"""
+import os
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+MB = 1024 * 1024
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+HEAP_JS = "() => performance.memory ? performance.memory.usedJSHeapSize : null"
+
+
+def process_tree():
+    """pid -> (parent pid, command line) for every process /proc lists; {} where there is no /proc"""
+    processes = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return processes
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # "pid (comm) state ppid …"; comm may contain spaces and parentheses
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read().replace(b"\0", b" ").decode(errors="replace")
+        except (OSError, IndexError, ValueError):
+            continue  # exited while we were looking
+        processes[int(entry)] = (parent, cmdline)
+    return processes
+
+
+def rss(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def browser_memory(root=None):
+    """(total RSS, largest renderer RSS) in bytes of the Chromium processes started below `root`.
+
+    Playwright's driver starts the browser, which starts the GPU, network and
+    renderer processes; all of them are descendants of this Python process.
+    Returns (None, None) where /proc is not available.
+    """
+    processes = process_tree()
+    if not processes:
+        return None, None
+    children = {}
+    for pid, (parent, _) in processes.items():
+        children.setdefault(parent, []).append(pid)
+    total = renderer = 0
+    pending = list(children.get(root or os.getpid(), []))
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        cmdline = processes[pid][1]
+        if "chrom" not in cmdline.lower() and "headless_shell" not in cmdline:
+            continue  # the Playwright driver itself
+        size = rss(pid)
+        total += size
+        if "--type=renderer" in cmdline:
+            renderer = max(renderer, size)
+    return total, renderer
+
+
+async def js_heap(page):
+    """Used JS heap of `page` in bytes, or None if the page cannot tell right now"""
+    try:
+        return await page.evaluate(HEAP_JS)
+    except Exception:
+        return None
+
+
+class ResourceGovernor:
+    """Decides when a browser context has done enough work to be replaced, and tracks peak memory"""
+
+    def __init__(self, recycle_after=0, max_rss_mb=0, max_heap_mb=0):
+        self.recycle_after = recycle_after
+        self.max_rss = max_rss_mb * MB
+        self.max_heap = max_heap_mb * MB
+        self.units = {}
+        self.recycled = 0
+        self.peak_rss = self.peak_renderer = self.peak_heap = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            int(os.getenv("AMAZON_RECYCLE_AFTER", 8)),
+            int(os.getenv("AMAZON_MAX_RSS_MB", 1500)),
+            int(os.getenv("AMAZON_MAX_JS_HEAP_MB", 300)),
+        )
+
+    async def check(self, page):
+        """Count a finished unit on `page`'s context; returns why it should be recycled, or None"""
+        context = page.context
+        self.units[context] = self.units.get(context, 0) + 1
+        total, renderer = browser_memory()
+        heap = await js_heap(page)
+        self.peak_rss = max(self.peak_rss, total or 0)
+        self.peak_renderer = max(self.peak_renderer, renderer or 0)
+        self.peak_heap = max(self.peak_heap, heap or 0)
+        span = metrics.current()
+        if span is not None:
+            span.set(
+                browser_rss_mb=round(total / MB) if total is not None else None,
+                js_heap_mb=round(heap / MB) if heap is not None else None,
+            )
+
+        if self.recycle_after and self.units[context] >= self.recycle_after:
+            return f"{self.units[context]} units done"
+        if self.max_rss and total and total > self.max_rss:
+            return f"browser RSS {total / MB:.0f} MB > {self.max_rss / MB:.0f} MB"
+        if self.max_heap and heap and heap > self.max_heap:
+            return f"JS heap {heap / MB:.0f} MB > {self.max_heap / MB:.0f} MB"
+        return None
+
+    def forget(self, context, recycled=False):
+        """Stop counting a context that was closed (`recycled`: closed because `check` said so)"""
+        self.units.pop(context, None)
+        self.recycled += recycled
+
+    def report(self):
+        if not self.peak_rss and not self.peak_heap:
+            return
+        print(
+            f"🧠 Peak browser RSS {self.peak_rss / MB:.0f} MB "
+            f"(largest renderer {self.peak_renderer / MB:.0f} MB), "
+            f"peak JS heap {self.peak_heap / MB:.0f} MB, {self.recycled} contexts recycled"
+        )
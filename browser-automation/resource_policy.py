@@ -0,0 +1,153 @@
+import os
+import re
+from collections import Counter
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Categories blocked unless AMAZON_BLOCK says otherwise. Seller Central works
+# without any of these; stylesheets and scripts are left alone because the
+# report page's controls need them.
+DEFAULT_CATEGORIES = "images,fonts,media,beacons,analytics"
+
+RESOURCE_TYPES = {
+    "images": {"image"},
+    "fonts": {"font"},
+    "media": {"media"},
+    "beacons": {"ping"},
+}
+# Only requests whose URL can belong to a blocked category are routed through
+# Python at all; for the resource-type categories that means these extensions
+EXTENSIONS = {
+    "images": "png|jpe?g|gif|webp|avif|svg|ico",
+    "fonts": "woff2?|ttf|otf|eot",
+    "media": "mp4|webm|m4a|mp3|ogg|wav",
+}
+
+URL_PATTERNS = {
+    "analytics": [
+        r"google-analytics\.com",
+        r"googletagmanager\.com",
+        r"doubleclick\.net",
+        r"fls-(na|eu|fe)\.amazon\.",
+        r"unagi(-na|-eu)?\.amazon\.",
+        r"/uedata",
+        r"/csm/",
+        r"cloudfront\.net/.*(clog|metrics)",
+        r"/1/batch/1/OE/",
+    ],
+    "beacons": [
+        r"/gp/mobile/beacon",
+        r"/rd/uedata",
+    ],
+}
+
+# Typical transfer sizes, used only to estimate bytes saved for requests we never sent
+ESTIMATED_BYTES = {
+    "image": 15_000,
+    "font": 40_000,
+    "media": 200_000,
+    "script": 30_000,
+    "ping": 500,
+    "xhr": 2_000,
+    "fetch": 2_000,
+}
+FIRST_PARTY_DOMAINS = r"(amazon\.[a-z.]+|media-amazon\.com|ssl-images-amazon\.com|amazonaws\.com)"
+FIRST_PARTY = re.compile(rf"(^|\.){FIRST_PARTY_DOMAINS}$")
+# Any URL whose host is not one of FIRST_PARTY_DOMAINS (written so the browser side can match it too)
+THIRD_PARTY_URL = rf"^[a-z][a-z0-9+.-]*://(?!([^/?#@]*\.)?{FIRST_PARTY_DOMAINS}(:\d+)?([/?#]|$))"
+
+
+class ResourcePolicy:
+    """Decides per request whether the browser may fetch it, and counts what was blocked.
+
+    Categories: images, fonts, media, beacons, analytics and third_party (any
+    host that is not Amazon's). Extra regular expressions can be blocked as
+    the "custom" category.
+
+    The context only routes URLs matching `url_pattern`, one regular
+    expression built from the enabled categories; every other request goes
+    straight to the network without a round trip to Python. Images, fonts
+    and media are therefore only blocked when their URL has a known extension.
+    """
+
+    def __init__(self, categories, extra_patterns=()):
+        self.categories = set(categories)
+        self.patterns = [
+            (category, re.compile(pattern))
+            for category, patterns in URL_PATTERNS.items()
+            if category in self.categories
+            for pattern in patterns
+        ] + [("custom", re.compile(pattern)) for pattern in extra_patterns]
+        self.url_pattern = self.build_url_pattern(extra_patterns)
+        self.blocked = Counter()
+        self.estimated_bytes = Counter()
+        self.allowed = 0
+
+    def build_url_pattern(self, extra_patterns):
+        """One case-insensitive regex matching every URL a request of an enabled category can have"""
+        parts = [
+            rf"\.({EXTENSIONS[category]})([?#]|$)" for category in sorted(self.categories) if category in EXTENSIONS
+        ]
+        parts += [
+            pattern for category, patterns in URL_PATTERNS.items() if category in self.categories for pattern in patterns
+        ]
+        parts += list(extra_patterns)
+        if "third_party" in self.categories:
+            parts.append(THIRD_PARTY_URL)
+        return re.compile("|".join(f"({part})" for part in parts), re.I) if parts else None
+
+    @classmethod
+    def from_env(cls):
+        value = os.getenv("AMAZON_BLOCK", DEFAULT_CATEGORIES).strip().lower()
+        categories = [] if value in ("", "none") else [c.strip() for c in value.split(",")]
+        extra = [p for p in os.getenv("AMAZON_BLOCK_URLS", "").split(",") if p.strip()]
+        return cls(categories, extra)
+
+    @property
+    def enabled(self):
+        return self.url_pattern is not None
+
+    def classify(self, request):
+        """Category that blocks this request, or None to let it through"""
+        if request.is_navigation_request():
+            return None
+        for category, types in RESOURCE_TYPES.items():
+            if category in self.categories and request.resource_type in types:
+                return category
+        for category, pattern in self.patterns:
+            if pattern.search(request.url):
+                return category
+        if "third_party" in self.categories:
+            host = urlparse(request.url).hostname or ""
+            if host and not FIRST_PARTY.search(host):
+                return "third_party"
+        return None
+
+    async def handle(self, route):
+        request = route.request
+        category = self.classify(request)
+        if category is None:
+            self.allowed += 1
+            await route.continue_()
+            return
+        self.blocked[category] += 1
+        self.estimated_bytes[category] += ESTIMATED_BYTES.get(request.resource_type, 1_000)
+        await route.abort("blockedbyclient")
+
+    async def install(self, context):
+        if self.enabled:
+            await context.route(self.url_pattern, self.handle)
+
+    def report(self):
+        if not self.enabled:
+            return
+        total = sum(self.blocked.values())
+        # The estimate only guesses the transfer avoided; benchmarks/run.py blocking measures the time
+        print(
+            f"🚫 Blocked {total} of {total + self.allowed} routed requests, "
+            f"~{sum(self.estimated_bytes.values()) / 1_000_000:.1f} MB not downloaded (estimated)"
+        )
+        for category, count in self.blocked.most_common():
+            print(f"   {category}: {count} requests, ~{self.estimated_bytes[category] / 1_000:.0f} kB")
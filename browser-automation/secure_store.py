@@ -0,0 +1,44 @@
+import os
+import json
+from pathlib import Path
+
+
+class EncryptedJSONFile:
+    """JSON document stored on disk encrypted with a Fernet key"""
+
+    def __init__(self, path, key):
+        from cryptography.fernet import Fernet
+
+        self.path = Path(path)
+        self.fernet = Fernet(key)
+
+    def load(self, default=None):
+        try:
+            return json.loads(self.fernet.decrypt(self.path.read_bytes()))
+        except FileNotFoundError:
+            return default
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable encrypted file {self.path}: {e!r}")
+            return default
+
+    def save(self, data):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_bytes(self.fernet.encrypt(json.dumps(data).encode()))
+        os.replace(tmp, self.path)
+
+    def delete(self):
+        self.path.unlink(missing_ok=True)
+
+
+def open_encrypted(path, key, env_name):
+    """EncryptedJSONFile for `path`, or None when `key` (from `env_name`) is unset or unusable"""
+    if not key:
+        return None
+    try:
+        return EncryptedJSONFile(path, key)
+    except ImportError:
+        print(f"⚠️ {env_name} is set but 'cryptography' is not installed; encrypted cache disabled.")
+    except ValueError as e:
+        print(f"⚠️ Invalid {env_name}, encrypted cache disabled: {e}")
+    return None
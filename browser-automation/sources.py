@@ -0,0 +1,184 @@
+"""Source interface, registry and the scheduler that runs every source's work units.
+
+A source is a `<name>-automation.py` script in this directory with a
+`create_source()` function returning a `Source`. The source lists its work
+units (account × period) and fetches one unit at a time. The scheduler runs the
+units of all sources at once, within one budget of HTTP connections and one of
+browser contexts.
+"""
+import os
+import re
+import time
+import asyncio
+import importlib.util
+import traceback
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+AUTOMATION_DIR = Path(__file__).parent
+SCRIPT_SUFFIX = "-automation.py"
+
+# Comma-separated source names to run; empty = every script in AUTOMATION_DIR
+ENABLED_SOURCES = [name.strip() for name in os.getenv("SOURCES", "").split(",") if name.strip()]
+
+# Requests in flight across all HTTP sources (BOL_MAX_CONCURRENCY was the Bol-only setting)
+MAX_HTTP_CONNECTIONS = int(os.getenv("MAX_HTTP_CONNECTIONS", os.getenv("BOL_MAX_CONCURRENCY", 8)))
+# Browser contexts open at the same time across all browser sources
+MAX_BROWSER_CONTEXTS = int(os.getenv("MAX_BROWSER_CONTEXTS", os.getenv("AMAZON_WORKERS", 1)))
+
+HTTP = "http"
+BROWSER = "browser"
+
+
+@dataclass(frozen=True)
+class WorkUnit:
+    """One fetchable piece of work; `data` carries whatever the source needs to fetch it.
+
+    `kind` overrides the source's kind for this unit, e.g. a browser source
+    whose unit mostly runs over HTTP and takes a browser context only briefly.
+    """
+    account: str
+    period: str
+    data: object = field(default=None, compare=False)
+    kind: str = field(default=None, compare=False)
+
+    def __str__(self):
+        return f"{self.account} {self.period}"
+
+
+class Source(ABC):
+    """Base class for a report source; subclasses implement `list_work` and `fetch`.
+
+    `kind` decides which budget a unit draws from: an HTTP source holds one of
+    `scheduler.connections` per request it makes, a browser unit holds one
+    browser context for its whole duration.
+    """
+    name = None
+    kind = HTTP
+
+    async def open(self, scheduler):
+        """Set up shared state (client, login, …) before any unit is listed"""
+
+    @abstractmethod
+    async def list_work(self, periods):
+        """Work units still to fetch for `periods`"""
+
+    @abstractmethod
+    async def fetch(self, unit):
+        """Fetch one unit; raise to count it as failed"""
+
+    async def close(self):
+        """Release what `open` set up; always called, also when `open` failed halfway"""
+
+
+@dataclass
+class SourceStats:
+    name: str
+    units: int = 0
+    failed_units: int = 0
+    duration: float = 0.0
+    error: str = None
+
+
+def numbered_accounts(prefix):
+    """Account numbers n configured as `<prefix>_<n>` environment variables, in order"""
+    pattern = re.compile(rf"{re.escape(prefix)}_(\d+)")
+    return sorted({int(match.group(1)) for key in os.environ if (match := pattern.fullmatch(key))})
+
+
+def available_sources():
+    """Source name -> script for every `<name>-automation.py` in AUTOMATION_DIR"""
+    return {
+        path.name.removesuffix(SCRIPT_SUFFIX): path
+        for path in sorted(AUTOMATION_DIR.glob(f"*{SCRIPT_SUFFIX}"))
+    }
+
+
+def load_module(name, script):
+    """Import an automation script (hyphenated file name) as a module"""
+    spec = importlib.util.spec_from_file_location(f"source_{name}", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def configured_sources():
+    """Source name -> script for the sources selected by SOURCES (default: all)"""
+    available = available_sources()
+    names = ENABLED_SOURCES or list(available)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown source(s) in SOURCES: {', '.join(unknown)} (available: {', '.join(available)})")
+    return {name: available[name] for name in names}
+
+
+def error_text(error):
+    message = str(error).strip().splitlines()[0] if str(error).strip() else ""
+    return f"{type(error).__name__}: {message}"
+
+
+class Scheduler:
+    """Runs the work units of several sources concurrently under shared budgets"""
+
+    def __init__(self, http_connections=MAX_HTTP_CONNECTIONS, browser_contexts=MAX_BROWSER_CONTEXTS):
+        self.http_connections = http_connections
+        self.browser_contexts = browser_contexts
+        # HTTP sources hold a connection slot per request; browser units hold a context slot
+        self.connections = asyncio.Semaphore(http_connections)
+        self.contexts = asyncio.Semaphore(browser_contexts)
+
+    async def run_unit(self, source, unit, stats):
+        async def fetch():
+            with metrics.span(f"{source.name}.unit", account=unit.account, period=unit.period):
+                await source.fetch(unit)
+
+        try:
+            if (unit.kind or source.kind) == BROWSER:
+                async with self.contexts:
+                    await fetch()
+            else:
+                await fetch()
+        except Exception as e:
+            stats.failed_units += 1
+            print(f"❌ [{source.name}] {unit} failed: {error_text(e)}")
+
+    async def run_source(self, source, periods):
+        """Open `source`, run all its units and close it; errors end up in the stats"""
+        stats = SourceStats(source.name)
+        started = time.perf_counter()
+        print(f"🚀 Running {source.name} …")
+        try:
+            with metrics.span(f"source.{source.name}") as span:
+                try:
+                    await source.open(self)
+                    units = await source.list_work(periods)
+                    stats.units = len(units)
+                    print(f"🗂️ [{source.name}] {len(units)} work units")
+                    await asyncio.gather(*(self.run_unit(source, unit, stats) for unit in units))
+                finally:
+                    await source.close()
+                span.set(units=stats.units, failed_units=stats.failed_units)
+            print(f"✅ Finished {source.name}")
+        except Exception as e:
+            traceback.print_exc()
+            stats.error = error_text(e)
+            print(f"❌ {source.name} failed: {stats.error}")
+        stats.duration = time.perf_counter() - started
+        return stats
+
+    async def run(self, sources, periods):
+        """Run every source at once; returns one SourceStats per source, in order"""
+        return await asyncio.gather(*(self.run_source(source, periods) for source in sources))
+
+
+async def run_standalone(source, periods):
+    """Run a single source as its own script would; raises if the source failed"""
+    stats, = await Scheduler().run([source], periods)
+    if stats.error:
+        raise RuntimeError(f"{source.name} failed: {stats.error}")
+    return stats
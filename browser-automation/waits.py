@@ -0,0 +1,68 @@
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+import metrics
+
+DEFAULT_TIMEOUT = 30000  # ms
+
+
+class Waits:
+    """Named waits that each wait for the condition a step actually needs.
+
+    Every wait is timed under its name, so `report()` shows which steps cost
+    the most and are worth tuning. Failed waits are timed too. Each wait is
+    also recorded as a "wait: <name>" span in the run metrics.
+    """
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+
+    @asynccontextmanager
+    async def timed(self, name):
+        started = time.perf_counter()
+        try:
+            with metrics.span(f"wait: {name}"):
+                yield
+        finally:
+            self.timings[name].append(time.perf_counter() - started)
+
+    async def selector(self, name, page, selector, state="visible", timeout=DEFAULT_TIMEOUT):
+        """Until `selector` reaches `state` (visible, attached, hidden, detached)"""
+        async with self.timed(name):
+            await page.locator(selector).first.wait_for(state=state, timeout=timeout)
+
+    async def locator(self, name, locator, state="visible", timeout=DEFAULT_TIMEOUT):
+        async with self.timed(name):
+            await locator.wait_for(state=state, timeout=timeout)
+
+    async def url(self, name, page, matcher, timeout=DEFAULT_TIMEOUT):
+        """Until the page URL matches (glob, regex or predicate); only waits for DOMContentLoaded"""
+        async with self.timed(name):
+            await page.wait_for_url(matcher, wait_until="domcontentloaded", timeout=timeout)
+
+    async def navigation(self, name, page, action, timeout=DEFAULT_TIMEOUT):
+        """Run `action()` and wait until the navigation it starts reaches DOMContentLoaded"""
+        async with self.timed(name):
+            async with page.expect_navigation(wait_until="domcontentloaded", timeout=timeout):
+                await action()
+
+    async def goto(self, name, page, url, ready_selector, timeout=DEFAULT_TIMEOUT):
+        """Navigate and wait for the one element the next step needs, not for networkidle"""
+        async with self.timed(name):
+            await page.goto(url, wait_until="domcontentloaded", timeout=timeout)
+            await page.locator(ready_selector).first.wait_for(timeout=timeout)
+
+    async def response(self, name, page, predicate, action, timeout=DEFAULT_TIMEOUT):
+        """Run `action()` and wait for the XHR response matching `predicate`"""
+        async with self.timed(name):
+            async with page.expect_response(predicate, timeout=timeout) as response_info:
+                await action()
+            return await response_info.value
+
+    def report(self, top=10):
+        if not self.timings:
+            return
+        rows = sorted(self.timings.items(), key=lambda item: sum(item[1]), reverse=True)
+        print("⏱️ Slowest waits (total / count / max):")
+        for name, durations in rows[:top]:
+            print(f"   {name}: {sum(durations):.1f}s / {len(durations)} / {max(durations):.1f}s")
@@ -1,18 +1,37 @@
 import os
+import argparse
 import asyncio
 import smtplib
 import ssl
+import tempfile
+import zipfile
+import zlib
+import mimetypes
+from dataclasses import dataclass, field
 from email.message import EmailMessage
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
 from dotenv import load_dotenv
 import shutil
-import subprocess
+import sys
 
 load_dotenv()
 
 # === Config ===
 DOWNLOADS_DIR = Path(__file__).parent / "downloads"
+AUTOMATION_DIR = Path(__file__).parent / "browser-automation"
+
+# Wipe downloads/ and the manifest before running instead of resuming
+FULL_REFRESH = os.getenv("FULL_REFRESH", "").lower() in ("1", "true", "yes")
+
+# "csv" or "parquet" writes a consolidated ledger per month and attaches it; empty = off
+LEDGER_FORMAT = os.getenv("LEDGER_FORMAT", "").lower()
+
+sys.path.insert(0, str(AUTOMATION_DIR))
+from manifest import Manifest, MANIFEST_PATH, FAILED, last_month_period, month_periods  # noqa: E402
+import metrics  # noqa: E402
+from sources import Scheduler, SourceStats, configured_sources, error_text, load_module  # noqa: E402
+from consolidate import consolidate  # noqa: E402
 
 SMTP_SERVER = os.getenv("SMTP_SERVER")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
@@ -20,57 +39,162 @@ SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 MAIL_TO = os.getenv("MAIL_TO")
 
+# Size cap per message including base64 overhead; most relays reject above 20–25 MB
+MAIL_MAX_BYTES = int(os.getenv("MAIL_MAX_BYTES", 20 * 1024 * 1024))
+# One zip per source instead of individual attachments
+MAIL_ZIP_PER_SOURCE = os.getenv("MAIL_ZIP_PER_SOURCE", "").lower() in ("1", "true", "yes")
+# Formats that are already compressed and gain nothing from zipping
+PRECOMPRESSED = {".xlsx", ".zip", ".png", ".gz", ".pdf"}
+# Room for headers, the text part and MIME boundaries
+MESSAGE_OVERHEAD = 64 * 1024
+
 
 def clear_downloads():
-    print("🧹 Clearing downloads folder…")
+    print("🧹 Clearing downloads folder and manifest…")
     if DOWNLOADS_DIR.exists():
         shutil.rmtree(DOWNLOADS_DIR)
+    MANIFEST_PATH.unlink(missing_ok=True)
     DOWNLOADS_DIR.mkdir(exist_ok=True)
     print("✅ Downloads folder is clean.")
 
 
-def collect_files():
-    downloads = list(DOWNLOADS_DIR.glob("*"))
+def collect_files(periods):
+    """Completed downloads for the reporting periods per source, as recorded in the manifest"""
+    downloads = {}
+    with Manifest() as manifest:
+        for period in periods:
+            for row in manifest.entries(period=period):
+                path = Path(row["path"])
+                if path.exists():
+                    downloads.setdefault(row["source"], []).append(path)
     return downloads
 
+
+def period_label(periods):
+    """ "September 2025", or "January 2025 – December 2025" for a backfill"""
+    names = [datetime.strptime(period, "%Y-%m").strftime("%B %Y") for period in (periods[0], periods[-1])]
+    return names[0] if len(periods) == 1 else f"{names[0]} – {names[1]}"
+
+def clear_debug_files():
+    """Remove debug bundles left over from an earlier run so they are not mailed again"""
+    for debug_file in Path(".").glob("debug_*.zip"):
+        debug_file.unlink(missing_ok=True)
+
+
 def collect_debug_files():
-    """Collect debug screenshots and HTML files for email attachment"""
-    debug_files = []
-    
-    # Look for debug screenshots
-    for debug_file in Path(".").glob("debug_*.png"):
-        debug_files.append(debug_file)
-    
-    # Look for debug HTML files
-    for debug_file in Path(".").glob("debug_*.html"):
-        debug_files.append(debug_file)
-    
-    return debug_files
+    """Collect the compressed debug bundles (and opt-in traces) written on failure"""
+    return sorted(Path(".").glob("debug_*.zip"))
 
 
-def send_email_with_attachments(files, debug_files=None, failure_mode=False):
-    today = datetime.today()
-    first_of_this_month = today.replace(day=1)
-    last_month_date = first_of_this_month - timedelta(days=1)
-    last_month_str = last_month_date.strftime("%B %Y")
-    current_datetime_str = today.strftime("%Y-%m-%d %H:%M")
+def encoded_size(size):
+    """Bytes an attachment of `size` takes in a message (base64 plus line breaks)"""
+    return (size + 2) // 3 * 4 * 78 // 76
+
+
+def deflated_size(path):
+    """Size of `path` once deflated, computed by streaming it through zlib"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            size += len(compressor.compress(chunk))
+    return size + len(compressor.flush())
+
 
+def write_zip(path, files):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for file_path in files:
+            compress = zipfile.ZIP_STORED if file_path.suffix.lower() in PRECOMPRESSED else zipfile.ZIP_DEFLATED
+            archive.write(file_path, arcname=file_path.name, compress_type=compress)
+    return path
+
+
+def pack(items, capacity, size_of):
+    """First-fit decreasing: group `items` so each group's total size stays under `capacity`"""
+    bins = []
+    for item in sorted(items, key=size_of, reverse=True):
+        size = size_of(item)
+        for group in bins:
+            if group["size"] + size <= capacity:
+                group["items"].append(item)
+                group["size"] += size
+                break
+        else:
+            if size > capacity:
+                print(f"⚠️ {getattr(item, 'name', item)} alone exceeds the message size cap; sending it by itself.")
+            bins.append({"items": [item], "size": size})
+    return [group["items"] for group in bins]
+
+
+def prepare_attachments(files_by_source, workdir):
+    """Compress reports into `workdir` and return the paths to attach.
+
+    Already-compressed formats (XLSX, PNG, zip) are attached as they are and
+    everything else is zipped individually. With MAIL_ZIP_PER_SOURCE each
+    source becomes one zip, split into numbered parts when it would not fit
+    in a single message.
+    """
+    capacity = MAIL_MAX_BYTES - MESSAGE_OVERHEAD
+    attachments = []
+    for source, files in files_by_source.items():
+        if MAIL_ZIP_PER_SOURCE:
+            sizes = {
+                path: path.stat().st_size if path.suffix.lower() in PRECOMPRESSED else deflated_size(path)
+                for path in files
+            }
+            parts = pack(files, capacity, lambda path: encoded_size(sizes[path]))
+            for n, part in enumerate(parts, 1):
+                suffix = f" - part {n} of {len(parts)}" if len(parts) > 1 else ""
+                attachments.append(write_zip(workdir / f"{source}{suffix}.zip", part))
+            continue
+        for path in files:
+            if path.suffix.lower() in PRECOMPRESSED:
+                attachments.append(path)
+            else:
+                attachments.append(write_zip(workdir / f"{path.name}.zip", [path]))
+    return attachments
+
+
+def build_message(subject, content, attachments):
+    """One message holding only this batch's attachments"""
     msg = EmailMessage()
     msg["From"] = SMTP_USER
     msg["To"] = MAIL_TO
-    
+    msg["Subject"] = subject
+    msg.set_content(content)
+    for file_path in attachments:
+        maintype, subtype = (mimetypes.guess_type(file_path.name)[0] or "application/octet-stream").split("/")
+        with open(file_path, "rb") as f:
+            msg.add_attachment(f.read(), maintype=maintype, subtype=subtype, filename=file_path.name)
+        print(f"📎 Attached: {file_path.name}")
+    return msg
+
+
+@metrics.instrument("email.send")
+def send_email_with_attachments(files, debug_files=None, failure_mode=False, summary=None, periods=None):
+    """Compress the reports, split them into messages under MAIL_MAX_BYTES and send
+    them all over one authenticated SMTP connection.
+
+    `files` maps source name to report paths. Only one message is held in
+    memory at a time.
+    """
+    today = datetime.today()
+    last_month_str = period_label(periods or [last_month_period()])
+    current_datetime_str = today.strftime("%Y-%m-%d %H:%M")
+
     if failure_mode:
-        msg["Subject"] = f"⚠️ Automation Failure - {last_month_str}"
+        subject = f"⚠️ Automation Failure - {last_month_str}"
         content = (
             f"Hi,\n\n"
             f"The monthly automation encountered an error while processing {last_month_str} reports.\n\n"
             f"Error occurred on {current_datetime_str}.\n\n"
-            f"Debug screenshots and HTML files are attached to help diagnose the issue.\n\n"
+            f"{summary or ''}\n\n"
+            f"A compressed debug bundle (page snapshots, screenshot of the failed step) is attached to help diagnose the issue.\n\n"
             f"Best regards,\n"
             f"Automation Script"
         )
     else:
-        msg["Subject"] = f"Monthly Reports - {last_month_str}"
+        subject = f"Monthly Reports - {last_month_str}"
         content = (
             f"Hi,\n\n"
             f"Please find attached the monthly reports from {last_month_str}.\n\n"
@@ -78,91 +202,157 @@ def send_email_with_attachments(files, debug_files=None, failure_mode=False):
             f"Best regards,\n"
             f"Automation Script"
         )
-    
-    msg.set_content(content)
 
-    # Attach report files
-    for file_path in files:
-        with open(file_path, "rb") as f:
-            data = f.read()
-            msg.add_attachment(
-                data,
-                maintype="application",
-                subtype="octet-stream",
-                filename=file_path.name
-            )
-        print(f"📎 Attached report: {file_path.name}")
-    
-    # Attach debug files if provided
+    files_by_source = dict(files)
     if debug_files:
-        for debug_file in debug_files:
-            try:
-                with open(debug_file, "rb") as f:
-                    data = f.read()
-                    msg.add_attachment(
-                        data,
-                        maintype="application",
-                        subtype="octet-stream",
-                        filename=debug_file.name
-                    )
-                print(f"📎 Attached debug file: {debug_file.name}")
-            except Exception as e:
-                print(f"⚠️ Could not attach debug file {debug_file.name}: {e}")
+        files_by_source["debug"] = list(debug_files)
 
-    print("✉️ Sending email…")
-    context = ssl.create_default_context()
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-        server.starttls(context=context)
-        server.login(SMTP_USER, SMTP_PASSWORD)
-        server.send_message(msg)
+    with tempfile.TemporaryDirectory() as workdir:
+        attachments = prepare_attachments(files_by_source, Path(workdir))
+        batches = pack(
+            attachments, MAIL_MAX_BYTES - MESSAGE_OVERHEAD,
+            lambda path: encoded_size(path.stat().st_size),
+        ) or [[]]
+
+        print(f"✉️ Sending {len(attachments)} attachments in {len(batches)} email(s)…")
+        metrics.current().set(attachments=len(attachments), messages=len(batches))
+        metrics.add_bytes(sum(path.stat().st_size for path in attachments))
+        context = ssl.create_default_context()
+        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+            server.starttls(context=context)
+            server.login(SMTP_USER, SMTP_PASSWORD)
+            for n, batch in enumerate(batches, 1):
+                part = f" ({n}/{len(batches)})" if len(batches) > 1 else ""
+                msg = build_message(subject + part, content, batch)
+                server.send_message(msg)
+                print(f"📨 Sent email {n}/{len(batches)}")
+                del msg
 
     print(f"✅ Email sent to: {MAIL_TO}")
 
 
-def run_script(script: Path):
-    print(f"🚀 Running {script} …")
-    # Use sys.executable to get the current Python interpreter (from virtual environment)
-    import sys
-    result = subprocess.run(
-        [sys.executable, str(script)],
-        capture_output=False,
-        text=True,
-    )
-    if result.returncode != 0:
-        print(f"❌ Script {script} failed with return code {result.returncode}")
-    else:
-        print(f"✅ Finished {script}")
+@dataclass
+class SourceResult:
+    name: str
+    files: list = field(default_factory=list)
+    failed_items: int = 0
+    failed_units: int = 0
+    duration: float = 0.0
+    error: str = None
 
+    @property
+    def ok(self):
+        """False if the source failed outright or any of its accounts/units/items did"""
+        return self.error is None and not self.failed_units and not self.failed_items
 
-async def main():
-    clear_downloads()
-    amazon_failed = False
 
-    run_script(Path("browser-automation/bol-automation.py"))
-    
-    # Check if Amazon automation failed
-    try:
-        run_script(Path("browser-automation/amazon-automation.py"))
-    except Exception as e:
-        print(f"❌ Amazon automation failed: {e}")
-        amazon_failed = True
-    
-    # Also check for failure marker file
-    if Path("amazon_automation_failed.txt").exists():
-        amazon_failed = True
-        print("⚠️ Amazon automation failure marker detected")
+def load_sources():
+    """Instantiate every configured source (`SOURCES`, default all `*-automation.py` scripts)
+
+    Returns the sources and a failed SourceStats for each one that could not be
+    loaded, so one broken script does not stop the others.
+    """
+    loaded, failed = [], []
+    for name, script in configured_sources().items():
+        try:
+            loaded.append(load_module(name, script).create_source())
+        except Exception as e:
+            failed.append(SourceStats(name, error=error_text(e)))
+            print(f"❌ {name} could not be loaded: {failed[-1].error}")
+    return loaded, failed
 
-    files = collect_files()
+
+async def run_sources(periods):
+    """Run the work units of every source on one scheduler; total time is that of the slowest source"""
+    loaded, failed = load_sources()
+    all_stats = failed + await Scheduler().run(loaded, periods)
+    results = []
+    with Manifest() as manifest:
+        for stats in all_stats:
+            result = SourceResult(
+                stats.name, failed_units=stats.failed_units, duration=stats.duration, error=stats.error,
+            )
+            for period in periods:
+                result.files += manifest.files(period=period, source=stats.name)
+                result.failed_items += len(manifest.entries(period=period, status=FAILED, source=stats.name))
+            results.append(result)
+    return results
+
+
+def summarize(results):
+    lines = []
+    for result in results:
+        if result.error:
+            status = f"FAILED ({result.error})"
+        else:
+            status = "ok" if result.ok else "INCOMPLETE"
+        lines.append(
+            f"- {result.name}: {status}, {len(result.files)} files, {result.failed_units} failed units, "
+            f"{result.failed_items} failed items, {result.duration:.0f}s"
+        )
+    return "\n".join(lines)
+
+
+async def main(periods=None, send_email=True):
+    """Fetch `periods` ("YYYY-MM" keys, default last month) from every source and mail the reports"""
+    periods = periods or [last_month_period()]
+    if len(periods) > 1:
+        print(f"📆 Backfilling {len(periods)} months: {period_label(periods)}")
+    clear_debug_files()
+    if FULL_REFRESH:
+        clear_downloads()
+    else:
+        # Reruns only fetch what the manifest does not already have
+        DOWNLOADS_DIR.mkdir(exist_ok=True)
+
+    results = await run_sources(periods)
+    summary = summarize(results)
+    print(f"📋 Source results:\n{summary}")
+    failed = any(not result.ok for result in results)
+
+    files = collect_files(periods)
+    if LEDGER_FORMAT:
+        for period in periods:
+            try:
+                ledger = consolidate(period, LEDGER_FORMAT)
+            except Exception as e:
+                print(f"⚠️ Could not consolidate {period}: {e}")
+                continue
+            if ledger:
+                files.setdefault("ledger", []).append(ledger)
     debug_files = collect_debug_files()
     
-    if not files and not debug_files:
+    if not send_email:
+        print(f"📁 Email skipped; reports are in {DOWNLOADS_DIR} by month.")
+    elif not files and not debug_files:
         print("⚠️ No report files or debug files found to attach.")
     else:
-        # Send email with debug files if Amazon failed
-        send_email_with_attachments(files, debug_files, failure_mode=amazon_failed)
+        # Failure mode attaches the debug bundles and says which source failed
+        send_email_with_attachments(files, debug_files, failure_mode=failed, summary=summary, periods=periods)
 
+    print(f"📈 Run metrics: {metrics.run_file()}")
     print("🎉 All tasks completed. Exiting.")
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch the monthly reports and email them")
+    parser.add_argument("--from", dest="start", help="backfill from this month (YYYY-MM)")
+    parser.add_argument(
+        "--to", dest="end",
+        help="backfill up to and including this month (default: last month); without --from only this month",
+    )
+    parser.add_argument("--no-email", action="store_true", help="only download, do not send the email")
+    return parser.parse_args(argv)
+
+
+def requested_periods(args):
+    """Months asked for on the command line, or None for the default (last month)"""
+    if not args.start and not args.end:
+        return None
+    # --to alone fetches just that month
+    return month_periods(args.start or args.end, args.end or last_month_period())
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    asyncio.run(main(requested_periods(args), send_email=not args.no_email))
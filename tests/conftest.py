@@ -0,0 +1,24 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+AUTOMATION_DIR = ROOT / "browser-automation"
+
+# The automation modules import each other as top-level modules
+sys.path.insert(0, str(AUTOMATION_DIR))
+sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture(scope="session")
+def amazon():
+    """amazon-automation.py loaded as a module (its file name is not importable)"""
+    from sources import load_module
+    return load_module("amazon", AUTOMATION_DIR / "amazon-automation.py")
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    """Run every test in its own directory, so relative .cache/ and downloads/ paths stay out of the tree"""
+    monkeypatch.chdir(tmp_path)
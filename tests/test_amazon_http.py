@@ -0,0 +1,77 @@
+import asyncio
+
+import httpx
+import pytest
+
+import amazon_http
+from amazon_http import EndpointError, ReportNotFound, wait_until_ready
+
+BASE = "https://sellercentral.example"
+
+
+@pytest.fixture(autouse=True)
+def paths(monkeypatch):
+    monkeypatch.setattr(amazon_http, "REQUEST_PATH", "/reports/request")
+    monkeypatch.setattr(amazon_http, "STATUS_PATH", "/reports/status")
+    monkeypatch.setattr(amazon_http, "DOWNLOAD_PATH", "/reports/download")
+    monkeypatch.setattr(amazon_http, "REQUEST_BODY", '{"type": "Transaction", "range": ["{start}", "{end}"], "n": 1}')
+    monkeypatch.setattr(amazon_http, "ID_PARAM", "reportId")
+
+
+def wait(*payloads, status=200):
+    """Poll a status endpoint answering `payloads` in turn"""
+    answers = iter(payloads)
+
+    async def go():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(status, json=next(answers))))
+        async with client:
+            await wait_until_ready(client, BASE, {}, "R1", 5, 0.001, 0.001, asyncio.Semaphore(1))
+
+    asyncio.run(go())
+
+
+def test_waits_until_ready():
+    wait({"status": "IN_PROGRESS"}, {"status": "Refresh"}, {"label": "Download CSV"})
+
+
+@pytest.mark.parametrize("payload", [{}, {"reportId": "R1"}, {"data": {"status": "DONE"}}, []])
+def test_unknown_payload_is_an_endpoint_error(payload):
+    with pytest.raises(EndpointError):
+        wait(payload)
+
+
+@pytest.mark.parametrize("state", ["NOT_FOUND", "expired"])
+def test_gone_report(state):
+    with pytest.raises(ReportNotFound):
+        wait({"reportId": "R1", "status": state})
+
+
+def test_paths_must_be_configured(monkeypatch):
+    amazon_http.check_paths()
+    monkeypatch.setattr(amazon_http, "STATUS_PATH", "")
+    with pytest.raises(RuntimeError, match="AMAZON_REPORT_STATUS_PATH"):
+        amazon_http.check_paths()
+
+
+def test_a_server_error_is_an_endpoint_error():
+    with pytest.raises(EndpointError, match="500"):
+        wait({"status": "IN_PROGRESS"}, status=500)
+
+
+def test_request_body_and_report_urls(monkeypatch):
+    assert amazon_http.request_body("2024-02") == {"type": "Transaction", "range": ["2024-02-01", "2024-02-29"], "n": 1}
+    assert amazon_http.report_url(BASE, "/reports/status", "R 1") == BASE + "/reports/status?reportId=R+1"
+    assert amazon_http.report_url(BASE, "/reports/{report_id}/csv", "R/1") == BASE + "/reports/R%2F1/csv"
+
+
+def test_request_format_must_be_configured(monkeypatch):
+    monkeypatch.setattr(amazon_http, "ID_PARAM", "")
+    with pytest.raises(RuntimeError, match="AMAZON_REPORT_ID_PARAM"):
+        amazon_http.check_paths()
+    # Not needed when both paths carry the id themselves
+    monkeypatch.setattr(amazon_http, "STATUS_PATH", "/reports/{report_id}/status")
+    monkeypatch.setattr(amazon_http, "DOWNLOAD_PATH", "/reports/{report_id}/csv")
+    amazon_http.check_paths()
+    monkeypatch.setattr(amazon_http, "REQUEST_BODY", "{month}")
+    with pytest.raises(RuntimeError, match="not valid JSON"):
+        amazon_http.check_paths()
@@ -0,0 +1,58 @@
+import asyncio
+from types import SimpleNamespace
+
+
+def test_ids_from_data_attributes(amazon):
+    attributes = [
+        ("class", "full-page-account-switcher-account-details"),
+        ("data-merchant-id", "amzn1.merchant.d.ABCDEFGHIJ"),
+        ("data-marketplace-id", "A1PA6795UKMFR9"),
+    ]
+    assert amazon.parse_marketplace_ids(attributes) == {
+        "merchant_id": "amzn1.merchant.d.ABCDEFGHIJ", "marketplace_id": "A1PA6795UKMFR9",
+    }
+
+
+def test_ids_from_a_deep_link(amazon):
+    attributes = [(
+        "href",
+        "/home?mons_sel_dir_mcid=amzn1.merchant.d.XYZ&mons_sel_mkid=A13V1IB3VIYZZH&mons_sel_dir_paid=amzn1.pa.d.P1",
+    )]
+    assert amazon.parse_marketplace_ids(attributes) == {
+        "merchant_id": "amzn1.merchant.d.XYZ", "marketplace_id": "A13V1IB3VIYZZH", "partner_id": "amzn1.pa.d.P1",
+    }
+
+
+def test_incomplete_ids_are_none(amazon):
+    assert amazon.parse_marketplace_ids([("data-marketplace-id", "A1PA6795UKMFR9")]) is None
+    assert amazon.parse_marketplace_ids([("data-merchant-id", "not an id"), ("data-marketplace-id", "x")]) is None
+    assert amazon.parse_marketplace_ids([]) is None
+
+
+def test_country_key(amazon):
+    assert amazon.country_key("Belgium (current)") == "Belgium"
+    assert amazon.country_key(" France ") == "France"
+
+
+def test_a_failed_direct_switch_is_not_retried_this_run(amazon, monkeypatch):
+    monkeypatch.setattr(amazon, "DIRECT_SWITCH", True)
+    ids = amazon.MarketplaceIds(path="")
+    belgium = {"merchant_id": "amzn1.merchant.d.BE", "marketplace_id": "AMEN7PMS3EDWL"}
+    ids.ids = {"Belgium": belgium}
+    ids.forget("Belgium (current)")
+    assert ids.get("Belgium") is None
+    # The switcher lists Belgium again, but it is neither missing nor re-harvested
+    assert not ids.missing(["Belgium (current)"])
+    assert ids.missing(["Belgium", "France"])
+
+    async def evaluate_all(script):
+        return [
+            {"label": "Belgium (current)", "attributes": [("data-merchant-id", "amzn1.merchant.d.BE"),
+                                                          ("data-marketplace-id", "AMEN7PMS3EDWL")]},
+            {"label": "France", "attributes": [("data-merchant-id", "amzn1.merchant.d.FR"),
+                                               ("data-marketplace-id", "A13V1IB3VIYZZH")]},
+        ]
+
+    asyncio.run(ids.harvest(SimpleNamespace(evaluate_all=evaluate_all)))
+    assert ids.get("Belgium") is None
+    assert ids.get("France")["marketplace_id"] == "A13V1IB3VIYZZH"
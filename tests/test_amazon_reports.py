@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from playwright.async_api import TimeoutError
+
+import amazon_http
+
+
+def response(method, url):
+    return SimpleNamespace(url=url, request=SimpleNamespace(method=method))
+
+
+def test_only_the_request_report_xhr_is_taken(amazon, monkeypatch):
+    monkeypatch.setattr(amazon_http, "REQUEST_PATH", "")
+    base = "https://sellercentral.amazon.com.be"
+    assert amazon.is_report_request_response(response("POST", base + "/payments/api/report-request"))
+    assert not amazon.is_report_request_response(response("GET", base + "/payments/api/report-request"))
+    assert not amazon.is_report_request_response(response("POST", base + "/payments/api/reports/list"))
+    assert not amazon.is_report_request_response(response("POST", base + "/payments/report/metrics?report=1"))
+
+
+def test_configured_request_path_is_matched_exactly(amazon, monkeypatch):
+    monkeypatch.setattr(amazon_http, "REQUEST_PATH", "/payments/reports/api/generate")
+    base = "https://sellercentral.amazon.com.be"
+    assert amazon.is_report_request_response(response("POST", base + "/payments/reports/api/generate?x=1"))
+    assert not amazon.is_report_request_response(response("POST", base + "/payments/api/report-request"))
+
+
+def test_report_id_keys():
+    payload = {"requestId": "r-1", "data": {"reportReferenceId": 42}}
+    assert amazon_http.find_report_id(payload) == "r-1"
+    assert amazon_http.find_report_id(payload, amazon_http.REPORT_SPECIFIC_KEYS) == "42"
+    assert amazon_http.find_report_id({"id": "7"}, amazon_http.REPORT_SPECIFIC_KEYS) is None
+    assert amazon_http.find_report_id(["not", "a", "dict"]) is None
+
+
+def request_page(click):
+    button = SimpleNamespace(first=SimpleNamespace(click=click))
+    return SimpleNamespace(locator=lambda *args, **kwargs: button)
+
+
+def test_a_failed_click_is_not_a_request(amazon, monkeypatch):
+    async def click():
+        raise TimeoutError("Request Report button not visible")
+
+    async def response(name, page, predicate, action, timeout):
+        await action()
+
+    monkeypatch.setattr(amazon.waits, "response", response)
+    with pytest.raises(TimeoutError):
+        asyncio.run(amazon.click_request_report(request_page(click)))
+
+
+def test_a_missing_or_unreadable_xhr_leaves_the_id_unknown(amazon, monkeypatch):
+    async def click():
+        pass
+
+    async def no_response(name, page, predicate, action, timeout):
+        await action()
+        raise TimeoutError("no matching response")
+
+    async def not_json():
+        raise ValueError("Expecting value")
+
+    async def unreadable(name, page, predicate, action, timeout):
+        await action()
+        return SimpleNamespace(json=not_json)
+
+    async def answered(name, page, predicate, action, timeout):
+        await action()
+
+        async def payload():
+            return {"reportReferenceId": 42}
+        return SimpleNamespace(json=payload)
+
+    page = request_page(click)
+    for response, expected in ((no_response, None), (unreadable, None), (answered, "42")):
+        monkeypatch.setattr(amazon.waits, "response", response)
+        assert asyncio.run(amazon.click_request_report(page)) == expected
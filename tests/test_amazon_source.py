@@ -0,0 +1,151 @@
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+from checkpoint import DOWNLOADED
+from manifest import Manifest
+from sources import WorkUnit
+
+
+def fake_page():
+    return SimpleNamespace(context=object(), is_closed=lambda: False)
+
+
+def test_failed_recycle_keeps_the_unit_done(amazon, monkeypatch):
+    async def process_country(page, country, period, checkpoint):
+        path = Path("downloads") / period / f"Amazon - {country} - {period}.csv"
+        path.parent.mkdir(parents=True)
+        path.write_text("date,type,amount\n")
+        return path
+
+    async def due(page):
+        return "8 units done"
+
+    async def recycle(page):
+        raise RuntimeError("browser has been closed")
+
+    monkeypatch.setattr(amazon, "process_country", process_country)
+    monkeypatch.setattr(amazon.governor, "check", due)
+    source = amazon.AmazonSource()
+    monkeypatch.setattr(source, "recycle", recycle)
+    source.manifest = Manifest()
+    page = fake_page()
+    source.idle_pages.append(page)
+    try:
+        asyncio.run(source.fetch_ui(WorkUnit("Belgium", "2025-07", "Belgium")))
+        assert source.manifest.is_complete(amazon.SOURCE, "Belgium", "2025-07", amazon.REPORT_ID)
+    finally:
+        source.manifest.close()
+    assert source.checkpoint.get("Belgium", "2025-07")["state"] == DOWNLOADED
+    # The unrecycled page goes back to the pool
+    assert source.idle_pages == [page]
+
+
+def test_harvest_retries_on_a_fresh_page(amazon, monkeypatch):
+    first, fresh = fake_page(), fake_page()
+    requests = []
+
+    async def open_reports_for(page, country):
+        pass
+
+    async def set_filters_and_request(page, period):
+        requests.append(page)
+        if page is first:
+            raise RuntimeError("Request Report button detached")
+        return {"report_id": "R1", "period": period, "baseline": [], "requested_at": asyncio.get_running_loop().time()}
+
+    async def read_report_rows(page, reports):
+        return [{"index": 0, "label": "download csv", "signature": "Transaction|July 2025"}]
+
+    async def handle_report_row(page, country, report, match, on_ready=None):
+        report["row"] = match["signature"]
+        on_ready()
+        return Path("downloads/report.csv")
+
+    async def nothing(*args, **kwargs):
+        pass
+
+    async def replace_page(page):
+        assert page is first
+        return fresh
+
+    monkeypatch.setattr(amazon, "open_reports_for", open_reports_for)
+    monkeypatch.setattr(amazon, "set_filters_and_request", set_filters_and_request)
+    monkeypatch.setattr(amazon, "read_report_rows", read_report_rows)
+    monkeypatch.setattr(amazon, "handle_report_row", handle_report_row)
+    monkeypatch.setattr(amazon.waits, "selector", nothing)
+    monkeypatch.setattr(amazon.debug, "failure", nothing)
+    marked = []
+    manifest = SimpleNamespace(
+        record=lambda *args, **kwargs: marked.append("downloaded"),
+        mark_failed=lambda *args, **kwargs: marked.append("failed"),
+    )
+    source = amazon.AmazonSource()
+    asyncio.run(amazon.request_then_harvest(
+        first, [("Belgium", "2025-07")], manifest, source.checkpoint, replace_page=replace_page,
+    ))
+    assert requests == [first, fresh]
+    assert marked == ["downloaded"]
+    assert source.checkpoint.get("Belgium", "2025-07")["state"] == DOWNLOADED
+
+
+def test_harvest_reads_each_country_once_per_pass(amazon, monkeypatch):
+    loop_time = {"now": 0.0}
+    reads, sleeps, marked = [], [], []
+
+    async def open_reports_for(page, country):
+        pass
+
+    async def set_filters_and_request(page, period):
+        return {"report_id": None, "period": period, "baseline": [], "requested_at": loop_time["now"]}
+
+    async def read_report_rows(page, reports):
+        reads.append([report["period"] for report in reports])
+        # July is ready on the second pass; August never is
+        ready = len(reads) > 1
+        return [
+            {"index": 0, "label": "download csv" if ready and report["period"] == "2025-07" else "pending",
+             "signature": report["period"]}
+            for report in reports
+        ]
+
+    async def handle_report_row(page, country, report, match, on_ready=None):
+        if match["label"] != "download csv":
+            return None
+        report["row"] = match["signature"]
+        return Path("downloads/report.csv")
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+        loop_time["now"] += 700
+
+    async def nothing(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(amazon, "open_reports_for", open_reports_for)
+    monkeypatch.setattr(amazon, "set_filters_and_request", set_filters_and_request)
+    monkeypatch.setattr(amazon, "read_report_rows", read_report_rows)
+    monkeypatch.setattr(amazon, "handle_report_row", handle_report_row)
+    monkeypatch.setattr(amazon, "REPORT_TIMEOUT", 1200)
+    monkeypatch.setattr(amazon.waits, "selector", nothing)
+    monkeypatch.setattr(amazon.waits, "goto", nothing)
+    monkeypatch.setattr(amazon.asyncio, "sleep", sleep)
+    manifest = SimpleNamespace(
+        record=lambda source, country, period, *args: marked.append(("downloaded", period)),
+        mark_failed=lambda source, country, period, *args: marked.append(("failed", period)),
+    )
+    source = amazon.AmazonSource()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        monkeypatch.setattr(loop, "time", lambda: loop_time["now"])
+        await amazon.request_then_harvest(
+            fake_page(), [("Belgium", "2025-07"), ("Belgium", "2025-08")], manifest, source.checkpoint,
+        )
+
+    asyncio.run(run())
+    # Both reports in one read per pass; August alone once July is done
+    assert reads == [["2025-07", "2025-08"], ["2025-07", "2025-08"]]
+    assert sleeps == [amazon.REFRESH_INTERVAL_MIN, amazon.REFRESH_INTERVAL_MIN * 2]
+    # August runs out of time 1200s after its own request
+    assert marked == [("downloaded", "2025-07"), ("failed", "2025-08")]
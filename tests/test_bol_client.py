@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import bol_client
+from bol_client import (
+    INVOICE_LIST, SPECIFICATION, TOKEN, BolApiClient, EndpointLimiter, NonRetryableError, group_for_url,
+    parse_retry_after,
+)
+
+
+def test_group_for_url():
+    assert group_for_url("https://login.bol.com/token?grant_type=client_credentials") == TOKEN
+    assert group_for_url("https://api.bol.com/retailer/invoices/123/specification") == SPECIFICATION
+    assert group_for_url("https://api.bol.com/retailer/invoices?period-start-date=2025-07-01") == INVOICE_LIST
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+
+def test_token_bucket_spaces_requests_after_the_burst():
+    async def go():
+        limiter = EndpointLimiter("test", rate=20, max_concurrency=100)
+        started = time.monotonic()
+        for _ in range(30):
+            await limiter.acquire()
+            await limiter.release()
+        return time.monotonic() - started
+
+    # A burst of 20, then 10 more at 20/s
+    assert 0.4 < asyncio.run(go()) < 1.0
+
+
+def test_throttle_halves_and_healthy_window_grows_the_limit():
+    async def go():
+        limiter = EndpointLimiter("test", rate=100, max_concurrency=8)
+        await limiter.throttle(0)
+        await limiter.throttle(0)
+        assert limiter.limit == 2 and limiter.throttled == 2
+        await limiter.healthy()
+        assert limiter.limit == 2
+        await limiter.healthy()
+        assert limiter.limit == 3
+        for _ in range(100):
+            await limiter.healthy()
+        assert limiter.limit == 8
+
+    asyncio.run(go())
+
+
+def test_in_flight_limit_is_respected():
+    async def go():
+        limiter = EndpointLimiter("test", rate=1000, max_concurrency=3)
+        active = peak = 0
+
+        async def work():
+            nonlocal active, peak
+            await limiter.acquire()
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            await limiter.release()
+
+        await asyncio.gather(*(work() for _ in range(12)))
+        return peak
+
+    assert asyncio.run(go()) == 3
+
+
+def test_rate_limit_headers_pause_the_group():
+    limiter = EndpointLimiter("test", rate=10, max_concurrency=1)
+    limiter.observe_headers({"x-ratelimit-remaining": "0", "x-ratelimit-reset": "5"})
+    assert limiter.paused_until - time.monotonic() > 4
+    limiter = EndpointLimiter("test", rate=10, max_concurrency=1)
+    limiter.observe_headers({"x-ratelimit-remaining": "3", "x-ratelimit-reset": "5"})
+    assert limiter.paused_until == 0.0
+
+
+def failing(*statuses, headers=None):
+    """request(attempt) raising HTTPStatusError for each status in turn, then returning "ok" """
+    calls = []
+
+    async def request(attempt):
+        calls.append(attempt)
+        if len(calls) <= len(statuses):
+            status = statuses[len(calls) - 1]
+            response = httpx.Response(status, headers=headers, request=httpx.Request("GET", "http://bol.test"))
+            raise httpx.HTTPStatusError("error", request=response.request, response=response)
+        return "ok"
+
+    return request, calls
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(bol_client, "BACKOFF_BASE", 0.0)
+
+
+def test_call_waits_out_429_and_halves_concurrency(no_backoff):
+    client = BolApiClient()
+    request, calls = failing(429, headers={"retry-after": "0"})
+    assert asyncio.run(client.call(SPECIFICATION, request)) == "ok"
+    limiter = client.limiters[SPECIFICATION]
+    assert len(calls) == 2 and limiter.throttled == 1
+    assert limiter.limit == bol_client.GROUP_MAX_CONCURRENCY[SPECIFICATION] // 2
+
+
+def test_call_retries_5xx_with_attempt_numbers(no_backoff):
+    request, calls = failing(502, 503)
+    assert asyncio.run(BolApiClient().call(INVOICE_LIST, request)) == "ok"
+    assert calls == [0, 1, 2]
+
+
+def test_call_gives_up_after_max_retries(no_backoff):
+    request, calls = failing(*[500] * 10)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(BolApiClient().call(INVOICE_LIST, request))
+    assert len(calls) == bol_client.MAX_RETRIES
+
+
+def test_call_fails_fast_on_other_4xx(no_backoff):
+    request, calls = failing(404)
+    with pytest.raises(NonRetryableError):
+        asyncio.run(BolApiClient().call(INVOICE_LIST, request, "listing"))
+    assert calls == [0]
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+from checkpoint import DOWNLOADED, READY, REQUESTED, SWITCHED, Checkpoint
+
+
+def test_states_and_report_id_survive_a_reload(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    checkpoint = Checkpoint(path)
+    checkpoint.advance("Germany", "2025-07", SWITCHED)
+    checkpoint.advance("Germany", "2025-07", REQUESTED, report_id="123")
+    checkpoint.advance("Germany", "2025-07", READY)
+
+    reloaded = Checkpoint(path)
+    assert reloaded.get("Germany", "2025-07")["state"] == READY
+    assert reloaded.resumable_report("Germany", "2025-07", max_age=3600) == "123"
+    assert reloaded.get("France", "2025-07") == {}
+
+
+def test_switch_and_download_drop_the_report_id(tmp_path):
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json")
+    checkpoint.advance("Germany", "2025-07", REQUESTED, report_id="123")
+    checkpoint.advance("Germany", "2025-07", SWITCHED)
+    assert "report_id" not in checkpoint.get("Germany", "2025-07")
+    assert checkpoint.resumable_report("Germany", "2025-07", max_age=3600) is None
+
+    checkpoint.advance("Germany", "2025-07", REQUESTED, report_id="456")
+    checkpoint.advance("Germany", "2025-07", DOWNLOADED, path="downloads/x.csv")
+    unit = checkpoint.get("Germany", "2025-07")
+    assert unit["state"] == DOWNLOADED and unit["path"] == "downloads/x.csv" and "report_id" not in unit
+    assert checkpoint.resumable_report("Germany", "2025-07", max_age=3600) is None
+
+
+def test_old_requests_are_not_resumed(tmp_path):
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json")
+    checkpoint.advance("Germany", "2025-07", REQUESTED, report_id="123")
+    checkpoint.units[Checkpoint.key("Germany", "2025-07")]["requested_at"] = (
+        datetime.now() - timedelta(hours=25)
+    ).isoformat(timespec="seconds")
+    assert checkpoint.resumable_report("Germany", "2025-07", max_age=24 * 3600) is None
+
+
+def test_failures_count_attempts_and_keep_the_state(tmp_path):
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json")
+    checkpoint.advance("Germany", "2025-07", REQUESTED, report_id="123")
+    checkpoint.failed("Germany", "2025-07", TimeoutError("row not found\nmore detail"))
+    checkpoint.failed("Germany", "2025-07", TimeoutError())
+    unit = checkpoint.get("Germany", "2025-07")
+    assert unit["attempts"] == 2 and unit["error"] == "TimeoutError" and unit["state"] == REQUESTED
+    checkpoint.failed("France", "2025-07", ValueError("bad"))
+    assert checkpoint.get("France", "2025-07") == {"attempts": 1, "error": "bad", "state": None}
+
+
+def test_unreadable_file_starts_empty(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    path.write_text("{not json")
+    assert Checkpoint(path).units == {}
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from consolidate import LEDGER_COLUMNS, UnknownHeaderError, normalize, parse_amount, parse_date
+
+TAGS = {"period": "2025-07", "source": "amazon", "shop": "", "marketplace": "Belgium", "source_file": "report.csv"}
+
+
+def ledger(rows, tags=TAGS):
+    return [dict(zip(LEDGER_COLUMNS, record)) for record in normalize(rows, tags)]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1234.5", "1234.5"),
+    ("1.234,50", "1234.50"),
+    ("1,234.50", "1234.50"),
+    ("€ -3,10", "-3.10"),
+    (12.5, "12.5"),
+    ("", ""),
+    ("n/a", ""),
+])
+def test_parse_amount(text, expected):
+    assert parse_amount(text) == expected
+
+
+def test_header_below_notes_lines():
+    rows = [
+        ["Includes Amazon Marketplace, Fulfillment by Amazon (FBA), and Amazon Webstore transactions"],
+        ["All amounts in EUR, unless specified"],
+        ["date/time", "settlement id", "type", "order id", "description", "quantity", "total"],
+        ["1 Jul 2025 10:00:00 UTC", "1", "Order", "402-1", "Baby gate", "1", "1.234,50"],
+        [],
+        ["2 Jul 2025 11:00:00 UTC", "1", "Refund", "402-2", "Baby gate", "1", "-29,99"],
+    ]
+    records = ledger(rows)
+    assert [(r["order_id"], r["type"], r["amount"], r["quantity"]) for r in records] == [
+        ("402-1", "Order", "1234.50", "1"), ("402-2", "Refund", "-29.99", "1"),
+    ]
+    first = records[0]
+    assert first["marketplace"] == "Belgium" and first["source_row"] == 1
+    assert json.loads(first["raw"])["settlement id"] == "1"
+
+
+def test_dutch_bol_specification():
+    rows = [
+        ["Bestelnummer", "Omschrijving", "Aantal", "Bedrag", "Valuta"],
+        ["A1", "Commissie", 2, -3.1, "EUR"],
+    ]
+    record, = ledger(rows, dict(TAGS, source="bol", shop="Shop", marketplace="bol.com"))
+    assert (record["order_id"], record["description"], record["amount"], record["currency"]) == (
+        "A1", "Commissie", "-3.1", "EUR",
+    )
+
+
+def test_empty_input_gives_no_rows():
+    assert ledger([]) == []
+    assert ledger([[], [""]]) == []
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1 Jul 2025 10:00:00 UTC", "2025-07-01T10:00:00+00:00"),
+    ("01.07.2025 10:00:00 UTC", "2025-07-01T10:00:00+00:00"),
+    ("1 juil. 2025 10:00:00 UTC", "2025-07-01T10:00:00+00:00"),
+    ("15 août 2025 01:02:03 CEST", "2025-08-15T01:02:03+02:00"),
+    ("1 jul. 2025 23:59:59 GMT+2", "2025-07-01T23:59:59+02:00"),
+    ("Jul 1, 2025 10:00:00 PM PDT", "2025-07-01T22:00:00-07:00"),
+    ("1 mrt 2025", "2025-03-01"),
+    ("13/07/2025", "2025-07-13"),
+    ("2025-07-01", "2025-07-01"),
+    ("n/a", ""),
+])
+def test_parse_date(text, expected):
+    assert parse_date(text) == expected
+
+
+def test_german_report_currency_from_notes():
+    rows = [
+        ["Alle Beträge in Euro, sofern nicht anders angegeben"],
+        ["Datum/Uhrzeit", "Abrechnungsnummer", "Typ", "Bestellnummer", "Beschreibung", "Menge", "Gesamt"],
+        ["01.07.2025 10:00:00 UTC", "1", "Bestellung", "302-1", "Türschutzgitter", "2", "1.234,50"],
+    ]
+    record, = ledger(rows, dict(TAGS, marketplace="Germany"))
+    assert (record["date"], record["type"], record["order_id"], record["quantity"], record["amount"]) == (
+        "2025-07-01T10:00:00+00:00", "Bestellung", "302-1", "2", "1234.50",
+    )
+    assert record["currency"] == "EUR"
+
+
+@pytest.mark.parametrize("header", [
+    ["date/heure", "type", "numéro de la commande", "description", "quantité", "total"],
+    ["Data/Ora:", "Tipo", "Numero ordine", "Descrizione", "Quantità", "totale"],
+    ["fecha y hora", "tipo", "número de pedido", "descripción", "cantidad", "total"],
+])
+def test_french_italian_spanish_headers(header):
+    record, = ledger([header, ["1 jul. 2025", "Pedido", "171-1", "Reja", "1", "9,99"]])
+    assert (record["date"], record["order_id"], record["amount"]) == ("2025-07-01", "171-1", "9.99")
+
+
+def test_currency_from_notes_or_marketplace():
+    header = ["date/time", "type", "order id", "total"]
+    line = ["1 Jul 2025", "Order", "203-1", "£12.50"]
+    uk, = ledger([["All amounts in GBP, unless specified"], header, line])
+    assert (uk["currency"], uk["amount"]) == ("GBP", "12.50")
+    poland, = ledger([header, line], dict(TAGS, marketplace="Poland"))
+    assert poland["currency"] == "PLN"
+    belgium, = ledger([header, line])
+    assert belgium["currency"] == "EUR"
+
+
+def test_unknown_header_fails():
+    with pytest.raises(UnknownHeaderError):
+        ledger([["Kolumna A", "Kolumna B"], ["1", "2"]])
@@ -0,0 +1,19 @@
+from dom_extract import find, find_option
+
+DROPDOWNS = [
+    {"index": 0, "options": ["Summary", "Transaction", "Date Range"]},
+    {"index": 1, "options": ["August 2025", "July 2025"]},
+]
+
+
+def test_find_option_returns_the_label_to_click():
+    assert find_option(DROPDOWNS, " transaction ") == (0, "Transaction")
+    assert find_option(DROPDOWNS, "July 2025", contains=True) == (1, "July 2025")
+    assert find_option(DROPDOWNS, "July") is None
+    assert find_option([], "Transaction") is None
+
+
+def test_find_by_normalized_label():
+    found = [{"index": 0, "label": "Belgium"}, {"index": 1, "label": "Germany (current)"}]
+    assert find(found, "belgium")["index"] == 0
+    assert find(found, "Germany", key=lambda label: label.split(" (")[0].lower())["index"] == 1
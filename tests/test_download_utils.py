@@ -0,0 +1,105 @@
+import asyncio
+
+import httpx
+import pytest
+
+from download_utils import (
+    IncompleteDownloadError, is_auxiliary_file, part_path, read_sidecar, stream_download, verify_file,
+)
+
+BODY = bytes(range(256)) * 40
+
+
+def serve(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def download(handler, target, **kwargs):
+    async def go():
+        async with serve(handler) as client:
+            return await stream_download(client, "http://files.test/report", target, **kwargs)
+    return asyncio.run(go())
+
+
+def ranged(request, body=BODY):
+    """Answer like a server that honours Range"""
+    wanted = request.headers.get("range")
+    if not wanted:
+        return httpx.Response(200, content=body)
+    start = int(wanted.removeprefix("bytes=").rstrip("-"))
+    if start >= len(body):
+        return httpx.Response(416)
+    return httpx.Response(206, content=body[start:], headers={
+        "content-range": f"bytes {start}-{len(body) - 1}/{len(body)}",
+    })
+
+
+def test_download_writes_file_and_sidecar(tmp_path):
+    target = tmp_path / "report.csv"
+    meta = download(ranged, target)
+    assert target.read_bytes() == BODY
+    assert not part_path(target).exists()
+    assert read_sidecar(target) == meta and meta["size"] == len(BODY)
+    assert verify_file(target)
+
+
+def test_resume_continues_the_part_file(tmp_path):
+    target = tmp_path / "report.csv"
+    part_path(target).write_bytes(BODY[:1000])
+    ranges = []
+
+    def handler(request):
+        ranges.append(request.headers.get("range"))
+        return ranged(request)
+
+    meta = download(handler, target, resume=True)
+    assert ranges == ["bytes=1000-"]
+    assert target.read_bytes() == BODY
+    assert meta["size"] == len(BODY)
+    # The hash covers the bytes that were already on disk too
+    assert meta["sha256"] == download(ranged, tmp_path / "fresh.csv")["sha256"]
+
+
+def test_server_ignoring_range_sends_the_whole_body(tmp_path):
+    target = tmp_path / "report.csv"
+    part_path(target).write_bytes(b"stale bytes")
+    download(lambda request: httpx.Response(200, content=BODY), target, resume=True)
+    assert target.read_bytes() == BODY
+
+
+def test_416_restarts_without_range(tmp_path):
+    target = tmp_path / "report.csv"
+    part_path(target).write_bytes(BODY + b"extra")
+    download(ranged, target, resume=True)
+    assert target.read_bytes() == BODY
+
+
+def test_206_for_another_range_restarts_without_range(tmp_path):
+    target = tmp_path / "report.csv"
+    part_path(target).write_bytes(BODY[:1000])
+    ranges = []
+
+    def handler(request):
+        ranges.append(request.headers.get("range"))
+        if request.headers.get("range"):
+            # Partial body starting somewhere else than the part file ends
+            return httpx.Response(206, content=BODY[:500], headers={"content-range": f"bytes 0-499/{len(BODY)}"})
+        return httpx.Response(200, content=BODY)
+
+    download(handler, target, resume=True)
+    assert ranges == ["bytes=1000-", None]
+    assert target.read_bytes() == BODY
+
+
+def test_unrequested_206_is_an_error(tmp_path):
+    target = tmp_path / "report.csv"
+    handler = lambda request: httpx.Response(206, content=BODY[:10], headers={"content-range": "bytes 0-9/100"})
+    with pytest.raises(IncompleteDownloadError):
+        download(handler, target)
+    assert not target.exists()
+
+
+def test_auxiliary_files():
+    assert is_auxiliary_file("a.csv.part")
+    assert is_auxiliary_file("a.csv.meta.json")
+    assert not is_auxiliary_file("a.csv")
@@ -0,0 +1,113 @@
+import datetime
+import os
+import socket
+import ssl
+from email import message_from_bytes, policy
+
+import pytest
+
+import main
+from main import encoded_size, pack
+
+
+def test_encoded_size_covers_base64_and_line_breaks():
+    assert encoded_size(0) == 0
+    assert encoded_size(57) == 78
+    assert encoded_size(3 * 1024 * 1024) > 4 * 1024 * 1024
+
+
+def test_pack_first_fit_decreasing():
+    sizes = {"a": 7, "b": 5, "c": 4, "d": 3, "e": 1}
+    groups = pack(list(sizes), 10, sizes.get)
+    assert groups == [["a", "d"], ["b", "c", "e"]]
+    assert all(sum(sizes[item] for item in group) <= 10 for group in groups)
+
+
+def test_pack_sends_an_oversized_item_alone():
+    sizes = {"huge": 50, "small": 2}
+    assert pack(list(sizes), 10, sizes.get) == [["huge"], ["small"]]
+    assert pack([], 10, len) == []
+
+
+@pytest.fixture
+def smtp_server(tmp_path):
+    """aiosmtpd server with STARTTLS and AUTH, recording every session and message"""
+    controller_module = pytest.importorskip("aiosmtpd.controller")
+    from aiosmtpd.smtp import AuthResult
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(x509.oid.NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(1).not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    (tmp_path / "cert.pem").write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    (tmp_path / "key.pem").write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    ))
+    tls = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    tls.load_cert_chain(tmp_path / "cert.pem", tmp_path / "key.pem")
+
+    class Handler:
+        def __init__(self):
+            self.messages = []
+            self.sessions = set()
+
+        async def handle_DATA(self, server, session, envelope):
+            self.sessions.add(id(session))
+            self.messages.append(message_from_bytes(envelope.original_content, policy=policy.default))
+            return "250 OK"
+
+    def authenticate(server, session, envelope, mechanism, auth_data):
+        return AuthResult(success=auth_data.login == b"user" and auth_data.password == b"secret")
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    handler = Handler()
+    controller = controller_module.Controller(
+        handler, hostname="127.0.0.1", port=port, tls_context=tls, require_starttls=True,
+        authenticator=authenticate, auth_require_tls=True,
+    )
+    controller.start()
+    try:
+        yield controller, handler
+    finally:
+        controller.stop()
+
+
+def test_reports_are_split_into_messages_under_the_cap_over_one_session(smtp_server, tmp_path, monkeypatch):
+    controller, handler = smtp_server
+    monkeypatch.setattr(main, "SMTP_SERVER", controller.hostname)
+    monkeypatch.setattr(main, "SMTP_PORT", controller.port)
+    monkeypatch.setattr(main, "SMTP_USER", "user")
+    monkeypatch.setattr(main, "SMTP_PASSWORD", "secret")
+    monkeypatch.setattr(main, "MAIL_TO", "finance@example.com")
+    monkeypatch.setattr(main, "MAIL_MAX_BYTES", 700 * 1024)
+    # The test server's certificate is self-signed
+    unverified = ssl.create_default_context()
+    unverified.check_hostname = False
+    unverified.verify_mode = ssl.CERT_NONE
+    monkeypatch.setattr(main.ssl, "create_default_context", lambda: unverified)
+
+    reports = []
+    for n in range(5):
+        path = tmp_path / f"spec {n}.xlsx"
+        path.write_bytes(os.urandom(200 * 1024))  # incompressible, attached as is
+        reports.append(path)
+    main.send_email_with_attachments({"bol": reports}, periods=["2025-07"])
+
+    assert len(handler.messages) == 3
+    assert len(handler.sessions) == 1
+    names = sorted(
+        part.get_filename() for message in handler.messages for part in message.iter_attachments()
+    )
+    assert names == sorted(path.name for path in reports)
+    for n, message in enumerate(handler.messages, 1):
+        assert message["Subject"] == f"Monthly Reports - July 2025 ({n}/3)"
+        assert len(message.as_bytes()) <= main.MAIL_MAX_BYTES
@@ -0,0 +1,78 @@
+import asyncio
+import sys
+
+import pytest
+
+import main
+import sources
+from conftest import ROOT
+from manifest import last_month_period
+
+
+def periods(*argv):
+    return main.requested_periods(main.parse_args(list(argv)))
+
+
+def test_requested_periods():
+    assert periods() is None
+    assert periods("--from", "2025-01", "--to", "2025-03") == ["2025-01", "2025-02", "2025-03"]
+    assert periods("--to", "2025-05") == ["2025-05"]
+    assert periods("--from", last_month_period()) == [last_month_period()]
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Calls to send_email_with_attachments, captured instead of sent"""
+    calls = []
+    monkeypatch.setattr(main, "send_email_with_attachments", lambda files, *args, **kwargs: calls.append(dict(kwargs, files=files)))
+    return calls
+
+
+@pytest.fixture
+def fake_bol(monkeypatch):
+    sys.path.insert(0, str(ROOT / "benchmarks"))
+    from fake_bol import FakeBol
+
+    server = FakeBol(invoices=2, spec_size=1000, latency=0.0, rejected_clients={"client02"})
+    server.start()
+    for key, value in server.env(2).items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setattr(sources, "ENABLED_SOURCES", ["bol"])
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+def test_a_failed_bol_account_sends_the_failure_email(fake_bol, sent):
+    asyncio.run(main.main(["2025-07"]))
+    bol, = sent
+    assert bol["failure_mode"]
+    assert "bol: INCOMPLETE" in bol["summary"] and "1 failed units" in bol["summary"]
+    # The other account's invoices are still attached
+    assert len(bol["files"]["bol"]) == 2
+
+
+def test_all_units_ok_sends_the_normal_email(fake_bol, sent):
+    fake_bol.rejected_clients.clear()
+    asyncio.run(main.main(["2025-07"]))
+    assert not sent[0]["failure_mode"]
+    assert len(sent[0]["files"]["bol"]) == 4
+
+
+def test_a_source_that_fails_to_load_does_not_stop_the_others(fake_bol, sent, monkeypatch):
+    fake_bol.rejected_clients.clear()
+    monkeypatch.setattr(sources, "ENABLED_SOURCES", ["amazon", "bol"])
+    monkeypatch.setenv("AMAZON_BLOCK_URLS", "(")
+    asyncio.run(main.main(["2025-07"]))
+    mail, = sent
+    assert mail["failure_mode"]
+    assert "amazon: FAILED (error: " in mail["summary"] and "bol: ok" in mail["summary"]
+    assert len(mail["files"]["bol"]) == 4
+
+
+def test_result_is_not_ok_with_failed_units_or_items():
+    assert main.SourceResult("bol").ok
+    assert not main.SourceResult("bol", failed_units=1).ok
+    assert not main.SourceResult("amazon", failed_items=1).ok
+    assert not main.SourceResult("amazon", error="RuntimeError: login failed").ok
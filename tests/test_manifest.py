@@ -0,0 +1,64 @@
+import pytest
+
+from manifest import DOWNLOADED, FAILED, Manifest, month_periods, period_bounds
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    with Manifest(tmp_path / "manifest.sqlite") as manifest:
+        yield manifest
+
+
+def test_record_makes_an_item_complete(manifest, tmp_path):
+    report = tmp_path / "report.csv"
+    report.write_text("a,b\n1,2\n")
+    assert not manifest.is_complete("bol", "shop", "2025-07", "1")
+    manifest.record("bol", "shop", "2025-07", "1", report)
+    assert manifest.is_complete("bol", "shop", "2025-07", "1")
+    row = manifest.get("bol", "shop", "2025-07", "1")
+    assert row["status"] == DOWNLOADED and row["size"] == report.stat().st_size and len(row["sha256"]) == 64
+
+
+def test_changed_fingerprint_or_missing_file_is_not_complete(manifest, tmp_path):
+    report = tmp_path / "report.csv"
+    report.write_text("data")
+    manifest.record("bol", "shop", "2025-07", "1", report, fingerprint="v1")
+    assert manifest.is_complete("bol", "shop", "2025-07", "1", fingerprint="v1")
+    assert not manifest.is_complete("bol", "shop", "2025-07", "1", fingerprint="v2")
+    report.write_text("truncated" * 3)
+    assert not manifest.is_complete("bol", "shop", "2025-07", "1")
+    report.unlink()
+    assert not manifest.is_complete("bol", "shop", "2025-07", "1")
+
+
+def test_failed_items_are_listed_separately(manifest, tmp_path):
+    report = tmp_path / "report.csv"
+    report.write_text("data")
+    manifest.record("amazon", "Belgium", "2025-07", "monthly", report)
+    manifest.mark_failed("amazon", "France", "2025-07", "monthly", "timeout")
+    assert [row["account"] for row in manifest.entries(period="2025-07")] == ["Belgium"]
+    failed = manifest.entries(period="2025-07", status=FAILED)
+    assert [(row["account"], row["error"]) for row in failed] == [("France", "timeout")]
+    assert manifest.files(period="2025-07", source="amazon") == [report]
+    assert manifest.files(period="2025-06") == []
+
+
+def test_record_after_failure_clears_the_error(manifest, tmp_path):
+    report = tmp_path / "report.csv"
+    report.write_text("data")
+    manifest.mark_failed("amazon", "France", "2025-07", "monthly", "timeout")
+    manifest.record("amazon", "France", "2025-07", "monthly", report)
+    row = manifest.get("amazon", "France", "2025-07", "monthly")
+    assert row["status"] == DOWNLOADED and row["error"] is None
+
+
+def test_month_periods():
+    assert month_periods("2024-11", "2025-02") == ["2024-11", "2024-12", "2025-01", "2025-02"]
+    assert month_periods("2025-07-15", "2025-07-31") == ["2025-07"]
+    with pytest.raises(ValueError):
+        month_periods("2025-08", "2025-07")
+
+
+def test_period_bounds():
+    assert period_bounds("2024-02") == ("2024-02-01", "2024-02-29")
+    assert period_bounds("2025-12") == ("2025-12-01", "2025-12-31")
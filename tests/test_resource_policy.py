@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+from resource_policy import DEFAULT_CATEGORIES, ResourcePolicy
+
+SELLER_CENTRAL = "https://sellercentral.amazon.com.be"
+
+
+def request(url, resource_type, navigation=False):
+    return SimpleNamespace(url=url, resource_type=resource_type, is_navigation_request=lambda: navigation)
+
+
+@pytest.fixture
+def policy():
+    return ResourcePolicy(DEFAULT_CATEGORIES.split(","))
+
+
+@pytest.mark.parametrize("url", [
+    "https://m.media-amazon.com/images/I/41abc._SL75_.JPG?v=1",
+    SELLER_CENTRAL + "/fonts/ember.woff2",
+    "https://fls-eu.amazon.be/1/batch/1/OE/",
+    SELLER_CENTRAL + "/rd/uedata?ld",
+])
+def test_blockable_urls_are_routed(policy, url):
+    assert policy.url_pattern.search(url)
+
+
+@pytest.mark.parametrize("url", [
+    SELLER_CENTRAL + "/payments/reports-repository",
+    SELLER_CENTRAL + "/payments/api/report-request",
+    SELLER_CENTRAL + "/static/katal.js",
+    SELLER_CENTRAL + "/pngviewer",
+])
+def test_page_and_xhr_urls_are_not_routed(policy, url):
+    assert not policy.url_pattern.search(url)
+
+
+def test_routed_requests_are_classified(policy):
+    assert policy.classify(request("https://m.media-amazon.com/images/I/1.jpg", "image")) == "images"
+    assert policy.classify(request("https://fls-eu.amazon.be/1/batch/1/OE/", "xhr")) == "analytics"
+    # An image URL fetched by script or navigated to is let through
+    assert policy.classify(request(SELLER_CENTRAL + "/logo.png", "fetch")) is None
+    assert policy.classify(request(SELLER_CENTRAL + "/logo.png", "image", navigation=True)) is None
+
+
+def test_third_party_urls():
+    policy = ResourcePolicy(["third_party"])
+    assert policy.url_pattern.search("https://www.google-analytics.com/collect")
+    assert policy.url_pattern.search("https://cdn.example.com/amazon.com/x.js")
+    assert not policy.url_pattern.search(SELLER_CENTRAL + "/home")
+    assert not policy.url_pattern.search("https://m.media-amazon.com:443/images/I/1.jpg")
+
+
+def test_nothing_to_block_routes_nothing():
+    assert not ResourcePolicy([]).enabled
+    assert ResourcePolicy([], [r"/tracking/"]).url_pattern.search(SELLER_CENTRAL + "/tracking/1")
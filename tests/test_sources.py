@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+import sources
+from sources import BROWSER, Scheduler, Source, WorkUnit, numbered_accounts
+
+
+def test_numbered_accounts(monkeypatch):
+    for key in ["BOL_CLIENT_ID_3", "BOL_CLIENT_ID_1", "BOL_CLIENT_ID_10", "BOL_CLIENT_ID_X", "BOL_CLIENT_ID_2_OLD"]:
+        monkeypatch.setenv(key, "id")
+    assert numbered_accounts("BOL_CLIENT_ID") == [1, 3, 10]
+    assert numbered_accounts("AMAZON_ACCOUNT") == []
+
+
+def test_available_and_configured_sources(monkeypatch):
+    assert {"bol", "amazon"} <= set(sources.available_sources())
+    monkeypatch.setattr(sources, "ENABLED_SOURCES", ["bol"])
+    assert list(sources.configured_sources()) == ["bol"]
+    monkeypatch.setattr(sources, "ENABLED_SOURCES", ["bol", "etsy"])
+    with pytest.raises(ValueError, match="etsy"):
+        sources.configured_sources()
+
+
+def test_a_source_must_implement_list_work_and_fetch():
+    class ListsOnly(Source):
+        name = "lists-only"
+
+        async def list_work(self, periods):
+            return []
+
+    with pytest.raises(TypeError, match="fetch"):
+        ListsOnly()
+
+
+class FakeSource(Source):
+    name = "fake"
+
+    def __init__(self, units, fail=(), kind=sources.HTTP):
+        self.kind = kind
+        self.units = units
+        self.fail = set(fail)
+        self.fetched = []
+        self.closed = False
+        self.active = self.peak = 0
+
+    async def list_work(self, periods):
+        return [WorkUnit(account, period) for account in self.units for period in periods]
+
+    async def fetch(self, unit):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if unit.account in self.fail:
+            raise RuntimeError(f"{unit} broke")
+        self.fetched.append(unit)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_scheduler_counts_failed_units():
+    source = FakeSource(["a", "b", "c"], fail=["b"])
+    stats, = asyncio.run(Scheduler(8, 1).run([source], ["2025-07", "2025-08"]))
+    assert stats.units == 6 and stats.failed_units == 2 and stats.error is None
+    assert len(source.fetched) == 4 and source.closed
+
+
+def test_browser_units_share_the_context_budget():
+    source = FakeSource([str(n) for n in range(6)], kind=BROWSER)
+    asyncio.run(Scheduler(8, 2).run([source], ["2025-07"]))
+    assert source.peak == 2
+
+
+def test_failed_open_still_closes():
+    class Broken(FakeSource):
+        async def open(self, scheduler):
+            raise RuntimeError("login failed")
+
+    source = Broken(["a"])
+    stats, = asyncio.run(Scheduler(8, 1).run([source], ["2025-07"]))
+    assert stats.error == "RuntimeError: login failed" and source.closed
+
+
+def test_run_standalone_raises_when_the_source_fails():
+    class Broken(FakeSource):
+        async def list_work(self, periods):
+            raise RuntimeError("listing failed")
+
+    with pytest.raises(RuntimeError, match="listing failed"):
+        asyncio.run(sources.run_standalone(Broken(["a"]), ["2025-07"]))